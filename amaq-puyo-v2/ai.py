@@ -0,0 +1,318 @@
+"""CPU player and hint engine: beam search over placements.
+
+Every (column, rotation) of the current pair is dropped onto the board
+and its chain resolved with the engine's scoring, then the same for the
+next pair on each of the best beam_width boards, and so on to the search
+depth. Boards are tuples of bitboard colour masks (see bitboard.py).
+
+Each board has a Zobrist key, the XOR of one random number per (cell,
+colour). Dropping a pair updates it with two XORs; only a chain needs the
+key computed again. The key of a board XOR the key of a move indexes a
+fixed-size transposition table of results, so a board reached twice (the
+same colour pair turned around, or the positions searched again on the
+next frame) is not simulated again.
+
+    search = BeamSearch(depth=2, beam_width=8)
+    column, rotation = search.best_move(game)
+"""
+import gc
+import heapq
+import random
+import time
+
+import bitboard
+import engine
+
+WIDTH = engine.GRID_WIDTH
+HEIGHT = engine.GRID_HEIGHT
+COLUMN_MASK = (1 << HEIGHT) - 1
+FULL_MASK, _, NOT_TOP_MASK, _ = bitboard._masks(WIDTH, HEIGHT)
+TOP_ROW_MASK = sum(1 << (x * HEIGHT + HEIGHT - 1) for x in range(WIDTH))
+
+ACTIONS = engine.ACTIONS
+
+# Evaluation weights
+CONNECTION_WEIGHT = 20  # Per pair of touching puyos of the same colour
+HEIGHT_WEIGHT = 1       # Per squared column height
+DANGER_HEIGHT = HEIGHT - 3  # The spawn column above this is close to game over
+DANGER_PENALTY = 10000
+
+MAX_ENTRIES = 1 << 16
+ENTRY_SIZE = 9  # Ints per transposition table entry
+# Seconds per search. Time is checked before every child board, so a search
+# ends within one simulate() and evaluate() of it, well under a millisecond;
+# the rest of a 16 ms frame is margin for the OS taking the CPU away
+TIME_BUDGET = 0.008
+
+# Zobrist keys, fixed so they are the same in every process
+_rng = random.Random(0x5059)
+ZOBRIST = [[_rng.getrandbits(64) for _ in range(WIDTH * HEIGHT)] for _ in range(engine.NUM_SERVICES)]
+MOVE_KEYS = {(main, sub, column, rotation): _rng.getrandbits(64)
+             for main in range(engine.NUM_SERVICES) for sub in range(engine.NUM_SERVICES)
+             for column, rotation in ACTIONS}
+
+
+def zobrist(colors):
+    key = 0
+    for service_type, mask in enumerate(colors):
+        keys = ZOBRIST[service_type]
+        while mask:
+            low = mask & -mask
+            key ^= keys[low.bit_length() - 1]
+            mask ^= low
+    return key
+
+
+def simulate(colors, key, main, sub, column, rotation):
+    """Drop a pair and resolve its chain.
+
+    Returns (colors, key, score gained, chain length, game over), like
+    engine.place() on the same board.
+    """
+    dx, dy = engine.ROTATION_OFFSETS[rotation]
+    sub_x = column + dx
+    occupied = colors[0] | colors[1] | colors[2] | colors[3] | colors[4]
+    height = (occupied >> (column * HEIGHT) & COLUMN_MASK).bit_length()
+    if dx == 0:
+        # Vertical pair: both in one column, the lower one on the stack
+        lower, upper = (sub, main) if dy > 0 else (main, sub)
+        drops = ((lower, column, height), (upper, column, height + 1))
+    else:
+        # Horizontal pair: each puyo falls onto its own column
+        sub_height = (occupied >> (sub_x * HEIGHT) & COLUMN_MASK).bit_length()
+        drops = ((main, column, height), (sub, sub_x, sub_height))
+
+    colors = list(colors)
+    for service_type, x, row in drops:
+        # Parts above the board are lost
+        if row < HEIGHT:
+            index = x * HEIGHT + row
+            colors[service_type] |= 1 << index
+            occupied |= 1 << index
+            key ^= ZOBRIST[service_type][index]
+    if occupied & TOP_ROW_MASK:
+        return tuple(colors), key, 0, 0, True
+
+    # Only the colours just dropped can make the first group
+    gained, chain = resolve_chain(colors, [main] if main == sub else [main, sub])
+    if chain:
+        key = zobrist(colors)
+    return tuple(colors), key, gained, chain, False
+
+
+def resolve_chain(colors, candidates=None):
+    """Clear groups and compact a list of colour masks in place until nothing is left to clear.
+
+    Only the service types in candidates are searched for the first
+    group. Returns (score gained, chain length), scored like the engine.
+    """
+    board = bitboard.from_colors(colors, WIDTH, HEIGHT)
+    masks = None if candidates is None else [colors[service_type] for service_type in candidates]
+    gained = 0
+    chain = 0
+    while True:
+        groups = bitboard.find_group_masks(board, masks)
+        if not groups:
+            return gained, chain
+        chain += 1
+        gained += sum(engine.group_score(group.bit_count(), chain) for group in groups)
+        bitboard.clear_group_masks(board, groups)
+        bitboard.compact(board)
+        masks = None
+
+
+def evaluate(colors):
+    """How promising a board is: connected colours, minus stack height."""
+    value = 0
+    for mask in colors:
+        # Touching pairs along columns and along rows
+        value += CONNECTION_WEIGHT * ((mask & (mask >> 1) & NOT_TOP_MASK).bit_count()
+                                      + (mask & (mask >> HEIGHT)).bit_count())
+    occupied = colors[0] | colors[1] | colors[2] | colors[3] | colors[4]
+    for x in range(WIDTH):
+        height = (occupied >> (x * HEIGHT) & COLUMN_MASK).bit_length()
+        value -= HEIGHT_WEIGHT * height * height
+    if (occupied >> (WIDTH // 2 * HEIGHT) & COLUMN_MASK).bit_length() > DANGER_HEIGHT:
+        value -= DANGER_PENALTY
+    return value
+
+
+class TranspositionTable:
+    """simulate() results in max_entries slots picked by board and move key.
+
+    A new result takes the slot of whatever was there. The slots are
+    lists of ints allocated up front, so storing never grows or rehashes
+    anything (a dict of this size stalls for milliseconds on every
+    rehash) and leaves no new object for the garbage collector to track.
+    max_entries is rounded up to a power of two.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = 1 << (max_entries - 1).bit_length()
+        self.mask = self.max_entries - 1
+        self.keys = [None] * self.max_entries
+        # colors, key, score gained, chain length, game over per slot
+        self.values = [0] * (self.max_entries * ENTRY_SIZE)
+        # Only ints go in, but a full collection would still walk every
+        # slot; frozen, the lists are left out of collections
+        gc.freeze()
+        self.hits = 0
+        self.misses = 0
+
+    def simulate(self, colors, key, main, sub, column, rotation):
+        move_key = key ^ MOVE_KEYS[main, sub, column, rotation]
+        index = move_key & self.mask
+        if self.keys[index] == move_key:
+            self.hits += 1
+            values = self.values
+            base = index * ENTRY_SIZE
+            return tuple(values[base:base + 5]), values[base + 5], values[base + 6], values[base + 7], values[base + 8]
+
+        self.misses += 1
+        result = simulate(colors, key, main, sub, column, rotation)
+        self.keys[index] = move_key
+        # Copied into the flat list: a stored tuple would come from CPython's
+        # free lists, which join the youngest GC generation without counting
+        # towards its threshold, and enough of those make the collection
+        # that finally comes take tens of milliseconds
+        self.values[index * ENTRY_SIZE:(index + 1) * ENTRY_SIZE] = result[0] + result[1:]
+        return result
+
+    def clear(self):
+        # In place, so the lists stay frozen
+        self.keys[:] = [None] * self.max_entries
+
+
+class BeamSearch:
+    """Beam search with a depth, a beam width and a time budget in seconds.
+
+    Time is checked before every child board. When it runs out the move
+    comes from the deepest level that was searched completely, or the
+    best move tried so far if the first level was not; cut_short tells
+    which searches ended that way. The table is kept between searches.
+    """
+
+    def __init__(self, depth=2, beam_width=8, time_budget=TIME_BUDGET, max_entries=MAX_ENTRIES):
+        self.depth = depth
+        self.beam_width = beam_width
+        self.time_budget = time_budget
+        self.table = TranspositionTable(max_entries)
+        # Statistics of the last search
+        self.nodes = 0
+        self.depth_reached = 0
+        self.cut_short = False
+        self.elapsed = 0.0
+
+    def best_move(self, state):
+        """(column, rotation) for the current piece of an engine.GameState.
+
+        Searching deeper than the current and next pairs looks further
+        down the seeded queue.
+        """
+        pairs = [(piece.main_type, piece.sub_type)
+                 for piece in (state.current_piece, state.next_piece) if piece is not None]
+        if len(pairs) < self.depth:
+            index = state.queue.index
+            pairs += [state.queue.pair(index + i) for i in range(self.depth - len(pairs))]
+        colors = tuple(bitboard.from_board(state.board).colors)
+        return self.search(colors, pairs[:self.depth])
+
+    def search(self, colors, pairs):
+        """Best (column, rotation) for pairs[0] on a board of colour masks."""
+        start = time.perf_counter()
+        best = self.best_node(colors, pairs, start + self.time_budget)
+        self.elapsed = time.perf_counter() - start
+        if best is None:
+            # Every move loses
+            return ACTIONS[0]
+        return best[4]
+
+    def best_node(self, colors, pairs, deadline, stop=None):
+        """The best (rank, score, colors, key, first action) of the deepest level searched.
+
+        deadline is a time.perf_counter() value; stop, if given, is called
+        as often and ends the search early when it returns True. Returns
+        None if every move loses, with cut_short False.
+        """
+        self.nodes = 0
+        self.depth_reached = 0
+        self.cut_short = False
+        # A node is (rank, score so far, colors, key, first action)
+        beam = [(0, 0, colors, zobrist(colors), None)]
+        best = None
+        for depth, (main, sub) in enumerate(pairs):
+            children = {}
+            for _, score, node_colors, key, first in beam:
+                for action in ACTIONS:
+                    # Checked before every child once there is a move to fall back on
+                    if (best is not None or children) and (
+                            time.perf_counter() > deadline or (stop is not None and stop())):
+                        self.cut_short = True
+                        break
+                    child_colors, child_key, gained, _, over = self.table.simulate(
+                        node_colors, key, main, sub, *action)
+                    self.nodes += 1
+                    if over:
+                        continue
+                    child_score = score + gained
+                    # The same board reached twice keeps its best path
+                    known = children.get(child_key)
+                    if known is None or child_score > known[1]:
+                        rank = child_score + evaluate(child_colors)
+                        children[child_key] = (rank, child_score, child_colors, child_key,
+                                               first if first is not None else action)
+                if self.cut_short:
+                    break
+            if self.cut_short:
+                if best is None:
+                    # Not even the first level finished: the best move tried
+                    best = max(children.values(), key=lambda node: node[0])
+                break
+            if not children:
+                break
+            beam = heapq.nlargest(self.beam_width, children.values(), key=lambda node: node[0])
+            best = beam[0]
+            self.depth_reached = depth + 1
+        return best
+
+
+class Autopilot:
+    """Steers pieces with tick inputs to the (column, rotation) that choose(state) returns.
+
+    It rotates and moves, then holds down once the piece is in place.
+    input_interval is the number of ticks between presses, 1 for as fast
+    as the engine takes them; fast_drop=False leaves the fall to gravity.
+    """
+
+    def __init__(self, choose, input_interval=1, fast_drop=True):
+        self.choose = choose
+        self.input_interval = input_interval
+        self.fast_drop = fast_drop
+        self.piece = None   # The piece target was chosen for
+        self.target = None  # (column, rotation) the piece is steered to
+        self.wait = 0       # Ticks until the next press
+
+    def inputs(self, state):
+        """The INPUT_* mask for the next engine.tick() of state."""
+        piece = state.current_piece
+        if piece is None:
+            return 0
+        if piece is not self.piece:
+            self.piece = piece
+            self.target = self.choose(state)
+            self.wait = 0
+        column, rotation = self.target
+        inputs = 0
+        if piece.rotation != rotation:
+            inputs |= engine.INPUT_ROTATE
+        if piece.x < column:
+            inputs |= engine.INPUT_RIGHT
+        elif piece.x > column:
+            inputs |= engine.INPUT_LEFT
+        if not inputs:
+            return engine.INPUT_DOWN if self.fast_drop else 0
+        if self.wait > 0:
+            self.wait -= 1
+            return 0
+        self.wait = self.input_interval - 1
+        return inputs
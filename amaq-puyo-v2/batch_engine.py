@@ -0,0 +1,227 @@
+"""Many games advanced in lockstep with NumPy.
+
+The boards of N games are one (N, height, width) int8 array, EMPTY where
+there is no puyo. place() drops one pair on every board at once and
+resolves the chains across the batch: gravity is a stable sort of each
+column, groups of 4 or more are found from the same-colour neighbour
+counts of every cell (see find_clears()), and scoring uses the engine's
+formula.
+The results match engine.place() game for game (see bench_batch.py).
+
+    batch = BatchState(seeds=range(1000))
+    while not batch.game_over.all():
+        columns, rotations = ...  # one action per game
+        place(batch, columns, rotations)
+"""
+import numpy as np
+
+import engine
+
+EMPTY = -1
+
+ROTATION_DX = np.array([dx for dx, dy in engine.ROTATION_OFFSETS], dtype=np.int64)
+
+
+def queue_pairs(seeds, indices):
+    """engine.PieceQueue(seed).pair(index) for arrays of seeds and indices."""
+    seeds = np.asarray(seeds, dtype=np.uint64)
+    indices = np.asarray(indices, dtype=np.uint64)
+    # splitmix64; uint64 arithmetic wraps like the & MASK64 in the engine
+    with np.errstate(over='ignore'):
+        z = seeds * np.uint64(0x9E3779B97F4A7C15) + (indices + np.uint64(1)) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z ^= z >> np.uint64(31)
+    main = (z >> np.uint64(32)) % np.uint64(engine.NUM_SERVICES)
+    sub = (z & np.uint64(0xFFFFFFFF)) % np.uint64(engine.NUM_SERVICES)
+    return main.astype(np.int8), sub.astype(np.int8)
+
+
+class BatchState:
+    """The state of N games that matters between placements."""
+
+    def __init__(self, seeds, width=engine.GRID_WIDTH, height=engine.GRID_HEIGHT):
+        self.seeds = np.array(seeds, dtype=np.uint64)
+        count = len(self.seeds)
+        self.width = width
+        self.height = height
+        self.boards = np.full((count, height, width), EMPTY, dtype=np.int8)
+        self.pieces = np.zeros(count, dtype=np.int64)  # Pairs placed so far
+        self.game_over = np.zeros(count, dtype=bool)
+        self.score = np.zeros(count, dtype=np.int64)
+        self.level = np.ones(count, dtype=np.int64)
+        self.max_chain = np.zeros(count, dtype=np.int64)
+        self.total_cleared = np.zeros(count, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.seeds)
+
+    def current_pairs(self):
+        """(main_type, sub_type) arrays of the piece each game places next."""
+        return queue_pairs(self.seeds, self.pieces)
+
+
+def column_heights(boards):
+    return (boards != EMPTY).sum(axis=1)
+
+
+def valid_actions(boards):
+    """(N, width, 4) mask of the (column, rotation) actions that keep the pair on the board."""
+    width = boards.shape[2]
+    sub_x = np.arange(width)[:, None] + ROTATION_DX[None, :]
+    valid = (sub_x >= 0) & (sub_x < width)
+    return np.broadcast_to(valid, (len(boards), width, 4))
+
+
+def apply_gravity(boards):
+    """Compact every column downwards, keeping the order of the puyos (engine.apply_gravity)."""
+    # A stable sort puts the empty cells of each column first and keeps the rest in order
+    order = np.argsort(boards != EMPTY, axis=1, kind='stable')
+    return np.take_along_axis(boards, order, axis=1)
+
+
+def same_color_edges(boards):
+    """Whether each cell has the same colour as its neighbour to the right / below."""
+    occupied = boards != EMPTY
+    right = (boards[:, :, :-1] == boards[:, :, 1:]) & occupied[:, :, :-1]
+    down = (boards[:, :-1, :] == boards[:, 1:, :]) & occupied[:, :-1, :]
+    return right, down
+
+
+def find_clears(boards):
+    """(N, height, width) mask of puyos in groups of engine.MIN_GROUP_SIZE (4) or more.
+
+    A group of 4 or more always has a puyo with 3 same-colour neighbours
+    or two neighbouring puyos with 2 each (groups of 3 or fewer never do,
+    and the grid has no triangles). Those puyos are found with a few array
+    operations over the whole batch; only the boards that have one are
+    flood filled from them to find the rest of their groups.
+    """
+    assert engine.MIN_GROUP_SIZE == 4
+    right, down = same_color_edges(boards)
+    degree = np.zeros(boards.shape, dtype=np.int8)
+    degree[:, :, :-1] += right
+    degree[:, :, 1:] += right
+    degree[:, :-1, :] += down
+    degree[:, 1:, :] += down
+
+    two = degree >= 2
+    anchors = degree >= 3
+    pairs = right & two[:, :, :-1] & two[:, :, 1:]
+    anchors[:, :, :-1] |= pairs
+    anchors[:, :, 1:] |= pairs
+    pairs = down & two[:, :-1, :] & two[:, 1:, :]
+    anchors[:, :-1, :] |= pairs
+    anchors[:, 1:, :] |= pairs
+
+    clears = np.zeros(boards.shape, dtype=bool)
+    chaining = np.flatnonzero(anchors.any(axis=(1, 2)))
+    if chaining.size:
+        clears[chaining] = _flood(anchors[chaining], right[chaining], down[chaining])
+    return clears
+
+
+def _flood(marked, right, down):
+    # Grow the marked cells along same-colour edges until nothing changes
+    while True:
+        grown = marked.copy()
+        grown[:, :, :-1] |= marked[:, :, 1:] & right
+        grown[:, :, 1:] |= marked[:, :, :-1] & right
+        grown[:, :-1, :] |= marked[:, 1:, :] & down
+        grown[:, 1:, :] |= marked[:, :-1, :] & down
+        if np.array_equal(grown, marked):
+            return marked
+        marked = grown
+
+
+def drop_pairs(boards, columns, rotations, main_types, sub_types):
+    """Write each pair where it lands (engine.landing_positions), dropping parts above the board."""
+    count, height, width = boards.shape
+    games = np.arange(count)
+    heights = column_heights(boards)
+    sub_columns = columns + ROTATION_DX[rotations]
+    if ((columns < 0) | (columns >= width) | (sub_columns < 0) | (sub_columns >= width)).any():
+        raise ValueError("Piece would be outside the board")
+
+    # Vertical pairs rest on their column, horizontal ones on the higher of the two
+    stack_height = np.maximum(heights[games, columns], heights[games, sub_columns])
+    main_y = height - 1 - stack_height
+    sub_y = main_y.copy()
+    main_y[rotations == 0] -= 1
+    sub_y[rotations == 2] -= 1
+
+    for xs, ys, types in ((columns, main_y, main_types), (sub_columns, sub_y, sub_types)):
+        inside = ys >= 0
+        boards[games[inside], ys[inside], xs[inside]] = types[inside]
+
+
+def place(batch, columns, rotations):
+    """Place the current pair of every game that is not over and resolve its chain.
+
+    columns and rotations are arrays with one action per game (ignored for
+    finished games). Updates the batch in place, like engine.place() for
+    each game, and returns the chain length of each game's placement.
+    """
+    columns = np.asarray(columns, dtype=np.int64)
+    rotations = np.asarray(rotations, dtype=np.int64)
+    active = np.flatnonzero(~batch.game_over)
+    chains = np.zeros(len(batch), dtype=np.int64)
+    if active.size == 0:
+        return chains
+
+    main_types, sub_types = queue_pairs(batch.seeds[active], batch.pieces[active])
+    batch.pieces[active] += 1
+    boards = batch.boards[active]
+    drop_pairs(boards, columns[active], rotations[active], main_types, sub_types)
+    boards = apply_gravity(boards)
+    batch.boards[active] = boards
+
+    over = column_heights(boards).max(axis=1) >= batch.height
+    batch.game_over[active[over]] = True
+    active = active[~over]
+    boards = boards[~over]
+
+    # The level is checked before the chain is scored, as in the game
+    batch.level[active] = np.maximum(batch.level[active],
+                                     1 + batch.score[active] // engine.POINTS_PER_LEVEL)
+
+    chain = 0
+    while active.size:
+        clears = find_clears(boards)
+        cleared = clears.sum(axis=(1, 2))
+        chaining = cleared > 0
+        if not chaining.any():
+            break
+        active = active[chaining]
+        boards = boards[chaining]
+        clears = clears[chaining]
+        cleared = cleared[chaining]
+
+        chain += 1
+        chains[active] = chain
+        batch.max_chain[active] = np.maximum(batch.max_chain[active], chain)
+        batch.total_cleared[active] += cleared
+        # engine.group_score() summed over the groups of the step:
+        # size * 10 * (1 + (chain - 1) / 2) = 5 * size * (chain + 1)
+        batch.score[active] += engine.POINTS_PER_PUYO * cleared * (chain + 1) // 2
+
+        boards[clears] = EMPTY
+        boards = apply_gravity(boards)
+        batch.boards[active] = boards
+
+    return chains
+
+
+def to_board(boards, index):
+    """An engine.Board with the cells of game index."""
+    board = engine.Board(boards.shape[2], boards.shape[1])
+    for y, row in enumerate(boards[index].tolist()):
+        board.cells[y] = [None if cell == EMPTY else cell for cell in row]
+    board.refresh()
+    return board
+
+
+def from_board(board):
+    """The cells of an engine.Board as a (height, width) int8 array."""
+    return np.array([[EMPTY if cell is None else cell for cell in row] for row in board.cells],
+                    dtype=np.int8)
@@ -0,0 +1,99 @@
+"""Play games with the beam search AI and time every move.
+
+Checks that ai.simulate() gives the same boards and scores as
+engine.place(), then lets the AI play and prints the time per move (mean,
+99th percentile, worst), nodes, transposition table hits and how the games
+went (mean score, longest chain, games lost), for a few beam widths at depth 2, then the
+worst time per move with the default settings, which fails if it is over
+MOVE_LIMIT.
+
+    python bench_ai.py [number_of_games] [moves_per_game]
+"""
+import random
+import sys
+import time
+
+import ai
+import bitboard
+import engine
+
+BEAM_WIDTHS = (4, 8, 22)
+MOVE_LIMIT = 0.016  # Seconds the worst move of the defaults may take
+
+
+def check(games, moves):
+    rng = random.Random(0)
+    for seed in range(games):
+        state = engine.new_game(seed)
+        colors = tuple(bitboard.from_board(state.board).colors)
+        key = ai.zobrist(colors)
+        for _ in range(moves):
+            piece = state.current_piece
+            column, rotation = rng.choice(ai.ACTIONS)
+            score = state.score
+            colors, key, gained, chain, over = ai.simulate(colors, key, piece.main_type, piece.sub_type,
+                                                           column, rotation)
+            settlement = engine.place(state, column, rotation)
+            assert colors == tuple(bitboard.from_board(state.board).colors), f"board of game {seed}"
+            assert key == ai.zobrist(colors), f"key of game {seed}"
+            assert gained == state.score - score and chain == len(settlement.steps)
+            assert over == state.game_over
+            if over:
+                break
+
+
+def play(search, games, moves):
+    times = []
+    cut_short = 0
+    nodes = 0
+    scores = []
+    chains = []
+    lost = 0
+    for seed in range(games):
+        state = engine.new_game(seed)
+        for _ in range(moves):
+            start = time.perf_counter()
+            column, rotation = search.best_move(state)
+            times.append(time.perf_counter() - start)
+            nodes += search.nodes
+            cut_short += search.depth_reached < search.depth
+            engine.place(state, column, rotation)
+            if state.game_over:
+                break
+        scores.append(state.score)
+        chains.append(state.max_chain)
+        lost += state.game_over
+    return times, nodes, scores, chains, lost, cut_short
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    moves = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    check(50, 60)
+    print(f"simulate() matches engine.place(); {games} games of up to {moves} moves at depth 2")
+    print(f"{'beam':>4} {'mean ms':>8} {'p99 ms':>7} {'max ms':>7} {'nodes/move':>10} {'hits':>6}"
+          f" {'score':>7} {'chain':>5} {'lost':>4}")
+    for beam_width in BEAM_WIDTHS:
+        # No time budget here, to see the full cost of each width
+        search = ai.BeamSearch(depth=2, beam_width=beam_width, time_budget=1.0)
+        times, nodes, scores, chains, lost, _ = play(search, games, moves)
+        times.sort()
+        table = search.table
+        print(f"{beam_width:4d} {sum(times) / len(times) * 1000:8.2f} "
+              f"{times[int(len(times) * 0.99)] * 1000:7.2f} {times[-1] * 1000:7.2f} "
+              f"{nodes / len(times):10.0f} {table.hits / (table.hits + table.misses):6.0%} "
+              f"{sum(scores) / games:7.0f} {max(chains):5d} "
+              f"{lost:4d}")
+
+    search = ai.BeamSearch()
+    times, _, _, _, _, cut_short = play(search, games, moves)
+    worst = max(times)
+    print(f"BeamSearch() defaults (depth {search.depth}, beam {search.beam_width}, "
+          f"budget {search.time_budget * 1000:.0f} ms): worst move {worst * 1000:.2f} ms, "
+          f"{cut_short} of {len(times)} searches stopped before depth {search.depth}")
+    if worst > MOVE_LIMIT:
+        sys.exit(f"The worst move took longer than {MOVE_LIMIT * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Compare the NumPy batch engine with engine.place() game by game.
+
+Plays the same random placements on N games with both, checks that the
+boards, scores and chains are identical after every placement, and
+prints placements (board steps) per second for each.
+
+    python bench_batch.py [number_of_games] [placements]
+"""
+import sys
+import time
+
+import numpy as np
+
+import batch_engine
+import engine
+
+
+def random_actions(rng, count, width):
+    # A random (column, rotation) that keeps the pair on the board
+    rotations = rng.integers(0, 4, count)
+    columns = rng.integers(0, width, count)
+    columns = np.where((rotations == 1) & (columns == width - 1), width - 2, columns)
+    columns = np.where((rotations == 3) & (columns == 0), 1, columns)
+    return columns, rotations
+
+
+def run_scalar(seeds, actions):
+    states = [engine.new_game(int(seed)) for seed in seeds]
+    steps = 0
+    start = time.perf_counter()
+    for columns, rotations in actions:
+        for state, column, rotation in zip(states, columns.tolist(), rotations.tolist()):
+            if not state.game_over:
+                engine.place(state, column, rotation)
+                steps += 1
+    return states, steps, time.perf_counter() - start
+
+
+def run_batch(seeds, actions):
+    batch = batch_engine.BatchState(seeds)
+    steps = 0
+    start = time.perf_counter()
+    for columns, rotations in actions:
+        steps += int((~batch.game_over).sum())
+        batch_engine.place(batch, columns, rotations)
+    return batch, steps, time.perf_counter() - start
+
+
+def check(states, batch):
+    for i, state in enumerate(states):
+        assert (batch_engine.from_board(state.board) == batch.boards[i]).all(), f"board of game {i}"
+        assert state.score == batch.score[i], f"score of game {i}"
+        assert state.max_chain == batch.max_chain[i], f"max chain of game {i}"
+        assert state.total_cleared == batch.total_cleared[i], f"cleared of game {i}"
+        assert state.level == batch.level[i], f"level of game {i}"
+        assert state.game_over == batch.game_over[i], f"game over of game {i}"
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    placements = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    rng = np.random.default_rng(0)
+    seeds = rng.integers(0, 1 << 62, count, dtype=np.uint64)
+    actions = [random_actions(rng, count, engine.GRID_WIDTH) for _ in range(placements)]
+
+    # Check step by step on a smaller batch, then time the full one
+    check_count = min(count, 200)
+    states = [engine.new_game(int(seed)) for seed in seeds[:check_count]]
+    batch = batch_engine.BatchState(seeds[:check_count])
+    for columns, rotations in actions:
+        for state, column, rotation in zip(states, columns[:check_count].tolist(),
+                                           rotations[:check_count].tolist()):
+            if not state.game_over:
+                engine.place(state, column, rotation)
+        batch_engine.place(batch, columns[:check_count], rotations[:check_count])
+        check(states, batch)
+
+    states, scalar_steps, scalar_time = run_scalar(seeds, actions)
+    batch, batch_steps, batch_time = run_batch(seeds, actions)
+    check(states, batch)
+    assert scalar_steps == batch_steps
+
+    chains = int((batch.max_chain > 0).sum())
+    print(f"{count} games x {placements} placements: {batch_steps} board steps, "
+          f"{chains} games chained, {int(batch.game_over.sum())} topped out, results identical")
+    print(f"engine.place      : {scalar_steps / scalar_time:12,.0f} boards/s")
+    print(f"batch_engine.place: {batch_steps / batch_time:12,.0f} boards/s")
+    print(f"speed-up          : {scalar_time / batch_time:12.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+"""Compare the list board and the bitboard backend.
+
+Checks that both give the same results on random boards, then prints the
+time per call for each operation. The list board's apply_gravity() only
+looks at its dirty columns, so it is timed with every column dirty, the
+work the bitboard always does. The bitboard's gravity gains the most on
+boards with many holes; with a few puyos cleared from a settled board the
+two are about even. is_valid_position() tests both cells against the
+occupied mask the bitboard keeps, against the column heights of the list
+board. Each time is the best of REPEATS runs.
+
+    python bench_bitboard.py [number_of_boards]
+"""
+import random
+import sys
+import time
+
+import bitboard
+import engine
+
+REPEATS = 5
+
+
+def random_board(rng, fill):
+    # Random cells with holes, so gravity has work to do
+    board = engine.Board()
+    for y in range(board.height):
+        for x in range(board.width):
+            if rng.random() < fill:
+                board.cells[y][x] = rng.randint(0, engine.NUM_SERVICES - 1)
+    board.refresh()
+    return board
+
+
+def cleared_board(rng, board):
+    # A settled board with a few puyos popped out, like after a clear
+    board = board.copy()
+    engine.apply_gravity(board)
+    filled = [(x, y) for y in range(board.height) for x in range(board.width)
+              if board.cells[y][x] is not None]
+    for x, y in rng.sample(filled, min(len(filled), rng.randint(4, 12))):
+        board.cells[y][x] = None
+    board.refresh()
+    return board
+
+
+def check_same_results(boards):
+    for board in boards:
+        bits = bitboard.from_board(board)
+        assert bitboard.to_board(bits).cells == board.cells
+
+        expected_groups = sorted(sorted(group) for group in engine.find_connected_groups(board))
+        assert bitboard.find_connected_groups(bits) == expected_groups
+
+        settled = board.copy()
+        expected_falls = engine.apply_gravity(settled)
+        assert bitboard.apply_gravity(bits) == expected_falls
+        assert bitboard.to_board(bits).cells == settled.cells
+        for x in range(-1, board.width + 1):
+            for y in range(-2, board.height + 1):
+                for rotation in range(4):
+                    piece = engine.Piece(0, 1, x, y, rotation)
+                    assert bitboard.is_valid_position(bits, piece) == engine.is_valid_position(settled, piece)
+
+        bits = bitboard.from_board(board)
+        assert bitboard.compact(bits) == bool(expected_falls)
+        assert bitboard.to_board(bits).cells == settled.cells
+
+
+def unsettled_copy(board):
+    # apply_gravity() only compacts the dirty columns: have it check them all,
+    # as the bitboard does
+    board = board.copy()
+    board.dirty_columns = set(range(board.width))
+    return board
+
+
+def time_per_call(func, boards, copy):
+    # Microseconds per call over all boards, the best of REPEATS runs on
+    # fresh copies, since the gravity functions change the boards
+    best = None
+    for _ in range(REPEATS):
+        copies = [copy(board) for board in boards]
+        start = time.perf_counter()
+        for board in copies:
+            func(board)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best / len(boards) * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(0)
+    boards = [random_board(rng, rng.uniform(0.2, 0.8)) for _ in range(count)]
+    cleared = [cleared_board(rng, board) for board in boards]
+    check_same_results(boards + cleared)
+    print(f"Results identical on {len(boards) + len(cleared)} boards")
+
+    settled = []
+    for board in boards:
+        board = board.copy()
+        engine.apply_gravity(board)
+        settled.append(board)
+    bit_boards = [bitboard.from_board(board) for board in boards]
+    bit_cleared = [bitboard.from_board(board) for board in cleared]
+    bit_settled = [bitboard.from_board(board) for board in settled]
+    piece = engine.Piece(0, 1, engine.GRID_WIDTH // 2, 5)
+
+    rows = [
+        ("apply_gravity (random)",
+         time_per_call(engine.apply_gravity, boards, unsettled_copy),
+         time_per_call(bitboard.apply_gravity, bit_boards, bitboard.BitBoard.copy)),
+        ("apply_gravity (clear)",
+         time_per_call(engine.apply_gravity, cleared, unsettled_copy),
+         time_per_call(bitboard.apply_gravity, bit_cleared, bitboard.BitBoard.copy)),
+        ("compact (random)",
+         time_per_call(engine.apply_gravity, boards, unsettled_copy),
+         time_per_call(bitboard.compact, bit_boards, bitboard.BitBoard.copy)),
+        ("compact (clear)",
+         time_per_call(engine.apply_gravity, cleared, unsettled_copy),
+         time_per_call(bitboard.compact, bit_cleared, bitboard.BitBoard.copy)),
+        ("compact (settled)",
+         time_per_call(engine.apply_gravity, settled, unsettled_copy),
+         time_per_call(bitboard.compact, bit_settled, bitboard.BitBoard.copy)),
+        ("find_connected_groups",
+         time_per_call(engine.find_connected_groups, settled, engine.Board.copy),
+         time_per_call(bitboard.find_connected_groups, bit_settled, bitboard.BitBoard.copy)),
+        ("find_group_masks",
+         time_per_call(engine.find_connected_groups, settled, engine.Board.copy),
+         time_per_call(bitboard.find_group_masks, bit_settled, bitboard.BitBoard.copy)),
+        ("is_valid_position",
+         time_per_call(lambda board: engine.is_valid_position(board, piece), settled, engine.Board.copy),
+         time_per_call(lambda board: bitboard.is_valid_position(board, piece), bit_settled, bitboard.BitBoard.copy)),
+    ]
+
+    print(f"{'operation':<26}{'list (us)':>12}{'bitboard (us)':>16}{'speed-up':>10}")
+    for name, list_time, bit_time in rows:
+        print(f"{name:<26}{list_time:>12.2f}{bit_time:>16.2f}{list_time / bit_time:>9.1f}x")
+
+
+if __name__ == '__main__':
+    main()
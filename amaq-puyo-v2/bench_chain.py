@@ -0,0 +1,119 @@
+"""Time lock + chain resolution on nearly full boards.
+
+Compares the engine (dirty-column gravity, dirty-cell group search) with
+the original approach of compacting every column until nothing moves and
+scanning the whole board for groups after every step.
+
+    python bench_chain.py [number_of_boards]
+"""
+import random
+import sys
+import time
+
+import engine
+
+
+def full_gravity(board):
+    # The original apply_gravity: rebuild every column
+    moved = False
+    cells = board.cells
+    for x in range(board.width):
+        puyos = []
+        for y in range(board.height - 1, -1, -1):
+            if cells[y][x] is not None:
+                puyos.append((y, cells[y][x]))
+                cells[y][x] = None
+        target_y = board.height - 1
+        for y, service_type in puyos:
+            if y != target_y:
+                moved = True
+            cells[target_y][x] = service_type
+            target_y -= 1
+    return moved
+
+
+def full_settle(state):
+    # Lock and resolve the way the game loop used to
+    engine.lock_piece(state)
+    board = state.board
+    while full_gravity(board):
+        pass
+    while True:
+        groups = engine.find_connected_groups(board)
+        if not groups:
+            break
+        engine.start_chain_step(state, groups)
+        engine.clear_groups(state, groups)
+        while full_gravity(board):
+            pass
+    engine.end_chain(state)
+
+
+def engine_settle(state):
+    engine.lock_piece(state)
+    engine.apply_gravity(state.board)
+    engine.resolve_chain(state)
+
+
+def nearly_full_state(rng):
+    # Columns filled to 10-12 puyos with no group of 4, and a piece ready to drop
+    state = engine.GameState(seed=rng.randrange(1 << 32))
+    board = state.board
+    for x in range(board.width):
+        for y in range(board.height - 1, board.height - 1 - rng.randint(10, 12), -1):
+            board.set(x, y, rng.randint(0, engine.NUM_SERVICES - 1))
+    engine.apply_gravity(board)
+    while engine.find_connected_groups(board):
+        for group in engine.find_connected_groups(board):
+            y, x = group[0]
+            board.set(x, y, (board.cells[y][x] + 1) % engine.NUM_SERVICES)
+    board.refresh()
+    engine.apply_gravity(board)
+    engine.find_dirty_groups(board)
+
+    piece = engine.random_piece(state)
+    piece.x = rng.randrange(board.width - 1)
+    piece.rotation = rng.randrange(4)
+    if piece.sub_position()[0] < 0:
+        piece.x += 1
+    state.current_piece = engine.drop_position(board, piece)
+    return state
+
+
+def copy_state(state):
+    copy = engine.GameState()
+    copy.board = state.board.copy()
+    copy.current_piece = state.current_piece.copy()
+    return copy
+
+
+def time_settle(settle, states):
+    copies = [copy_state(state) for state in states]
+    start = time.perf_counter()
+    for state in copies:
+        settle(state)
+    elapsed = time.perf_counter() - start
+    return elapsed / len(copies) * 1e6, copies
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(0)
+    states = [nearly_full_state(rng) for _ in range(count)]
+
+    full_time, full_results = time_settle(full_settle, states)
+    engine_time, engine_results = time_settle(engine_settle, states)
+
+    for full, fast in zip(full_results, engine_results):
+        assert full.board.cells == fast.board.cells
+        assert full.score == fast.score and full.max_chain == fast.max_chain
+
+    chains = sum(1 for state in engine_results if state.max_chain > 0)
+    print(f"{count} locks on nearly full boards, {chains} started a chain, results identical")
+    print(f"full gravity + full scan : {full_time:8.2f} us per lock")
+    print(f"dirty columns + cells    : {engine_time:8.2f} us per lock")
+    print(f"speed-up                 : {full_time / engine_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
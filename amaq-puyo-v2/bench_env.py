@@ -0,0 +1,78 @@
+"""Samples per second from PuyoEnv and VectorEnv with random actions.
+
+Steps one environment in this process, then vector environments with
+1, 2, 4, ... worker processes up to the number of cores, and checks that
+the vector environments play the same games as single ones.
+
+    python bench_env.py [number_of_envs] [steps]
+"""
+import multiprocessing
+import random
+import sys
+import time
+
+import numpy as np
+
+from env import ACTIONS, PuyoEnv, VectorEnv
+
+
+def run_single(steps):
+    rng = random.Random(0)
+    env = PuyoEnv()
+    env.reset(seed=0)
+    start = time.perf_counter()
+    for _ in range(steps):
+        _, _, done, _ = env.step(rng.choice(ACTIONS))
+        if done:
+            env.reset()
+    return steps / (time.perf_counter() - start)
+
+
+def run_vector(count, workers, steps):
+    rng = np.random.default_rng(0)
+    with VectorEnv(count, workers) as envs:
+        envs.reset(seed=0)
+        start = time.perf_counter()
+        for _ in range(steps):
+            envs.step([ACTIONS[i] for i in rng.integers(0, len(ACTIONS), count)])
+        return count * steps / (time.perf_counter() - start)
+
+
+def check(count, steps):
+    # Environment i of a vector env plays the game of PuyoEnv seeded i
+    rng = np.random.default_rng(1)
+    singles = [PuyoEnv() for _ in range(count)]
+    seeds = list(range(count))
+    for env, seed in zip(singles, seeds):
+        env.reset(seed)
+    with VectorEnv(count, 2) as envs:
+        observations = envs.reset(seed=0)
+        for _ in range(steps):
+            actions = [ACTIONS[i] for i in rng.integers(0, len(ACTIONS), count)]
+            observations, rewards, dones, _ = envs.step(actions)
+            for i, env in enumerate(singles):
+                observation, reward, done, _ = env.step(actions[i])
+                assert reward == rewards[i] and done == dones[i]
+                if done:
+                    seeds[i] += count
+                    observation = env.reset(seeds[i])
+                assert (observation['board'] == observations['board'][i]).all()
+                assert (observation['pieces'] == observations['pieces'][i]).all()
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    check(8, 200)
+    cores = multiprocessing.cpu_count()
+    print(f"{cores} cores, {count} envs x {steps} steps, vector envs match single envs")
+    print(f"PuyoEnv           : {run_single(count * steps // 4):10,.0f} samples/s")
+    workers = 1
+    while workers <= max(cores, 1):
+        print(f"VectorEnv {workers:2d} worker{'s' if workers > 1 else ' '}: "
+              f"{run_vector(count, workers, steps):10,.0f} samples/s")
+        workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Frame times of a 60 FPS loop while hints are searched.
+
+Runs a frame loop that ticks a game, stays busy for FRAME_WORK as if it
+was drawing and sleeps until the next frame, and asks for a hint for
+every new piece: searched inline in the frame, in a thread of the same
+process, or in the HintWorker process. Prints the worst frame, the
+frames that came late and how long hints took to arrive. First checks
+that killing the HintWorker process does not make requests fail.
+
+    python bench_hints.py [seconds]
+"""
+import random
+import sys
+import threading
+import time
+
+import ai
+import engine
+from hints import HintWorker
+
+FPS = 60
+FRAME = 1 / FPS
+TICKS_PER_FRAME = engine.TICK_RATE // FPS
+FRAME_WORK = 0.012  # Busy time per frame, standing in for drawing on a slow machine
+LATE = 1.5 * FRAME  # Later than this after the last frame means a frame was missed
+# Mostly dropping, so new pieces and hint requests come often
+INPUTS = [engine.INPUT_LEFT, engine.INPUT_RIGHT, engine.INPUT_ROTATE] + [engine.INPUT_DOWN] * 5
+
+
+class InlineHints:
+    """The search in the frame that asks for it."""
+
+    def __init__(self):
+        self.search = ai.BeamSearch(beam_width=len(ai.ACTIONS), time_budget=0.1)
+        self.moves = {}
+        self.request_id = 0
+
+    def request(self, state):
+        self.request_id += 1
+        self.moves[self.request_id] = self.search.best_move(state)
+        return self.request_id
+
+    def hint(self, request_id):
+        return self.moves.get(request_id)
+
+    def close(self):
+        pass
+
+
+class ThreadHints(InlineHints):
+    """The search in a thread, sharing the GIL with the frame loop."""
+
+    def request(self, state):
+        self.request_id += 1
+        request_id = self.request_id
+        pieces = (state.current_piece.copy(), state.next_piece.copy())
+        board = state.board.copy()
+
+        def run():
+            copy = engine.GameState()
+            copy.board = board
+            copy.current_piece, copy.next_piece = pieces
+            self.moves[request_id] = self.search.best_move(copy)
+
+        threading.Thread(target=run, daemon=True).start()
+        return request_id
+
+
+def check_dead_child():
+    # A hint child that dies must not take the game with it
+    hints = HintWorker()
+    state = engine.new_game(0)
+    hints.process.kill()
+    hints.reader.join(5)
+    assert hints.dead
+    for _ in range(3):
+        request_id = hints.request(state)
+        hints.cancel()
+        assert hints.hint(request_id) is None
+    hints.close()
+
+
+def run(hints, seconds):
+    rng = random.Random(0)
+    state = engine.new_game(0)
+    piece = None
+    request_id = None
+    asked = 0.0
+    waits = []
+    frame_times = []
+    last = time.perf_counter()
+    next_frame = last + FRAME
+    end = last + seconds
+    while last < end:
+        for _ in range(TICKS_PER_FRAME):
+            engine.tick(state, rng.choice(INPUTS))
+        if state.game_over:
+            state = engine.new_game(rng.randrange(1 << 32))
+        busy_until = time.perf_counter() + FRAME_WORK
+        while time.perf_counter() < busy_until:
+            pass
+        if state.current_piece is not piece and state.current_piece is not None:
+            piece = state.current_piece
+            asked = time.perf_counter()
+            request_id = hints.request(state)
+        elif request_id is not None and hints.hint(request_id) is not None:
+            waits.append(time.perf_counter() - asked)
+            request_id = None
+
+        time.sleep(max(0.0, next_frame - time.perf_counter()))
+        next_frame = max(next_frame + FRAME, time.perf_counter())
+        now = time.perf_counter()
+        frame_times.append(now - last)
+        last = now
+    hints.close()
+    late = sum(frame_time > LATE for frame_time in frame_times)
+    return max(frame_times), late, len(frame_times), waits
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    check_dead_child()
+    print("A hint process that dies leaves requests unanswered and raises nothing")
+    print(f"{seconds:.0f} s at {FPS} FPS, a full width depth 2 search for every new piece")
+    print(f"{'hints':>8} {'worst frame ms':>14} {'late frames':>11} {'hints':>5} {'mean wait ms':>12}")
+    for name, hints in (('inline', InlineHints()), ('thread', ThreadHints()), ('process', HintWorker())):
+        worst, late, frames, waits = run(hints, seconds)
+        mean_wait = sum(waits) / len(waits) * 1000 if waits else 0.0
+        print(f"{name:>8} {worst * 1000:14.2f} {late:5d} of {frames:4d} {len(waits):5d} {mean_wait:12.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Rollback versus on localhost with simulated latency and packet loss.
+
+Two clients in this process play each other over UDP in real time, each
+steered by a greedy AI with random slow-downs so its inputs are hard to
+guess, and each waiting after a chain the way main.py does while it
+shows one. For every network setting prints the rollbacks, the ticks
+played again and the worst time one rollback took, then checks that
+each client's copy of the other game ended up the same as the real one.
+
+Then the worst case: a full MAX_ROLLBACK tick rollback with the down key
+held (a lock every few ticks) from many points of a long game, against
+the time of one 60 FPS frame.
+
+    python bench_netplay.py [seconds_per_setting] [first_port]
+"""
+import random
+import sys
+import time
+
+import ai
+import engine
+import netplay
+import snapshot
+
+# (latency ms, jitter ms, loss)
+SETTINGS = [(0, 0, 0.0), (30, 10, 0.0), (80, 20, 0.05), (150, 50, 0.15)]
+WAIT_TICKS_PER_STEP = 100  # Ticks a client waits per chain step, as main.py shows it
+FRAME_TIME = 1 / 60
+
+
+class Client:
+    def __init__(self, seed, port, peer_port, latency, jitter, loss, ai_seed):
+        self.game = engine.new_game(seed)
+        transport = netplay.UdpTransport(port, ('127.0.0.1', peer_port), latency / 1000, jitter / 1000,
+                                         loss, seed=port, host='127.0.0.1')
+        self.session = netplay.RollbackSession(engine.new_game(seed), transport)
+        search = ai.BeamSearch(depth=1, time_budget=float('inf'))
+        self.pilot = ai.Autopilot(search.best_move, input_interval=2)
+        self.rng = random.Random(ai_seed)
+        self.waiting = 0
+
+    def inputs(self):
+        if self.waiting or self.game.game_over:
+            self.waiting = max(0, self.waiting - 1)
+            return netplay.INPUT_WAIT
+        # Now and then a few ticks without a key, like a player thinking
+        if self.rng.random() < 0.05:
+            self.waiting = self.rng.randrange(1, 20)
+            return 0
+        return self.pilot.inputs(self.game)
+
+    def tick(self):
+        inputs = self.inputs()
+        if not inputs & netplay.INPUT_WAIT:
+            settlement = engine.tick(self.game, inputs)
+            if settlement is not None and settlement.steps:
+                self.waiting = WAIT_TICKS_PER_STEP * len(settlement.steps)
+        self.session.advance(inputs)
+
+
+def play(seconds, port, latency, jitter, loss, seed):
+    clients = [Client(seed, port, port + 1, latency, jitter, loss, 1),
+               Client(seed, port + 1, port, latency, jitter, loss, 2)]
+    tick_time = 1 / engine.TICK_RATE
+    start = time.perf_counter()
+    next_tick = start
+    while time.perf_counter() - start < seconds:
+        for client in clients:
+            client.session.poll()
+        now = time.perf_counter()
+        if now < next_tick:
+            time.sleep(next_tick - now)
+            continue
+        next_tick += tick_time
+        for client in clients:
+            if client.session.can_advance():
+                client.tick()
+
+    # Bring both to the same tick, then wait for every input to arrive
+    a, b = clients
+    while a.session.tick != b.session.tick:
+        behind = a if a.session.tick < b.session.tick else b
+        behind.session.advance(netplay.INPUT_WAIT)
+    deadline = time.perf_counter() + 5
+    while time.perf_counter() < deadline and not all(
+            client.session.confirmed >= client.session.tick or client.session.remote_over for client in clients):
+        for client in clients:
+            client.session.poll()
+        time.sleep(0.001)
+    same = all(snapshot.snapshot(client.session.state) == snapshot.snapshot(other.game)
+               for client, other in ((a, b), (b, a)))
+    for client in clients:
+        client.session.transport.close()
+    return clients, same
+
+
+def worst_case(rollback=netplay.MAX_ROLLBACK, samples=300):
+    # The work of a rollback of this many ticks: restore, then snapshot and tick each one
+    state = engine.new_game(7)
+    search = ai.BeamSearch(depth=1, time_budget=float('inf'))
+    points = []
+    while not state.game_over and len(points) < samples:
+        engine.place(state, *search.best_move(state))
+        points.append(snapshot.snapshot(state))
+    times = []
+    copy = engine.GameState()
+    for data in points:
+        start = time.perf_counter()
+        snapshot.restore(data, copy)
+        for tick in range(rollback):
+            snapshot.snapshot(copy)
+            engine.tick(copy, engine.INPUT_DOWN | (engine.INPUT_ROTATE if tick % 9 == 0 else 0))
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times, len(points)
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 47000
+    for i, (latency, jitter, loss) in enumerate(SETTINGS):
+        clients, same = play(seconds, port + 2 * i, latency, jitter, loss, seed=i)
+        print(f"latency {latency} ms (+{jitter} ms jitter), {loss:.0%} loss: "
+              f"{'copies match' if same else 'COPIES DIFFER'}")
+        for name, client in zip('AB', clients):
+            session = client.session
+            transport = session.transport
+            mean = session.resimulated / session.rollbacks if session.rollbacks else 0
+            print(f"  {name}: {session.tick} ticks, {session.rollbacks} rollbacks "
+                  f"({mean:.1f} ticks mean, {session.worst_rollback} worst), "
+                  f"worst rollback {session.worst_resimulation * 1000:.2f} ms, "
+                  f"{session.stalls} ticks waited, {transport.sent} packets sent, {transport.dropped} dropped")
+
+    times, count = worst_case()
+    print(f"{netplay.MAX_ROLLBACK} tick rollback from {count} points of a game: "
+          f"mean {sum(times) / count * 1000:.2f} ms, p99 {times[int(count * 0.99)] * 1000:.2f} ms, "
+          f"worst {times[-1] * 1000:.2f} ms ({times[-1] / FRAME_TIME:.0%} of a 60 FPS frame)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Nodes per second of the parallel search from 1 to N worker processes.
+
+Takes positions from games played by the beam search AI, searches each
+to a fixed depth with no time limit, in this process and then with 1, 2,
+4, ... workers up to the number of cores, and prints nodes per second
+and the speed-up over one worker. Then shows how deep a search gets in
+the time budget.
+
+    python bench_parallel.py [depth] [time_budget_ms]
+"""
+import multiprocessing
+import sys
+import time
+
+import ai
+import bitboard
+import engine
+from parallel_ai import ParallelSearch, pack_colors, search_root
+
+POSITIONS = 6
+SAMPLES = 4
+
+
+def positions():
+    # Mid-game boards from games the beam search plays
+    search = ai.BeamSearch()
+    boards = []
+    for seed in range(POSITIONS):
+        state = engine.new_game(seed)
+        for _ in range(20 + seed * 5):
+            engine.place(state, *search.best_move(state))
+        pairs = [(piece.main_type, piece.sub_type) for piece in (state.current_piece, state.next_piece)]
+        boards.append((tuple(bitboard.from_board(state.board).colors), pairs))
+    return boards
+
+
+def run_serial(boards, depth):
+    # The same root tasks, one after another in this process
+    nodes = 0
+    start = time.time()
+    for colors, pairs in boards:
+        data = pack_colors(colors)
+        for action in ai.ACTIONS:
+            nodes += search_root(data, pairs, action, depth, SAMPLES, 1, 8, float('inf'))[1]
+    return nodes / (time.time() - start)
+
+
+def run_pool(boards, depth, workers):
+    with ParallelSearch(workers, time_budget=3600, samples=SAMPLES, max_depth=depth) as search:
+        search.search(*boards[0])  # Start the worker processes
+        nodes = 0
+        start = time.time()
+        for colors, pairs in boards:
+            search.search(colors, pairs)
+            nodes += search.nodes
+        return nodes / (time.time() - start)
+
+
+def main():
+    depth = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    budget = (int(sys.argv[2]) if len(sys.argv) > 2 else 200) / 1000
+    cores = multiprocessing.cpu_count()
+    boards = positions()
+    print(f"{cores} cores, {len(boards)} positions searched {depth} pairs deep "
+          f"({SAMPLES} samples of the pairs after the next one)")
+    print(f"in this process: {run_serial(boards, depth):10,.0f} nodes/s")
+    one = None
+    workers = 1
+    while workers <= cores:
+        rate = run_pool(boards, depth, workers)
+        one = one or rate
+        print(f"{workers:2d} worker{'s' if workers > 1 else ' '}     : {rate:10,.0f} nodes/s "
+              f"({rate / one:.2f}x)")
+        workers *= 2
+
+    with ParallelSearch(time_budget=budget) as search:
+        search.search(*boards[0])
+        for colors, pairs in boards:
+            search.search(colors, pairs)
+            print(f"{budget * 1000:.0f} ms budget: depth {search.depth_reached}, "
+                  f"{search.nodes:,} nodes in {search.elapsed * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
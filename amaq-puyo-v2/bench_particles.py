@@ -0,0 +1,112 @@
+"""Time the particle system with thousands of live particles.
+
+Keeps N pop particles alive (new bursts replace the ones that die) and
+times update + blit per frame on a headless display, next to the old way
+of keeping a list of dicts, scaling and fading a copy of the image per
+particle and removing finished ones with list.pop(i).
+
+    python bench_particles.py [frames]
+"""
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import numpy as np
+import pygame
+
+from particles import ParticleSystem
+from sprite_atlas import SpriteAtlas
+
+SCREEN_SIZE = (600, 700)
+LIFETIME = 20
+SIZE = 36
+COUNTS = (500, 1000, 2000, 5000, 10000)
+
+
+def make_images():
+    images = {}
+    for service_type in range(5):
+        img = pygame.Surface((SIZE, SIZE), pygame.SRCALPHA)
+        pygame.draw.circle(img, (60 * service_type, 120, 200), (SIZE // 2, SIZE // 2), SIZE // 2)
+        images[service_type] = img
+    return images
+
+
+def burst(rng, count):
+    # Sparks thrown up from random points, falling back under gravity
+    position = np.column_stack((rng.uniform(0, SCREEN_SIZE[0], count), rng.uniform(0, SCREEN_SIZE[1], count)))
+    velocity = np.column_stack((rng.uniform(-3, 3, count), rng.uniform(-6, 0, count)))
+    return position, velocity
+
+
+def run_particles(screen, atlas, count, frames):
+    rng = np.random.default_rng(0)
+    particles = ParticleSystem([atlas.pops[service_type] for service_type in range(5)])
+    for kind in range(5):
+        position, velocity = burst(rng, count // 5)
+        particles.spawn_many(kind, position, rng.integers(1, LIFETIME + 1, count // 5), velocity, (0, 0.3))
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        dead_kinds, _, _ = particles.update()
+        if len(dead_kinds):
+            position, velocity = burst(rng, len(dead_kinds))
+            particles.spawn_many(dead_kinds, position, LIFETIME, velocity, (0, 0.3))
+        screen.blits(particles.sprites(), doreturn=False)
+    return (time.perf_counter() - start) / frames * 1000
+
+
+def run_dicts(screen, images, count, frames):
+    # The pop animations before the particle system
+    rng = random.Random(0)
+    animations = []
+
+    def spawn(frame):
+        animations.append({'type': rng.randrange(5), 'frame': frame,
+                           'x': rng.uniform(0, SCREEN_SIZE[0]), 'y': rng.uniform(0, SCREEN_SIZE[1]),
+                           'vx': rng.uniform(-3, 3), 'vy': rng.uniform(-6, 0)})
+
+    for _ in range(count):
+        spawn(rng.randrange(LIFETIME))
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        for i in range(len(animations) - 1, -1, -1):
+            anim = animations[i]
+            anim['frame'] += 1
+            anim['vy'] += 0.3
+            anim['x'] += anim['vx']
+            anim['y'] += anim['vy']
+            if anim['frame'] >= LIFETIME:
+                animations.pop(i)
+                spawn(0)
+        for anim in animations:
+            progress = anim['frame'] / LIFETIME
+            img = images[anim['type']].copy()
+            size = int(SIZE * (1 + progress * 0.5))
+            img = pygame.transform.scale(img, (size, size))
+            img.set_alpha(255 * max(0, 1 - progress))
+            screen.blit(img, img.get_rect(center=(anim['x'], anim['y'])))
+    return (time.perf_counter() - start) / frames * 1000
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 120
+    pygame.init()
+    screen = pygame.display.set_mode(SCREEN_SIZE)
+    images = make_images()
+    atlas = SpriteAtlas(images, LIFETIME)
+
+    print(f"{frames} frames per run, {1000 / 60:.1f} ms per frame at 60 FPS")
+    print(f"{'particles':>9} {'dicts ms':>9} {'arrays ms':>10} {'speed-up':>9}")
+    for count in COUNTS:
+        dict_time = run_dicts(screen, images, count, frames)
+        array_time = run_particles(screen, atlas, count, frames)
+        print(f"{count:9d} {dict_time:9.2f} {array_time:10.2f} {dict_time / array_time:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
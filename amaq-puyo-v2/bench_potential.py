@@ -0,0 +1,82 @@
+"""Time ChainPotential.update() on every lock of games played by the AI.
+
+Checks every answer against dropping the puyo on a copy of the
+engine.Board and resolving the chain with the engine, then prints the
+time per update: incremental, worked out from scratch, and with the
+engine's list board.
+
+    python bench_potential.py [number_of_games] [moves_per_game]
+"""
+import sys
+import time
+
+import ai
+import bitboard
+import engine
+from chain_potential import ChainPotential
+
+
+def engine_potential(board):
+    # The answers from the list board: 6 columns x 5 colours of copy + chain
+    chains = [[0] * engine.NUM_SERVICES for _ in range(board.width)]
+    scores = [[0] * engine.NUM_SERVICES for _ in range(board.width)]
+    for x in range(board.width):
+        height = board.heights[x]
+        if height >= board.height:
+            continue
+        for service_type in range(engine.NUM_SERVICES):
+            state = engine.GameState()
+            state.board = board.copy()
+            state.board.set(x, board.height - 1 - height, service_type)
+            steps = engine.resolve_chain(state)
+            chains[x][service_type] = len(steps)
+            scores[x][service_type] = state.score
+    return chains, scores
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    moves = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    search = ai.BeamSearch()
+    times = {'incremental': [], 'from scratch': [], 'engine': []}
+    evaluated = 0
+    resolved = 0
+    chaining = 0
+    for seed in range(games):
+        state = engine.new_game(seed)
+        potential = ChainPotential()
+        for _ in range(moves):
+            engine.place(state, *search.best_move(state))
+            if state.game_over:
+                break
+            colors = bitboard.from_board(state.board).colors
+
+            start = time.perf_counter()
+            potential.update(colors)
+            times['incremental'].append(time.perf_counter() - start)
+            evaluated += potential.evaluated
+            resolved += potential.resolved
+
+            start = time.perf_counter()
+            ChainPotential().update(colors)
+            times['from scratch'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            chains, scores = engine_potential(state.board)
+            times['engine'].append(time.perf_counter() - start)
+
+            assert potential.chains == chains and potential.scores == scores, f"game {seed}"
+            chaining += sum(chain > 0 for row in chains for chain in row)
+
+    updates = len(times['incremental'])
+    print(f"{updates} updates checked against the engine, {chaining / updates:.1f} of 30 drops "
+          f"start a chain on average, {evaluated / updates:.1f} answers worked out per update, "
+          f"{resolved / updates:.1f} of them chains")
+    for name, samples in times.items():
+        samples.sort()
+        print(f"{name:>12}: mean {sum(samples) / updates * 1000:6.3f} ms, "
+              f"p99 {samples[int(updates * 0.99)] * 1000:6.3f} ms, max {samples[-1] * 1000:6.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
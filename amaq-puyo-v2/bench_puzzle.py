@@ -0,0 +1,124 @@
+"""Solve times of a set of chain puzzles.
+
+For every puzzle in PUZZLES prints the time to the first solution and to
+all of them, with the nodes searched, then the same without pruning and
+the memo (for puzzles of up to PLAIN_MAX_PAIRS pairs), then with 1, 2,
+4, ... workers up to the number of cores. Every puzzle must have a
+solution, and every solution is played again with engine.place() to
+check the chain and score.
+
+    python bench_puzzle.py [max_pairs]
+"""
+import multiprocessing
+import sys
+import time
+
+import bitboard
+import engine
+from puzzle import Puzzle, PuzzleSolver
+
+PLAIN_MAX_PAIRS = 4
+
+PUZZLES = [
+    Puzzle(['.GRB..',
+            'BBGG..',
+            'GGRRRY'], 'BB YB', chain=3, name='3 chain, 2 pairs'),
+    Puzzle(['G...B.',
+            'R.Y.R.',
+            'GGG.G.',
+            'BBY.YB'], 'RY RR', chain=3, name='3 chain, 2 pairs, 2 ways'),
+    Puzzle(['RB...Y',
+            'YR.B.R',
+            'YR.B.G',
+            'GRYRBB',
+            'YBBBRG'], 'GG YB RR', chain=4, name='4 chain, 3 pairs'),
+    Puzzle(['.BG...',
+            '.YB...',
+            '.GRR..',
+            '.YRG.G',
+            '.BBY.Y',
+            'YRYYGY',
+            'BRGRRB'], 'GR YG RB', chain=4, name='4 chain, 3 pairs, tall'),
+    Puzzle(['....B.',
+            '....B.',
+            '....R.',
+            '....GG',
+            '....YY',
+            '.B..GG',
+            'GR.BGY',
+            'RBYGRR'], 'RY RY RY YY', chain=4, name='4 chain, 4 pairs'),
+    Puzzle(['B..Y..',
+            'Y..Y..',
+            'G..BYR',
+            'B.YYGY',
+            'Y.YGRB',
+            'YRGGRY'], 'BR BY BG RY', chain=5, name='5 chain, 4 pairs'),
+    Puzzle(['B....Y',
+            'RY..YB',
+            'RR..RR',
+            'YYR.YG',
+            'GYG.GY',
+            'RGBYRG'], 'RR BY GB RY BG', chain=5, name='5 chain, 5 pairs'),
+    Puzzle(['B....Y',
+            'RY..YB',
+            'RR..RR',
+            'YYR.YG',
+            'GYG.GY',
+            'RGBYRG'], 'RR BY GB RY BG', score=480, name='480 points, 5 pairs'),
+]
+
+
+def check(puzzle, solution):
+    # Play the moves with the engine and compare the chain and score
+    moves, chain, score = solution
+    board = bitboard.from_colors(list(puzzle.colors))
+    state = engine.GameState()
+    state.board = bitboard.to_board(board)
+    for (main, sub), (column, rotation) in zip(puzzle.pairs, moves):
+        state.current_piece = engine.Piece(main, sub, column)
+        settlement = engine.place(state, column, rotation)
+        assert not settlement.game_over
+    assert len(settlement.steps) == chain and state.score == score, (puzzle.name, solution)
+    assert puzzle.reached(chain, score)
+
+
+def solve(puzzle, solver):
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for solution in solver.solutions(puzzle):
+        if first is None:
+            first = time.perf_counter() - start
+        check(puzzle, solution)
+        count += 1
+    return first, time.perf_counter() - start, count
+
+
+def report(label, puzzle, solver):
+    first, total, count = solve(puzzle, solver)
+    first = f"{first * 1000:9.1f} ms" if first is not None else "        - ms"
+    print(f"  {label:>12}: first {first}, all {total * 1000:9.1f} ms, {count:5} solutions, "
+          f"{solver.nodes:8} nodes, {solver.pruned:6} pruned, {solver.memo_hits:6} memo hits")
+    return count
+
+
+def main():
+    max_pairs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    cores = multiprocessing.cpu_count()
+    for puzzle in PUZZLES:
+        if len(puzzle.pairs) > max_pairs:
+            continue
+        print(puzzle.name)
+        count = report('solver', puzzle, PuzzleSolver(workers=1))
+        assert count > 0, f"{puzzle.name} has no solution"
+        if len(puzzle.pairs) <= PLAIN_MAX_PAIRS:
+            plain = report('no speed-ups', puzzle, PuzzleSolver(workers=1, prune=False, memo=False))
+            assert plain == count
+        workers = 2
+        while workers <= cores:
+            assert report(f'{workers} workers', puzzle, PuzzleSolver(workers)) == count
+            workers *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Time snapshot() and restore() on games played by the AI.
+
+Checks that a restored game is the same as the one it was taken from and
+goes on the same way, then prints the snapshot size and the time per
+snapshot and restore, against copying the state with copy.deepcopy().
+
+    python bench_snapshot.py [number_of_games] [ticks_per_game]
+"""
+import copy
+import sys
+import time
+
+import ai
+import engine
+import snapshot
+
+
+def same(a, b):
+    for name in ('score', 'level', 'fall_speed', 'max_chain', 'total_cleared', 'ticks',
+                 'fall_timer', 'drop_timer', 'game_over', 'chain_count'):
+        if getattr(a, name) != getattr(b, name):
+            return False
+    pieces = [(piece.main_type, piece.sub_type, piece.x, piece.y, piece.rotation) if piece else None
+              for piece in (a.current_piece, b.current_piece)]
+    return (pieces[0] == pieces[1] and a.board.cells == b.board.cells and a.board.heights == b.board.heights
+            and a.queue.peek(4) == b.queue.peek(4)
+            and (a.next_piece.main_type, a.next_piece.sub_type) == (b.next_piece.main_type, b.next_piece.sub_type))
+
+
+def main():
+    games = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    ticks = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+    times = {'snapshot': [], 'restore': [], 'deepcopy': []}
+    checked = 0
+    snapshot.snapshot(engine.new_game(0))  # Builds the row tables
+    for seed in range(games):
+        state = engine.new_game(seed)
+        pilot = ai.Autopilot(ai.BeamSearch().best_move, input_interval=3)
+        restored = engine.GameState()
+        for tick in range(ticks):
+            engine.tick(state, pilot.inputs(state))
+            if state.game_over:
+                break
+            start = time.perf_counter()
+            data = snapshot.snapshot(state)
+            times['snapshot'].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            snapshot.restore(data, restored)
+            times['restore'].append(time.perf_counter() - start)
+            if tick % 100 == 0:
+                start = time.perf_counter()
+                ahead = copy.deepcopy(state)
+                times['deepcopy'].append(time.perf_counter() - start)
+                # The restored game must play on exactly like a copy of the game
+                assert same(state, restored), f"game {seed} tick {tick}"
+                copied = snapshot.restore(data)
+                for _ in range(200):
+                    inputs = tick * 7 % 16
+                    engine.tick(ahead, inputs)
+                    engine.tick(copied, inputs)
+                assert same(ahead, copied) and ahead.board.cells == copied.board.cells
+                checked += 1
+
+    print(f"{snapshot.SNAPSHOT_SIZE} bytes per snapshot ({snapshot.board_size()} for the board), "
+          f"{checked} snapshots checked")
+    for name, samples in times.items():
+        samples.sort()
+        print(f"{name:>8}: mean {sum(samples) / len(samples) * 1e6:7.1f} us, "
+              f"p99 {samples[int(len(samples) * 0.99)] * 1e6:7.1f} us")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,182 @@
+"""Games sent to many spectators through a SpectatorServer on localhost.
+
+This process runs the server and the games, at real time (120 ticks a
+second each) or as close to it as it can get, with random AI players
+that start a new game when they lose. A second process runs the
+spectators. Of every 16, one is slow (it reads SLOW_READ bytes every
+SLOW_INTERVAL seconds through a small receive buffer, like a poor
+connection) and one stops reading altogether; both watch every game, so
+they fall behind once there is enough traffic. Half of the others watch
+every game and half watch one. For every number
+of games and spectators prints the share of real time the games kept
+up, the server's time per tick (frames, publish and flush), the data
+sent and received, and the slow clients sent keyframes again or dropped.
+At the end the first spectator's Mirror of every game has to match the
+game.
+
+    python bench_spectate.py [seconds_per_setting]
+"""
+import asyncio
+import multiprocessing as mp
+import random
+import socket
+import sys
+import time
+
+import ai
+import engine
+import spectate
+
+GAMES = (1, 16, 64, 256)
+SUBSCRIBERS = (1, 16, 64, 256)
+SLOW_RECEIVE_BUFFER = 8192
+SLOW_READ = 1024
+SLOW_INTERVAL = 0.1
+
+
+def view(state):
+    # What a spectator can see of a game
+    pieces = [(piece.main_type, piece.sub_type, piece.x, piece.y, piece.rotation) if piece else None
+              for piece in (state.current_piece, state.next_piece)]
+    pieces[1] = pieces[1][:2] if pieces[1] else None
+    return (state.board.cells, state.score, state.level, state.max_chain, state.total_cleared,
+            pieces, state.game_over)
+
+
+async def spectators(conn, port, count, games):
+    received = [0] * count
+    mirrors = {}
+
+    async def mirror(reader):
+        async for game_id, kind, data in spectate.read_frames(reader):
+            received[0] += len(data) + spectate.HEADER.size
+            mirrors.setdefault(game_id, spectate.Mirror()).apply(kind, data)
+
+    async def fast(i, reader):
+        while data := await reader.read(65536):
+            received[i] += len(data)
+
+    async def slow(i, reader):
+        while data := await reader.read(SLOW_READ):
+            received[i] += len(data)
+            await asyncio.sleep(SLOW_INTERVAL)
+
+    tasks = []
+    writers = []  # Kept, or the connections close
+    for i in range(count):
+        slow_client, stalled = i % 16 == 7, i % 16 == 15
+        watched = () if i % 2 == 0 or slow_client or stalled else (i % games,)
+        if slow_client or stalled:
+            # The receive buffer has to be set before connecting
+            sock = socket.socket()
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SLOW_RECEIVE_BUFFER)
+            sock.connect(('127.0.0.1', port))
+            reader, writer = await spectate.subscribe(None, None, watched, sock=sock)
+        else:
+            reader, writer = await spectate.subscribe('127.0.0.1', port, watched)
+        writers.append(writer)
+        if i == 0:
+            tasks.append(asyncio.create_task(mirror(reader)))
+        elif slow_client:
+            tasks.append(asyncio.create_task(slow(i, reader)))
+        elif not stalled:
+            tasks.append(asyncio.create_task(fast(i, reader)))
+    loop = asyncio.get_running_loop()
+    conn.send('ready')
+
+    # The games as they ended; wait for the first spectator to catch up with them
+    expected = await loop.run_in_executor(None, conn.recv)
+    deadline = time.perf_counter() + 5
+    while time.perf_counter() < deadline:
+        if all(game_id in mirrors and view(mirrors[game_id].state) == value
+               for game_id, value in expected.items()):
+            break
+        await asyncio.sleep(0.02)
+    same = all(game_id in mirrors and view(mirrors[game_id].state) == value
+               for game_id, value in expected.items())
+    conn.send((same, sum(received)))
+    await loop.run_in_executor(None, conn.recv)
+    for writer in writers:
+        writer.close()
+
+
+def run_spectators(conn, port, count, games):
+    asyncio.run(spectators(conn, port, count, games))
+
+
+class Game:
+    def __init__(self, game_id, seed):
+        self.rng = random.Random(seed)
+        self.publisher = spectate.GamePublisher(game_id)
+        self.new_game()
+
+    def new_game(self):
+        self.state = engine.new_game(self.rng.getrandbits(32))
+        self.pilot = ai.Autopilot(lambda state: self.rng.choice(ai.ACTIONS), input_interval=6)
+        self.publisher.countdown = 0
+
+
+async def bench(seconds, games, subscribers):
+    server = spectate.SpectatorServer()
+    listening = await server.start('127.0.0.1', 0)
+    port = listening.sockets[0].getsockname()[1]
+    loop = asyncio.get_running_loop()
+    conn, child_conn = mp.Pipe()
+    process = mp.Process(target=run_spectators, args=(child_conn, port, subscribers, games))
+    process.start()
+    await loop.run_in_executor(None, conn.recv)
+
+    played = [Game(game_id, game_id) for game_id in range(games)]
+    tick_time = 1 / engine.TICK_RATE
+    ticks = 0
+    server_time = 0.0
+    start = time.perf_counter()
+    while (now := time.perf_counter()) - start < seconds:
+        if ticks * tick_time > now - start:
+            await asyncio.sleep(ticks * tick_time - (now - start))
+            continue
+        for game in played:
+            if game.state.game_over:
+                game.new_game()
+            settlement = engine.tick(game.state, game.pilot.inputs(game.state))
+            begin = time.perf_counter()
+            server.publish(game.publisher.game_id, *game.publisher.frames(game.state, settlement))
+            server_time += time.perf_counter() - begin
+        begin = time.perf_counter()
+        server.flush()
+        server_time += time.perf_counter() - begin
+        ticks += 1
+        await asyncio.sleep(0)  # Let the sockets write
+    elapsed = time.perf_counter() - start
+
+    conn.send({game.publisher.game_id: view(game.state) for game in played})
+    same, received = await loop.run_in_executor(None, conn.recv)
+    conn.send('stop')
+    process.join()
+    await asyncio.sleep(0.1)  # Let the server see the spectators go
+    server.close()
+    return {
+        'real time': ticks * tick_time / elapsed,
+        'us per tick': server_time / ticks * 1e6,
+        'sent': server.bytes_sent / elapsed / 1e3,
+        'received': received / elapsed / 1e3,
+        'resyncs': server.resyncs,
+        'dropped': server.dropped,
+        'same': same,
+    }
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 12
+    print("games  spectators  real time  server/tick   sent kB/s  received kB/s  resyncs  dropped  mirror")
+    for games in GAMES:
+        for subscribers in SUBSCRIBERS:
+            result = asyncio.run(bench(seconds, games, subscribers))
+            print(f"{games:5}  {subscribers:10}  {result['real time']:9.0%}  "
+                  f"{result['us per tick']:8.0f} us  {result['sent']:10.1f}  "
+                  f"{result['received']:13.1f}  {result['resyncs']:7}  {result['dropped']:7}  "
+                  f"{'same' if result['same'] else 'DIFFERS'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Run headless games tick by tick as fast as possible.
+
+Uses the same engine.tick() as the game loop, with random inputs, and
+prints how many simulated seconds run per real second.
+
+    python bench_ticks.py [number_of_games]
+"""
+import random
+import sys
+import time
+
+import engine
+
+INPUTS = [0, 0, 0, engine.INPUT_LEFT, engine.INPUT_RIGHT, engine.INPUT_ROTATE, engine.INPUT_DOWN]
+
+
+def run_game(seed):
+    rng = random.Random(seed)
+    state = engine.new_game(seed)
+    while not state.game_over:
+        engine.tick(state, rng.choice(INPUTS))
+    return state
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    start = time.perf_counter()
+    ticks = 0
+    for seed in range(count):
+        state = run_game(seed)
+        ticks += state.ticks
+    elapsed = time.perf_counter() - start
+
+    simulated = ticks / engine.TICK_RATE
+    print(f"{count} games, {ticks} ticks ({simulated:.0f} s of play) in {elapsed:.2f} s")
+    print(f"{ticks / elapsed:,.0f} ticks/s, {simulated / elapsed:,.0f}x real time, "
+          f"{count / elapsed:,.1f} games/s")
+
+
+if __name__ == '__main__':
+    main()
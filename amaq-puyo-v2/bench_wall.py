@@ -0,0 +1,136 @@
+"""How many live boards a BoardWall can show at 60 FPS.
+
+Runs count games of random AI players (a new game when one is lost) at
+2 ticks a frame, as main.py does at 60 FPS, and draws them on a wall on a
+headless display: first the counts of COUNTS on a WALL_SIZE window, then
+more and more boards at STRESS_CELL pixel cells on a window as large as
+they need, until the frames no longer fit in a 60 FPS frame. For every
+count prints the cell size, the frame time of the wall redrawing only the
+changed cells against redrawing everything, and the frame time with the
+games ticked as well; the largest count whose frames (p99, games
+included) fit in a 60 FPS frame is the answer. The first draw of a wall,
+which paints everything, is not timed.
+
+    python bench_wall.py [frames_per_count]
+"""
+import math
+import os
+import random
+import sys
+import time
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
+import pygame
+
+import ai
+import engine
+import wall
+from sprite_atlas import SpriteAtlas
+from text_cache import TextCache
+
+WALL_SIZE = (1280, 720)
+COUNTS = (4, 16, 64, 256)
+STRESS_CELL = 11  # As 64 boards on WALL_SIZE
+STRESS_COUNTS = (256, 512, 1024, 2048, 4096)
+TICKS_PER_FRAME = engine.TICK_RATE // 60
+FRAME_TIME = 1 / 60
+SIZE = 36
+
+
+def make_images():
+    images = {}
+    for service_type in range(engine.NUM_SERVICES):
+        img = pygame.Surface((SIZE, SIZE), pygame.SRCALPHA)
+        pygame.draw.circle(img, (50 * service_type, 120, 200), (SIZE // 2, SIZE // 2), SIZE // 2 - 2)
+        images[service_type] = img
+    return images
+
+
+class Game:
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.new_game()
+
+    def new_game(self):
+        self.state = engine.new_game(self.rng.getrandbits(32))
+        self.pilot = ai.Autopilot(lambda state: self.rng.choice(ai.ACTIONS), input_interval=6)
+
+    def tick(self):
+        if self.state.game_over:
+            self.new_game()
+        engine.tick(self.state, self.pilot.inputs(self.state))
+
+
+def stress_size(count, label_height):
+    # A window just large enough for count boards of STRESS_CELL cells, about 16:9
+    board_width = engine.GRID_WIDTH * STRESS_CELL + wall.GAP
+    board_height = engine.GRID_HEIGHT * STRESS_CELL + wall.GAP + label_height
+    columns = 1
+    while math.ceil(count / columns) * board_height * 16 > columns * board_width * 9:
+        columns += 1
+    return columns * board_width, math.ceil(count / columns) * board_height
+
+
+def run(screen, atlas, font, count, frames, full_redraw):
+    games = [Game(seed) for seed in range(count)]
+    board_wall = wall.BoardWall(screen, atlas, count, font, TextCache())
+    # The first draw paints the whole wall; it is not one of the timed frames
+    pygame.display.update(board_wall.draw([game.state for game in games]))
+    draw_times, frame_times = [], []
+    rects = 0
+    for _ in range(frames):
+        start = time.perf_counter()
+        for game in games:
+            for _ in range(TICKS_PER_FRAME):
+                game.tick()
+        drawn = time.perf_counter()
+        if full_redraw:
+            board_wall.invalidate()
+        dirty = board_wall.draw([game.state for game in games])
+        pygame.display.update(dirty)
+        end = time.perf_counter()
+        rects += len(dirty)
+        draw_times.append(end - drawn)
+        frame_times.append(end - start)
+    draw_times.sort()
+    frame_times.sort()
+    return board_wall, draw_times, frame_times, rects / frames
+
+
+def bench(screen, atlas, font, count, frames):
+    # One line of the table; True if the frames fit in a 60 FPS frame
+    p99 = int(frames * 0.99)
+    _, full_times, _, _ = run(screen, atlas, font, count, frames, True)
+    board_wall, draw_times, frame_times, rects = run(screen, atlas, font, count, frames, False)
+    print(f"{count:6}  {board_wall.cell:4}  {sum(draw_times) / frames * 1000:9.2f}  {draw_times[p99] * 1000:5.2f}  "
+          f"{sum(full_times) / frames * 1000:16.2f}  {rects:11.1f}  "
+          f"{sum(frame_times) / frames * 1000:16.2f}  {frame_times[p99] * 1000:5.2f}")
+    return frame_times[p99] <= FRAME_TIME
+
+
+def main():
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    pygame.init()
+    screen = pygame.display.set_mode(WALL_SIZE)
+    atlas = SpriteAtlas(make_images(), 10)
+    font = pygame.font.Font(None, 16)
+    header = "boards  cell  draw mean   p99  full redraw mean  rects/frame  frame+games mean   p99"
+    print(f"{WALL_SIZE[0]}x{WALL_SIZE[1]} window, {frames} frames per count, times in ms")
+    print(header)
+    for count in COUNTS:
+        bench(screen, atlas, font, count, frames)
+
+    print(f"{STRESS_CELL} pixel cells")
+    print(header)
+    best = None
+    for count in STRESS_COUNTS:
+        screen = pygame.display.set_mode(stress_size(count, font.get_linesize()))
+        if not bench(screen, atlas, font, count, frames):
+            break
+        best = count
+    print(f"Largest count at 60 FPS (p99 frame with the games): {best}")
+
+
+if __name__ == '__main__':
+    main()
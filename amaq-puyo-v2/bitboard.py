@@ -0,0 +1,318 @@
+"""Bitboard backend for the Puyo board.
+
+Each service type is an int bitmask over the grid. Cells are numbered
+column by column from the bottom, bit = x * height + (height - 1 - y), so a
+settled column is a run of low bits and gravity is a per-column compaction.
+The functions mirror the ones in engine.py and give the same results.
+"""
+from engine import GRID_WIDTH, GRID_HEIGHT, NUM_SERVICES, MIN_GROUP_SIZE, ROTATION_OFFSETS, Board
+
+_masks_cache = {}
+
+
+def _masks(width, height):
+    # (full, not_bottom, not_top, smear) masks for a board size.
+    # smear holds (shift, mask of rows >= shift) pairs used to fill a column upwards.
+    key = (width, height)
+    if key not in _masks_cache:
+        column = (1 << height) - 1
+        full = 0
+        bottom = 0
+        top = 0
+        for x in range(width):
+            full |= column << (x * height)
+            bottom |= 1 << (x * height)
+            top |= 1 << (x * height + height - 1)
+        smear = []
+        shift = 1
+        while shift < height:
+            rows = column ^ ((1 << shift) - 1)
+            smear.append((shift, sum(rows << (x * height) for x in range(width))))
+            shift *= 2
+        _masks_cache[key] = (full, full & ~bottom, full & ~top, tuple(smear))
+    return _masks_cache[key]
+
+
+class BitBoard:
+    """Board stored as one bitmask per service type.
+
+    occupied is the OR of the colors, kept up to date by the functions
+    here; set both at once with from_colors().
+    """
+
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.colors = [0] * NUM_SERVICES
+        self.occupied = 0
+
+    def copy(self):
+        board = BitBoard.__new__(BitBoard)
+        board.width = self.width
+        board.height = self.height
+        board.colors = self.colors[:]
+        board.occupied = self.occupied
+        return board
+
+    def bit(self, x, y):
+        return 1 << (x * self.height + self.height - 1 - y)
+
+    def get(self, x, y):
+        bit = self.bit(x, y)
+        for service_type, color in enumerate(self.colors):
+            if color & bit:
+                return service_type
+        return None
+
+    def set(self, x, y, service_type):
+        bit = self.bit(x, y)
+        colors = self.colors
+        for i in range(NUM_SERVICES):
+            colors[i] &= ~bit
+        if service_type is None:
+            self.occupied &= ~bit
+        else:
+            colors[service_type] |= bit
+            self.occupied |= bit
+
+
+def from_colors(colors, width=GRID_WIDTH, height=GRID_HEIGHT):
+    """A BitBoard on a list of colour masks, which it keeps and changes."""
+    bitboard = BitBoard.__new__(BitBoard)
+    bitboard.width = width
+    bitboard.height = height
+    bitboard.colors = colors
+    bitboard.occupied = colors[0] | colors[1] | colors[2] | colors[3] | colors[4]
+    return bitboard
+
+
+def from_board(board):
+    bitboard = BitBoard(board.width, board.height)
+    colors = bitboard.colors
+    height = board.height
+    for y, row in enumerate(board.cells):
+        for x, service_type in enumerate(row):
+            if service_type is not None:
+                colors[service_type] |= 1 << (x * height + height - 1 - y)
+    bitboard.occupied = colors[0] | colors[1] | colors[2] | colors[3] | colors[4]
+    return bitboard
+
+
+def to_board(bitboard):
+    board = Board(bitboard.width, bitboard.height)
+    height = bitboard.height
+    for service_type, color in enumerate(bitboard.colors):
+        while color:
+            low = color & -color
+            index = low.bit_length() - 1
+            x, row = divmod(index, height)
+            board.cells[height - 1 - row][x] = service_type
+            color ^= low
+    board.refresh()
+    return board
+
+
+def cells_of(bitboard, mask):
+    """Return the (y, x) cells of a mask in row-major order."""
+    height = bitboard.height
+    cells = []
+    while mask:
+        low = mask & -mask
+        x, row = divmod(low.bit_length() - 1, height)
+        cells.append((height - 1 - row, x))
+        mask ^= low
+    cells.sort()
+    return cells
+
+
+def is_valid_position(bitboard, piece):
+    width, height = bitboard.width, bitboard.height
+    x, y = piece.x, piece.y
+    dx, dy = ROTATION_OFFSETS[piece.rotation]
+    sub_x, sub_y = x + dx, y + dy
+    if not (0 <= x < width and 0 <= sub_x < width and y < height and sub_y < height):
+        return False
+    # Both cells in one mask, tested against every puyo at once
+    top = height - 1
+    cells = 0
+    if y >= 0:
+        cells = 1 << (x * height + top - y)
+    if sub_y >= 0:
+        cells |= 1 << (sub_x * height + top - sub_y)
+    return not cells & bitboard.occupied
+
+
+def column_heights(bitboard):
+    """Height of the highest puyo in each column, 0 for an empty column."""
+    occupied = bitboard.occupied
+    height = bitboard.height
+    column = (1 << height) - 1
+    return [((occupied >> (x * height)) & column).bit_length() for x in range(bitboard.width)]
+
+
+_gravity_cache = {}
+
+
+def _column_gravity(x, occupied, height):
+    # (stages, falls) that compact column x, of which occupied holds the
+    # puyos (in place on the board). A puyo falls by the number of holes
+    # below it, split into powers of two: stage k holds the bits that fall
+    # 2**k rows once the earlier stages have moved them (compress, from
+    # Hacker's Delight 7-4), as (k, mask) pairs. falls are the
+    # (x, from_y, to_y) of the puyos that move, bottom first.
+    cache = _gravity_cache.setdefault(height, {})
+    entry = cache.get(occupied)
+    if entry is None:
+        stages = {}
+        falls = []
+        base = x * height
+        top = height - 1
+        target = 0
+        for row in range(height):
+            if occupied >> (base + row) & 1:
+                if row != target:
+                    position = base + row
+                    for k in range(height.bit_length()):
+                        if (row - target) >> k & 1:
+                            stages[k] = stages.get(k, 0) | 1 << position
+                            position -= 1 << k
+                    falls.append((x, top - row, top - target))
+                target += 1
+        entry = cache[occupied] = (tuple(sorted(stages.items())), tuple(falls))
+    return entry
+
+
+_lanes_cache = {}
+
+
+def _lanes(width, height):
+    # (lane, repeat, lane mask): the colors side by side in one int, lane bits
+    # apart, and repeat, which copies a board mask into every lane
+    key = (width, height)
+    if key not in _lanes_cache:
+        lane = width * height
+        repeat = sum(1 << (service_type * lane) for service_type in range(NUM_SERVICES))
+        _lanes_cache[key] = (lane, repeat, (1 << lane) - 1)
+    return _lanes_cache[key]
+
+
+def _drop(bitboard, stages):
+    # Move the puyos of every color through the stages: the colors are
+    # packed into one int, so a stage is one shift and mask for all of them
+    lane, repeat, lane_mask = _lanes(bitboard.width, bitboard.height)
+    colors = bitboard.colors
+    packed = 0
+    for service_type, color in enumerate(colors):
+        packed |= color << (service_type * lane)
+    occupied = bitboard.occupied
+    for k, mask in enumerate(stages):
+        if mask:
+            occupied = (occupied & ~mask) | ((occupied & mask) >> (1 << k))
+            mask *= repeat
+            packed = (packed & ~mask) | ((packed & mask) >> (1 << k))
+    for service_type in range(NUM_SERVICES):
+        colors[service_type] = (packed >> (service_type * lane)) & lane_mask
+    bitboard.occupied = occupied
+
+
+def apply_gravity(bitboard):
+    """Compact every column downwards. Returns [(x, from_y, to_y)] like engine.apply_gravity.
+
+    The stages and falls of a column come from a table keyed by what the
+    column holds, filled in as column patterns are first seen.
+    """
+    height = bitboard.height
+    column = (1 << height) - 1
+    occupied = bitboard.occupied
+    stages = [0] * height.bit_length()
+    falls = []
+    for x in range(bitboard.width):
+        shift = x * height
+        occ = occupied & (column << shift)
+        # A settled column is a run of low bits
+        if occ & (occ + (1 << shift)):
+            column_stages, column_falls = _column_gravity(x, occ, height)
+            falls += column_falls
+            for k, mask in column_stages:
+                stages[k] |= mask
+    if falls:
+        _drop(bitboard, stages)
+    return falls
+
+
+def compact(bitboard):
+    """Apply gravity with whole-board bit operations. Returns True if anything fell.
+
+    Same final board as apply_gravity, without building the list of falls.
+    The stages of every column are worked out at once: a running parity of
+    the holes below each cell, kept within its column by the smear masks,
+    picks the puyos that fall 2**k rows at stage k.
+    """
+    full, not_bottom, _, smear = _masks(bitboard.width, bitboard.height)
+    occupied = bitboard.occupied
+    holes = ((full & ~occupied) << 1) & not_bottom  # Cells with a hole right below
+    above_hole = holes
+    for shift, rows in smear:
+        above_hole |= (above_hole << shift) & rows
+    if not occupied & above_hole:
+        return False
+    stages = []
+    for k in range(bitboard.height.bit_length()):
+        parity = holes
+        for shift, rows in smear:
+            parity ^= (parity << shift) & rows
+        moving = parity & occupied
+        occupied = (occupied ^ moving) | (moving >> (1 << k))
+        holes &= ~parity
+        stages.append(moving)
+    _drop(bitboard, stages)
+    return True
+
+
+def flood_fill(bitboard, seed, mask):
+    """Grow seed through 4-connected bits of mask."""
+    full, not_bottom, not_top, _ = _masks(bitboard.width, bitboard.height)
+    height = bitboard.height
+    group = seed
+    while True:
+        grown = (group
+                 | ((group << 1) & not_bottom)
+                 | ((group >> 1) & not_top)
+                 | ((group << height) & full)
+                 | (group >> height)) & mask
+        if grown == group:
+            return group
+        group = grown
+
+
+def find_group_masks(bitboard, colors=None):
+    """Return bitmasks of every group with MIN_GROUP_SIZE or more puyos."""
+    full, not_bottom, not_top, _ = _masks(bitboard.width, bitboard.height)
+    height = bitboard.height
+    groups = []
+    for mask in (bitboard.colors if colors is None else colors):
+        # Puyos with no same-colour neighbour can never be part of a group
+        mask &= ((mask << 1) & not_bottom) | ((mask >> 1) & not_top) | ((mask << height) & full) | (mask >> height)
+        while mask:
+            group = flood_fill(bitboard, mask & -mask, mask)
+            mask &= ~group
+            if group.bit_count() >= MIN_GROUP_SIZE:
+                groups.append(group)
+    return groups
+
+
+def find_connected_groups(bitboard):
+    """Same groups as engine.find_connected_groups, in the same scan order."""
+    groups = [cells_of(bitboard, mask) for mask in find_group_masks(bitboard)]
+    groups.sort()
+    return groups
+
+
+def clear_group_masks(bitboard, groups):
+    cleared = 0
+    for group in groups:
+        cleared |= group
+    colors = bitboard.colors
+    for service_type in range(NUM_SERVICES):
+        colors[service_type] &= ~cleared
+    bitboard.occupied &= ~cleared
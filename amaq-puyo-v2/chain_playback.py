@@ -0,0 +1,85 @@
+"""Time-based playback of a lock and its chain.
+
+engine.settle() resolves the whole chain at once. ChainPlayback turns the
+result into a timeline (lock, fall, blink, clear, ...) and hands out the
+events as their time comes, so the game loop keeps running every frame
+instead of waiting with pygame.time.delay(). Times are in milliseconds.
+"""
+
+# Default timings (milliseconds)
+FALL_DURATION = 50    # Pause after puyos fall so the move is visible
+BLINK_DURATION = 333  # How long cleared puyos blink before they pop
+CLEAR_DELAY = 800     # Pause between two steps of a chain
+
+
+class ChainEvent:
+    """One thing for the renderer to show. kind is lock, fall, blink, clear or end."""
+
+    def __init__(self, time, kind, cells=None, chain=0, score=0):
+        self.time = time
+        self.kind = kind
+        self.cells = cells
+        self.chain = chain
+        self.score = score
+
+
+def build_timeline(settlement, fall_duration=FALL_DURATION, blink_duration=BLINK_DURATION,
+                   clear_delay=CLEAR_DELAY):
+    events = [ChainEvent(0, 'lock', settlement.placed)]
+    time = 0
+    if settlement.falls:
+        events.append(ChainEvent(time, 'fall', settlement.falls))
+        time += fall_duration
+
+    for i, step in enumerate(settlement.steps):
+        if i > 0:
+            time += clear_delay
+        events.append(ChainEvent(time, 'blink', step.groups, step.chain))
+        time += blink_duration
+        events.append(ChainEvent(time, 'clear', step.groups, step.chain, step.score))
+        if step.falls:
+            events.append(ChainEvent(time, 'fall', step.falls, step.chain))
+            time += fall_duration
+
+    events.append(ChainEvent(time, 'end'))
+    return events
+
+
+class ChainPlayback:
+    """Plays a settlement back against a clock.
+
+    score, chain_count, total_cleared and max_chain start from the values
+    before the lock and follow the playback, so the HUD can show them while
+    GameState already holds the final values.
+    """
+
+    def __init__(self, settlement, score, total_cleared, max_chain, start_time, **timings):
+        self.events = build_timeline(settlement, **timings)
+        self.start_time = start_time
+        self.index = 0
+        self.score = score
+        self.total_cleared = total_cleared
+        self.max_chain = max_chain
+        self.chain_count = 0
+
+    @property
+    def done(self):
+        return self.index >= len(self.events)
+
+    def update(self, now):
+        """Return the events that are due at time now, in order."""
+        due = []
+        elapsed = now - self.start_time
+        while self.index < len(self.events) and self.events[self.index].time <= elapsed:
+            event = self.events[self.index]
+            self.index += 1
+            if event.kind == 'blink':
+                self.chain_count = event.chain
+                self.max_chain = max(self.max_chain, event.chain)
+                self.total_cleared += sum(len(group) for group in event.cells)
+            elif event.kind == 'clear':
+                self.score += event.score
+            elif event.kind == 'end':
+                self.chain_count = 0
+            due.append(event)
+        return due
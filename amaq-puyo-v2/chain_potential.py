@@ -0,0 +1,126 @@
+"""How long a chain one more puyo would start, for every column and colour.
+
+ChainPotential answers, for each column x and service type c: if a single
+puyo of type c were dropped in column x, how long would the chain be and
+what would it score. Boards are bitboard colour masks (see bitboard.py).
+
+Most drops start no chain: the new puyo joins a group of fewer than
+MIN_GROUP_SIZE, found with one flood fill. That answer only depends on
+the group and the cells around it, so it is kept with that support mask
+and stays valid until one of those cells changes. Drops that do start a
+chain are simulated step by step; their support is the columns the chain
+clears from and the areas of the puyos in them (_resolve_chain()), so a
+lock on the other side of the board keeps them too. update() compares
+the new board with the last one and works out only the answers whose
+support changed.
+
+    potential = ChainPotential()
+    potential.update(colors)
+    potential.chains[x][service_type], potential.scores[x][service_type]
+"""
+import ai
+import bitboard
+import engine
+
+WIDTH = ai.WIDTH
+HEIGHT = ai.HEIGHT
+FULL_MASK, NOT_BOTTOM_MASK, NOT_TOP_MASK, _ = bitboard._masks(WIDTH, HEIGHT)
+COLUMNS = [ai.COLUMN_MASK << (x * HEIGHT) for x in range(WIDTH)]
+
+
+def _around(area):
+    # area and every cell next to it
+    return (area | ((area << 1) & NOT_BOTTOM_MASK) | ((area >> 1) & NOT_TOP_MASK)
+            | ((area << HEIGHT) & FULL_MASK) | (area >> HEIGHT))
+
+
+def _resolve_chain(colors, cell, x):
+    """Resolve the chain a puyo dropped at cell of column x starts, like ai.resolve_chain().
+
+    Returns (chain length, score, support): the cells of the board before
+    the drop that the answer depends on. Those are the columns something
+    was cleared from, whose puyos fall, and the same-colour areas of the
+    puyos in them, with the cells around, which decide what forms a group.
+    """
+    board = bitboard.from_colors(colors, WIDTH, HEIGHT)
+    affected = COLUMNS[x]
+    seeds = cell
+    masks = [mask for mask in colors if mask & cell]
+    support = 0
+    gained = 0
+    chain = 0
+    while True:
+        # Every new group has a puyo in an affected column: the first one
+        # the dropped puyo, later ones a puyo that fell
+        for mask in colors:
+            support |= _around(bitboard.flood_fill(board, seeds & mask, mask))
+        groups = bitboard.find_group_masks(board, masks)
+        if not groups:
+            return chain, gained, support | affected
+        chain += 1
+        gained += sum(engine.group_score(group.bit_count(), chain) for group in groups)
+        for group in groups:
+            for column in COLUMNS:
+                if group & column:
+                    affected |= column
+        bitboard.clear_group_masks(board, groups)
+        bitboard.compact(board)
+        seeds = affected
+        masks = None
+
+
+class ChainPotential:
+    """Chain length and score of a one puyo drop per (column, service type), kept up to date."""
+
+    def __init__(self):
+        self.board = bitboard.BitBoard(WIDTH, HEIGHT)
+        self.chains = [[0] * engine.NUM_SERVICES for _ in range(WIDTH)]
+        self.scores = [[0] * engine.NUM_SERVICES for _ in range(WIDTH)]
+        # Cells each answer depends on; None until it is worked out
+        self.support = [[None] * engine.NUM_SERVICES for _ in range(WIDTH)]
+        self.evaluated = 0  # Answers worked out by the last update()
+        self.resolved = 0   # Of those, chains simulated
+
+    def update(self, colors):
+        """Bring the answers up to date with a board of colour masks."""
+        old = self.board.colors
+        changed = 0
+        for old_mask, new_mask in zip(old, colors):
+            changed |= old_mask ^ new_mask
+        self.board = bitboard.from_colors(list(colors), WIDTH, HEIGHT)
+        self.evaluated = 0
+        self.resolved = 0
+        for x in range(WIDTH):
+            for service_type in range(engine.NUM_SERVICES):
+                support = self.support[x][service_type]
+                if support is None or support & changed:
+                    self._evaluate(x, service_type)
+
+    def _evaluate(self, x, service_type):
+        self.evaluated += 1
+        board = self.board
+        colors = board.colors
+        height = (board.occupied >> (x * HEIGHT) & ai.COLUMN_MASK).bit_length()
+        if height >= HEIGHT:
+            # The column is full: the puyo would be lost
+            self._store(x, service_type, 0, 0, COLUMNS[x])
+            return
+
+        cell = 1 << (x * HEIGHT + height)
+        group = bitboard.flood_fill(board, cell, colors[service_type] | cell)
+        if group.bit_count() < engine.MIN_GROUP_SIZE:
+            # Valid while nothing in the group or next to it changes; the
+            # cell below the landing cell is next to it too
+            self._store(x, service_type, 0, 0, _around(group))
+            return
+
+        self.resolved += 1
+        trial = colors[:]
+        trial[service_type] |= cell
+        chain, gained, support = _resolve_chain(trial, cell, x)
+        self._store(x, service_type, chain, gained, support)
+
+    def _store(self, x, service_type, chain, score, support):
+        self.chains[x][service_type] = chain
+        self.scores[x][service_type] = score
+        self.support[x][service_type] = support
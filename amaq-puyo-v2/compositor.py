@@ -0,0 +1,110 @@
+"""Layered screen compositor with dirty-rect updates.
+
+Static layers (pre-rendered full-screen surfaces) are drawn once. Moving
+things are added every frame as surfaces with a position and an
+appearance value. Only items whose rect or appearance changed since the last frame,
+or that disappeared, make their area dirty. Dirty areas are rebuilt
+layer by layer and pushed with pygame.display.update(rects).
+"""
+import pygame
+
+MAX_DIRTY_RECTS = 24  # Above this, one full update is cheaper
+
+
+class Compositor:
+    """Keeps the screen up to date by redrawing only the areas that changed."""
+
+    def __init__(self, screen, layer_count):
+        self.screen = screen
+        self.static = [None] * layer_count
+        self.items = [[] for _ in range(layer_count)]
+        self.previous = {}
+        self.current = {}
+        self.dirty = []
+        self.full_redraw = True
+
+    def set_static(self, layer, surface):
+        """Use a full-screen surface as a layer. SRCALPHA surfaces are drawn over the layers below."""
+        self.static[layer] = surface
+        self.full_redraw = True
+
+    def invalidate(self, rect=None):
+        if rect is None:
+            self.full_redraw = True
+        else:
+            self.dirty.append(pygame.Rect(rect))
+
+    def add(self, layer, key, surface, position, appearance=None):
+        """Blit surface at position this frame. key names the item from frame to frame."""
+        rect = surface.get_rect(topleft=position)
+        self.items[layer].append((surface, rect))
+        self.current[key] = (rect, appearance)
+
+    def _collect_dirty(self):
+        previous = self.previous
+        dirty = self.dirty
+        for key, (rect, appearance) in self.current.items():
+            old = previous.pop(key, None)
+            if old is None:
+                dirty.append(rect)
+            elif old[1] != appearance or old[0] != rect:
+                dirty.append(old[0])
+                dirty.append(rect)
+        # Items that are gone this frame
+        for rect, _ in previous.values():
+            dirty.append(rect)
+        return _merge_rects(dirty)
+
+    def _draw_area(self, area):
+        screen = self.screen
+        screen.set_clip(area)
+        for layer, surface in enumerate(self.static):
+            if surface is not None:
+                screen.blit(surface, area, area)
+            for surface, rect in self.items[layer]:
+                if rect.colliderect(area):
+                    screen.blit(surface, rect)
+        screen.set_clip(None)
+
+    def draw_full(self):
+        """Draw every layer and item to the screen without updating the display."""
+        self._draw_area(self.screen.get_rect())
+
+    def end_frame(self, update_display=True):
+        """Redraw the dirty areas and push them to the display. Returns the rects updated."""
+        screen_rect = self.screen.get_rect()
+        if self.full_redraw:
+            rects = [screen_rect]
+        else:
+            rects = [rect.clip(screen_rect) for rect in self._collect_dirty()]
+            rects = [rect for rect in rects if rect.width > 0 and rect.height > 0]
+            if len(rects) > MAX_DIRTY_RECTS:
+                rects = [screen_rect]
+
+        for rect in rects:
+            self._draw_area(rect)
+        if update_display and rects:
+            pygame.display.update(rects)
+
+        self.previous = self.current
+        self.current = {}
+        self.items = [[] for _ in self.items]
+        self.dirty = []
+        self.full_redraw = False
+        return rects
+
+
+def _merge_rects(rects):
+    # Join overlapping rects so no area is drawn twice
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        i = 0
+        while i < len(merged):
+            if merged[i].colliderect(rect):
+                rect.union_ip(merged.pop(i))
+                i = 0
+            else:
+                i += 1
+        merged.append(rect)
+    return merged
@@ -0,0 +1,573 @@
+"""Headless Puyo rules engine.
+
+Everything in here is plain Python: no pygame and no wall-clock time, so a
+game can be simulated as fast as the CPU allows. main.py draws on top of it.
+"""
+import random
+
+# Board size
+GRID_WIDTH = 6
+GRID_HEIGHT = 14
+
+# Service types
+SERVICE_CLOUDTRAIL = 0  # Red
+SERVICE_AURORA = 1      # Blue
+SERVICE_EC2 = 2         # Yellow
+SERVICE_S3 = 3          # Green
+SERVICE_VPC = 4         # Purple
+NUM_SERVICES = 5
+
+# Rules
+MIN_GROUP_SIZE = 4       # Groups of this size or larger are cleared
+POINTS_PER_PUYO = 10     # Base score for every cleared puyo
+POINTS_PER_LEVEL = 1000  # Score needed for each level
+INITIAL_FALL_SPEED = 0.5 # Seconds per row at level 1
+MIN_FALL_SPEED = 0.1
+FALL_SPEED_STEP = 0.05
+
+# Fixed simulation step
+TICK_RATE = 120        # Ticks per second
+FAST_DROP_TICKS = 4    # Ticks between rows while the down key is held
+
+# Inputs for one tick, combined as a bitmask
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_ROTATE = 4
+INPUT_DOWN = 8         # Held, not pressed
+
+# Position of the sub puyo relative to the main puyo for each rotation
+# 0: sub below, 1: sub right, 2: sub above, 3: sub left
+ROTATION_OFFSETS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+# Every (column, rotation) of place() that keeps the pair on the board
+ACTIONS = [(x, rotation) for x in range(GRID_WIDTH) for rotation in range(4)
+           if 0 <= x + ROTATION_OFFSETS[rotation][0] < GRID_WIDTH]
+
+MASK64 = (1 << 64) - 1
+
+
+class Board:
+    """Grid of service types, None for an empty cell. Indexed cells[y][x].
+
+    Indexes kept up to date by the engine functions:
+    - heights: number of puyos stacked in each column (exact once gravity has run)
+    - dirty: (x, y) cells filled since the last find_dirty_groups()
+    - dirty_columns: columns that may have holes, compacted by the next apply_gravity()
+    Code that writes to cells directly must call set() or refresh().
+    """
+
+    def __init__(self, width=GRID_WIDTH, height=GRID_HEIGHT):
+        self.width = width
+        self.height = height
+        self.cells = [[None] * width for _ in range(height)]
+        self.heights = [0] * width
+        self.dirty = set()
+        self.dirty_columns = set()
+
+    def copy(self):
+        board = Board.__new__(Board)
+        board.width = self.width
+        board.height = self.height
+        board.cells = [row[:] for row in self.cells]
+        board.heights = self.heights[:]
+        board.dirty = set(self.dirty)
+        board.dirty_columns = set(self.dirty_columns)
+        return board
+
+    def get(self, x, y):
+        return self.cells[y][x]
+
+    def set(self, x, y, service_type):
+        self.cells[y][x] = service_type
+        self.dirty_columns.add(x)
+        if service_type is not None:
+            self.dirty.add((x, y))
+            self.heights[x] = max(self.heights[x], self.height - y)
+
+    def refresh(self):
+        """Rebuild the indexes after writing to cells directly."""
+        self.dirty = set()
+        self.heights = [0] * self.width
+        for y in range(self.height - 1, -1, -1):
+            for x, service_type in enumerate(self.cells[y]):
+                if service_type is not None:
+                    self.dirty.add((x, y))
+                    self.heights[x] = self.height - y
+        self.dirty_columns = set(range(self.width))
+
+
+class Piece:
+    """A falling pair: the main puyo plus a sub puyo placed by rotation."""
+
+    def __init__(self, main_type, sub_type, x, y=0, rotation=0):
+        self.main_type = main_type
+        self.sub_type = sub_type
+        self.x = x
+        self.y = y
+        self.rotation = rotation
+
+    def copy(self):
+        return Piece(self.main_type, self.sub_type, self.x, self.y, self.rotation)
+
+    def sub_position(self):
+        dx, dy = ROTATION_OFFSETS[self.rotation]
+        return self.x + dx, self.y + dy
+
+    def cells(self):
+        """Return [(x, y, service_type)] for the main and sub puyo."""
+        sub_x, sub_y = self.sub_position()
+        return [(self.x, self.y, self.main_type), (sub_x, sub_y, self.sub_type)]
+
+
+class ChainStep:
+    """One clear in a chain: the groups removed, the points and the falls."""
+
+    def __init__(self, chain, groups, score, falls):
+        self.chain = chain
+        self.groups = groups
+        self.score = score
+        self.falls = falls
+
+
+class PieceQueue:
+    """Seeded piece colours, independent of any other randomness.
+
+    Pair i is a pure function of (seed, i), so the queue position is all
+    there is to save, and looking ahead never changes what comes next.
+    """
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.randrange(1 << 63)
+        self.seed = seed
+        self.index = 0
+
+    def pair(self, index):
+        """Return (main_type, sub_type) of pair number index."""
+        # splitmix64 of the seed and the index
+        z = (self.seed * 0x9E3779B97F4A7C15 + (index + 1) * 0xBF58476D1CE4E5B9) & MASK64
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK64
+        z ^= z >> 31
+        return (z >> 32) % NUM_SERVICES, (z & 0xFFFFFFFF) % NUM_SERVICES
+
+    def peek(self, count):
+        return [self.pair(self.index + i) for i in range(count)]
+
+    def next_pair(self):
+        pair = self.pair(self.index)
+        self.index += 1
+        return pair
+
+
+class LevelCurve:
+    """How fast pieces fall as the score goes up."""
+
+    def __init__(self, points_per_level=POINTS_PER_LEVEL, initial_fall_speed=INITIAL_FALL_SPEED,
+                 fall_speed_step=FALL_SPEED_STEP, min_fall_speed=MIN_FALL_SPEED):
+        self.points_per_level = points_per_level
+        self.initial_fall_speed = initial_fall_speed
+        self.fall_speed_step = fall_speed_step
+        self.min_fall_speed = min_fall_speed
+
+    def level(self, score):
+        return 1 + score // self.points_per_level
+
+    def fall_speed(self, level):
+        """Seconds per row at level."""
+        if level <= 1:
+            return self.initial_fall_speed
+        return max(self.min_fall_speed, self.initial_fall_speed - (level - 1) * self.fall_speed_step)
+
+
+DEFAULT_CURVE = LevelCurve()
+
+
+class Settlement:
+    """Everything that happened from locking a piece to the next spawn."""
+
+    def __init__(self, placed, falls, steps, game_over):
+        self.placed = placed
+        self.falls = falls
+        self.steps = steps
+        self.game_over = game_over
+
+
+class GameState:
+    """All the state of one game. The same seed and inputs always give the same game."""
+
+    def __init__(self, seed=None, width=GRID_WIDTH, height=GRID_HEIGHT, curve=DEFAULT_CURVE):
+        self.queue = PieceQueue(seed)
+        self.curve = curve
+        self.board = Board(width, height)
+        self.current_piece = None
+        self.next_piece = None
+        self.game_over = False
+        self.score = 0
+        self.level = 1
+        self.fall_speed = curve.fall_speed(1)
+        self.chain_count = 0
+        self.max_chain = 0
+        self.total_cleared = 0
+        self.ticks = 0         # Ticks simulated so far
+        self.fall_timer = 0    # Ticks since the piece last fell a row
+        self.drop_timer = 0    # Ticks since the last fast drop row
+
+
+def new_game(seed=None, width=GRID_WIDTH, height=GRID_HEIGHT, curve=DEFAULT_CURVE):
+    state = GameState(seed, width, height, curve)
+    spawn_piece(state)
+    return state
+
+
+def random_piece(state):
+    main_type, sub_type = state.queue.next_pair()
+    return Piece(main_type, sub_type, state.board.width // 2, 0)
+
+
+def spawn_piece(state):
+    if state.next_piece is None:
+        state.next_piece = random_piece(state)
+
+    state.current_piece = state.next_piece
+    state.next_piece = random_piece(state)
+    return state.current_piece
+
+
+def is_valid_position(board, piece):
+    # Check if the piece is within bounds and not colliding with placed puyos.
+    # The board is settled while a piece falls, so each column is full below its height.
+    heights = board.heights
+    floor = board.height
+    for x, y, _ in piece.cells():
+        if x < 0 or x >= board.width or y >= floor:
+            return False
+        if y >= floor - heights[x]:
+            return False
+    return True
+
+
+def move_piece(state, dx, dy):
+    piece = state.current_piece
+    piece.x += dx
+    piece.y += dy
+    if not is_valid_position(state.board, piece):
+        piece.x -= dx
+        piece.y -= dy
+        return False
+    return True
+
+
+def rotate_piece(state, clockwise=True):
+    board = state.board
+    piece = state.current_piece
+    orig_x, orig_y, orig_rotation = piece.x, piece.y, piece.rotation
+
+    piece.rotation = (piece.rotation + (1 if clockwise else 3)) % 4
+
+    if not is_valid_position(board, piece):
+        # Try wall kick - push the whole piece away from the wall the sub hit
+        sub_x, sub_y = piece.sub_position()
+        if sub_x < 0:
+            piece.x += 1
+        elif sub_x >= board.width:
+            piece.x -= 1
+        elif sub_y < 0:
+            piece.y += 1
+        elif sub_y >= board.height:
+            piece.y -= 1
+
+        if not is_valid_position(board, piece):
+            piece.x, piece.y, piece.rotation = orig_x, orig_y, orig_rotation
+            return False
+    return True
+
+
+def drop_position(board, piece):
+    """Return a copy of piece moved down as far as it can go, read from the column heights."""
+    landed = piece.copy()
+    sub_x, sub_y = piece.sub_position()
+    floor = board.height
+    if sub_x == piece.x:
+        # Vertical pair: the lower puyo rests on the column
+        lowest = max(piece.y, sub_y)
+        distance = floor - board.heights[piece.x] - 1 - lowest
+    else:
+        distance = min(floor - board.heights[piece.x] - 1 - piece.y,
+                       floor - board.heights[sub_x] - 1 - sub_y)
+    landed.y += max(0, distance)
+    return landed
+
+
+def landing_positions(board, x):
+    """Where a pair whose main puyo is in column x lands, for each rotation.
+
+    Returns a tuple indexed by rotation of ((main_x, main_y), (sub_x, sub_y)),
+    or None where the sub puyo would be outside the board. Only the column
+    heights are read, so the cost does not depend on how high the pair is.
+    The pair is assumed to be in a valid position above the stack.
+    """
+    floor = board.height
+    heights = board.heights
+    positions = []
+    for dx, dy in ROTATION_OFFSETS:
+        sub_x = x + dx
+        if not 0 <= sub_x < board.width:
+            positions.append(None)
+        elif dx == 0:
+            # Vertical pair: the lower puyo rests on the column
+            lowest = floor - heights[x] - 1
+            positions.append(((x, lowest - max(dy, 0)), (x, lowest + min(dy, 0))))
+        else:
+            # Horizontal pair: both stop on the higher of the two columns
+            y = floor - max(heights[x], heights[sub_x]) - 1
+            positions.append(((x, y), (sub_x, y)))
+    return tuple(positions)
+
+
+def hard_drop(state):
+    drop_distance = 0
+    while move_piece(state, 0, 1):
+        drop_distance += 1
+    return drop_distance
+
+
+def lock_piece(state):
+    """Write the current piece into the board. Returns the [(x, y, service_type)] placed."""
+    board = state.board
+    placed = []
+    for x, y, service_type in state.current_piece.cells():
+        # Parts of the piece above the board are lost
+        if 0 <= y < board.height and 0 <= x < board.width:
+            board.set(x, y, service_type)
+            placed.append((x, y, service_type))
+    state.current_piece = None
+    return placed
+
+
+def apply_gravity(board):
+    """Compact the dirty columns downwards. Returns [(x, from_y, to_y)] for moved puyos."""
+    cells = board.cells
+    dirty = board.dirty
+    falls = []
+    for x in sorted(board.dirty_columns):
+        target_y = board.height - 1
+        for y in range(board.height - 1, -1, -1):
+            service_type = cells[y][x]
+            if service_type is None:
+                continue
+            if y != target_y:
+                cells[target_y][x] = service_type
+                cells[y][x] = None
+                falls.append((x, y, target_y))
+                dirty.add((x, target_y))
+            target_y -= 1
+        board.heights[x] = board.height - 1 - target_y
+    board.dirty_columns.clear()
+    return falls
+
+
+def _collect_group(board, x, y, visited):
+    # Iterative flood fill from (x, y) over puyos of the same service type
+    cells = board.cells
+    width, height = board.width, board.height
+    service_type = cells[y][x]
+    visited.add((y, x))
+    group = [(y, x)]
+    stack = [(y, x)]
+    while stack:
+        cy, cx = stack.pop()
+        for ny, nx in ((cy + 1, cx), (cy - 1, cx), (cy, cx + 1), (cy, cx - 1)):
+            if (0 <= ny < height and 0 <= nx < width and
+                    cells[ny][nx] == service_type and (ny, nx) not in visited):
+                visited.add((ny, nx))
+                group.append((ny, nx))
+                stack.append((ny, nx))
+    return group
+
+
+def find_connected_groups(board):
+    """Return groups of (y, x) cells with MIN_GROUP_SIZE or more connected puyos."""
+    cells = board.cells
+    visited = set()
+    groups = []
+
+    for y in range(board.height):
+        for x in range(board.width):
+            if cells[y][x] is not None and (y, x) not in visited:
+                group = _collect_group(board, x, y, visited)
+                if len(group) >= MIN_GROUP_SIZE:
+                    groups.append(group)
+
+    board.dirty.clear()
+    return groups
+
+
+def find_dirty_groups(board):
+    """Like find_connected_groups, but only searches from the dirty cells.
+
+    A board with no groups can only gain one through a cell that was filled
+    since, so this finds the same groups as a full scan after a lock or a
+    gravity pass, and clears the dirty set.
+    """
+    cells = board.cells
+    visited = set()
+    groups = []
+
+    for x, y in sorted(board.dirty, key=lambda cell: (cell[1], cell[0])):
+        if cells[y][x] is not None and (y, x) not in visited:
+            group = _collect_group(board, x, y, visited)
+            if len(group) >= MIN_GROUP_SIZE:
+                groups.append(group)
+
+    board.dirty.clear()
+    return groups
+
+
+def group_score(group_size, chain):
+    # Base score plus 50% per chain step after the first
+    return int(group_size * POINTS_PER_PUYO * (1 + (chain - 1) * 0.5))
+
+
+def start_chain_step(state, groups):
+    """Count a new chain step for groups that are about to be cleared."""
+    state.chain_count += 1
+    state.max_chain = max(state.max_chain, state.chain_count)
+    state.total_cleared += sum(len(group) for group in groups)
+
+
+def clear_groups(state, groups):
+    """Remove groups from the board and score them. Returns the points gained."""
+    gained = 0
+    board = state.board
+    for group in groups:
+        gained += group_score(len(group), state.chain_count)
+        for y, x in group:
+            board.cells[y][x] = None
+            board.dirty_columns.add(x)
+    state.score += gained
+    return gained
+
+
+def end_chain(state):
+    state.chain_count = 0
+
+
+def check_game_over(board):
+    # Game is over if there are puyos in the top row
+    return max(board.heights) >= board.height
+
+
+def update_level(state):
+    new_level = state.curve.level(state.score)
+    if new_level > state.level:
+        state.level = new_level
+        state.fall_speed = state.curve.fall_speed(state.level)
+
+
+def resolve_chain(state):
+    """Clear groups and apply gravity until the board is stable."""
+    steps = []
+    while True:
+        groups = find_dirty_groups(state.board)
+        if not groups:
+            break
+        start_chain_step(state, groups)
+        gained = clear_groups(state, groups)
+        falls = apply_gravity(state.board)
+        steps.append(ChainStep(state.chain_count, groups, gained, falls))
+    end_chain(state)
+    return steps
+
+
+def settle(state):
+    """Lock the current piece and resolve everything up to the next spawn.
+
+    Returns a Settlement, so a renderer can play the chain back over time.
+    """
+    placed = lock_piece(state)
+    falls = apply_gravity(state.board)
+    if check_game_over(state.board):
+        state.game_over = True
+        return Settlement(placed, falls, [], True)
+
+    # The level is checked before the chain is scored, as in the game
+    update_level(state)
+    steps = resolve_chain(state)
+    spawn_piece(state)
+    return Settlement(placed, falls, steps, False)
+
+
+def place(state, column, rotation):
+    """Drop the current piece straight down with its main puyo in column and settle it.
+
+    For AIs and batch simulation: the piece lands where landing_positions()
+    says, without checking that it could have been moved there. Parts that
+    land above the board are lost, as in lock_piece(). Returns the Settlement.
+    """
+    if state.current_piece is None:
+        spawn_piece(state)
+    board = state.board
+    if not 0 <= column < board.width:
+        raise ValueError("Column is outside the board")
+    landed = landing_positions(board, column)[rotation]
+    if landed is None:
+        raise ValueError("Piece would be outside the board")
+
+    piece = state.current_piece
+    piece.x, piece.y = landed[0]
+    piece.rotation = rotation
+    return settle(state)
+
+
+def fall_interval(state):
+    """Ticks between automatic falls at the current level."""
+    return max(1, round(state.fall_speed * TICK_RATE))
+
+
+def tick(state, inputs=0):
+    """Advance the game by one fixed step of 1 / TICK_RATE seconds.
+
+    inputs is a mask of INPUT_* values for this tick. Returns the
+    Settlement if the piece locked, else None.
+    """
+    if state.game_over:
+        return None
+    state.ticks += 1
+    if state.current_piece is None:
+        spawn_piece(state)
+
+    if inputs & INPUT_LEFT:
+        move_piece(state, -1, 0)
+    if inputs & INPUT_RIGHT:
+        move_piece(state, 1, 0)
+    if inputs & INPUT_ROTATE:
+        rotate_piece(state)
+
+    if inputs & INPUT_DOWN:
+        # The first row drops as soon as the key goes down
+        state.drop_timer += 1
+        if state.drop_timer >= FAST_DROP_TICKS:
+            move_piece(state, 0, 1)
+            state.drop_timer = 0
+    else:
+        state.drop_timer = FAST_DROP_TICKS - 1
+
+    state.fall_timer += 1
+    if state.fall_timer >= fall_interval(state):
+        state.fall_timer = 0
+        if not move_piece(state, 0, 1):
+            return settle(state)
+    return None
+
+
+def step(state):
+    """Advance the falling piece by one row. Returns True if it was locked."""
+    if state.game_over:
+        return False
+    if state.current_piece is None:
+        spawn_piece(state)
+    if move_piece(state, 0, 1):
+        return False
+    settle(state)
+    return True
@@ -0,0 +1,220 @@
+"""The engine as an environment that agents drive one placement at a time.
+
+    env = PuyoEnv()
+    observation = env.reset(seed=1)
+    while True:
+        observation, reward, done, info = env.step((column, rotation))
+        if done:
+            break
+
+An action places the current pair with its main puyo in column and the
+given rotation (engine.place()). The observation is a dict of int8 arrays:
+'board' is (height, width) with batch_engine.EMPTY where there is no puyo,
+and 'pieces' is [[current main, current sub], [next main, next sub]]. The
+reward is the score the placement earned.
+
+VectorEnv runs many environments in worker processes and steps them all
+with one call, so an agent can collect samples on every core:
+
+    envs = VectorEnv(64)
+    observations = envs.reset(seed=1)
+    observations, rewards, dones, infos = envs.step(actions)  # one per env
+    envs.close()
+"""
+import multiprocessing
+import pickle
+import traceback
+
+import numpy as np
+
+import batch_engine
+import engine
+
+ACTIONS = engine.ACTIONS
+_ACTION_SET = frozenset(ACTIONS)
+
+
+class PuyoEnv:
+    """One game, reset() and step() like a gym environment."""
+
+    def __init__(self):
+        self.state = None
+
+    def reset(self, seed=None):
+        self.state = engine.new_game(seed)
+        return self.observation()
+
+    def step(self, action):
+        """Place the current pair. Returns (observation, reward, done, info)."""
+        state = self.state
+        if state is None or state.game_over:
+            raise RuntimeError("Call reset() before step()")
+        column, rotation = action
+        score = state.score
+        cleared = state.total_cleared
+        settlement = engine.place(state, column, rotation)
+        info = {
+            'chain': len(settlement.steps),
+            'cleared': state.total_cleared - cleared,
+            'score': state.score,
+        }
+        return self.observation(), state.score - score, state.game_over, info
+
+    def observation(self):
+        state = self.state
+        # At game over nothing spawned, so the pieces come from the queue
+        pairs = [(piece.main_type, piece.sub_type)
+                 for piece in (state.current_piece, state.next_piece) if piece is not None]
+        pairs += state.queue.peek(2 - len(pairs))
+        pieces = np.array(pairs, dtype=np.int8)
+        return {'board': batch_engine.from_board(state.board), 'pieces': pieces}
+
+
+def stack_observations(observations):
+    return {key: np.stack([observation[key] for observation in observations])
+            for key in ('board', 'pieces')}
+
+
+class RemoteTraceback(Exception):
+    """The traceback of an exception raised in a VectorEnv worker, as its cause."""
+
+    def __str__(self):
+        return self.args[0]
+
+
+def _worker(connection, count):
+    # Runs count environments and answers commands until told to close.
+    # Every answer is ('ok', result) or ('error', (exception, traceback))
+    envs = [PuyoEnv() for _ in range(count)]
+    seeds = [None] * count
+    stride = 0
+    while True:
+        command, data = connection.recv()
+        if command == 'close':
+            connection.close()
+            return
+        try:
+            if command == 'reset':
+                seeds, stride = data
+                result = stack_observations([env.reset(seed) for env, seed in zip(envs, seeds)])
+            elif command == 'step':
+                observations, rewards, dones, infos = [], [], [], []
+                for i, (env, action) in enumerate(zip(envs, data)):
+                    observation, reward, done, info = env.step(action)
+                    if done:
+                        # Start the next game straight away, as gym's vector envs do
+                        info['final_observation'] = observation
+                        if seeds[i] is not None:
+                            seeds[i] += stride
+                        observation = env.reset(seeds[i])
+                    observations.append(observation)
+                    rewards.append(reward)
+                    dones.append(done)
+                    infos.append(info)
+                result = (stack_observations(observations), rewards, dones, infos)
+            else:
+                raise ValueError(f"Unknown command {command!r}")
+        except Exception as e:
+            try:
+                pickle.dumps(e)
+            except Exception:
+                e = RuntimeError(repr(e))
+            connection.send(('error', (e, traceback.format_exc())))
+        else:
+            connection.send(('ok', result))
+
+
+class VectorEnv:
+    """count PuyoEnvs spread over worker processes, stepped together.
+
+    Each worker runs a slice of the environments, so one message per
+    worker and step carries all of its actions. Finished games restart
+    straight away, environment i with seeds seed + i + k * count; the last
+    observation of a finished game is in its info as 'final_observation'.
+    An exception in a worker is raised again by the call that caused it,
+    with the worker's traceback as its cause; the workers keep running.
+    step() checks every action before sending any, so a bad action raises
+    ValueError with every environment left where it was.
+    """
+
+    def __init__(self, count, workers=None):
+        workers = min(count, workers or multiprocessing.cpu_count())
+        self.count = count
+        sizes = [count // workers + (i < count % workers) for i in range(workers)]
+        self.slices = []
+        self.connections = []
+        self.processes = []
+        start = 0
+        for size in sizes:
+            parent, child = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_worker, args=(child, size), daemon=True)
+            process.start()
+            child.close()
+            self.slices.append(slice(start, start + size))
+            self.connections.append(parent)
+            self.processes.append(process)
+            start += size
+
+    def __len__(self):
+        return self.count
+
+    def reset(self, seed=None):
+        """Reset every environment; environment i gets seed + i (random seeds if seed is None)."""
+        if seed is None:
+            seeds = [None] * self.count
+        else:
+            seeds = list(range(seed, seed + self.count))
+        for connection, part in zip(self.connections, self.slices):
+            connection.send(('reset', (seeds[part], self.count)))
+        return self._gather(self._receive())
+
+    def step(self, actions):
+        """Step environment i with actions[i]. Returns stacked observations, rewards, dones and infos."""
+        actions = [tuple(action) for action in np.asarray(actions).tolist()]
+        if len(actions) != self.count:
+            raise ValueError(f"Expected {self.count} actions, got {len(actions)}")
+        # A worker that failed halfway through its slice would leave some
+        # environments stepped and their results lost
+        for i, action in enumerate(actions):
+            if action not in _ACTION_SET:
+                raise ValueError(f"Action {action!r} of environment {i} is not in ACTIONS")
+        for connection, part in zip(self.connections, self.slices):
+            connection.send(('step', actions[part]))
+        results = self._receive()
+        observations = self._gather([result[0] for result in results])
+        rewards = np.array([reward for result in results for reward in result[1]], dtype=np.int64)
+        dones = np.array([done for result in results for done in result[2]])
+        infos = [info for result in results for info in result[3]]
+        return observations, rewards, dones, infos
+
+    def _receive(self):
+        # The answer of every worker; the first error is raised here once all have answered
+        results = []
+        error = None
+        for connection in self.connections:
+            status, result = connection.recv()
+            if status == 'error' and error is None:
+                error = result
+            results.append(result)
+        if error is not None:
+            exception, remote_traceback = error
+            raise exception from RemoteTraceback(remote_traceback)
+        return results
+
+    def _gather(self, parts):
+        return {key: np.concatenate([part[key] for part in parts]) for key in ('board', 'pieces')}
+
+    def close(self):
+        for connection in self.connections:
+            connection.send(('close', None))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,150 @@
+"""Best-move hints searched in a separate process.
+
+HintWorker runs this file as a child process and talks to it through
+its stdin and stdout with pickled messages. request() writes a request
+and returns at once. A reader thread waits for the answers and hands the
+newest one over by assigning a single attribute, which the game reads
+without taking a lock or waiting.
+
+Every request has a number. A new request or cancel() makes the older
+ones stale: the child stops searching them and their answers are
+ignored. close() returns at once; the child drops its search and exits,
+and the reader thread reaps it. If the child dies on its own, requests
+are dropped and hint() stays None, so hints never fail the game. The
+search is pure Python, so it runs in a process of its own rather than a
+thread, where it would hold the GIL away from the frame loop.
+
+    hints = HintWorker()
+    request_id = hints.request(game)
+    ...
+    move = hints.hint(request_id)  # (column, rotation), or None until it is ready
+"""
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+
+import ai
+import bitboard
+
+
+class HintWorker:
+    """The parent side: sends requests and collects answers."""
+
+    def __init__(self, depth=2, beam_width=len(ai.ACTIONS), time_budget=0.1):
+        self.process = subprocess.Popen(
+            [sys.executable, __file__, str(depth), str(beam_width), str(time_budget)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.request_id = 0
+        # (request_id, move, search seconds, cancelled) of the newest answer
+        self.latest = None
+        self.dead = False  # The child has exited; set by the reader thread
+        # Statistics, only written by the reader thread
+        self.answers = 0
+        self.cancelled = 0
+        self.search_time = 0.0
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+
+    def request(self, state):
+        """Ask for a move for the current piece of an engine.GameState. Returns the request id."""
+        pairs = [(piece.main_type, piece.sub_type)
+                 for piece in (state.current_piece, state.next_piece) if piece is not None]
+        colors = tuple(bitboard.from_board(state.board).colors)
+        self.request_id += 1
+        self._send((self.request_id, colors, pairs))
+        return self.request_id
+
+    def cancel(self):
+        """Make every request so far stale."""
+        self.request_id += 1
+        self._send((self.request_id, None, None))
+
+    def hint(self, request_id):
+        """The move for request_id once it has arrived, else None."""
+        latest = self.latest
+        if latest is None or latest[0] != request_id or latest[3]:
+            return None
+        return latest[1]
+
+    def _send(self, message):
+        if self.dead:
+            return
+        try:
+            pickle.dump(message, self.process.stdin)
+            self.process.stdin.flush()
+        except OSError:
+            # The child died before the reader thread noticed
+            self.dead = True
+
+    def _read(self):
+        while True:
+            try:
+                answer = pickle.load(self.process.stdout)
+            except (EOFError, OSError):
+                # The child is exiting: reap it here rather than in close()
+                self.process.wait()
+                self.dead = True
+                return
+            if answer[3]:
+                self.cancelled += 1
+            else:
+                self.answers += 1
+                self.search_time += answer[2]
+            # One assignment: the game sees either the old answer or the new one
+            self.latest = answer
+
+    def close(self):
+        """Stop the child without waiting for it: it drops its search and exits."""
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass  # Unsent data for a child that is gone
+
+
+def serve(depth, beam_width, time_budget):
+    # The child side: search the newest request, stop when a newer one comes
+    if hasattr(os, 'nice'):
+        # The game gets the CPU first when there are not enough cores for both
+        os.nice(10)
+    search = ai.BeamSearch(depth, beam_width, time_budget)
+    stdin, stdout = sys.stdin.buffer, sys.stdout.buffer
+    newest = None
+    arrived = threading.Event()
+    closed = False
+
+    def read():
+        nonlocal newest, closed
+        while True:
+            try:
+                newest = pickle.load(stdin)
+            except EOFError:
+                closed = True
+            arrived.set()
+            if closed:
+                return
+
+    threading.Thread(target=read, daemon=True).start()
+    while True:
+        arrived.wait()
+        arrived.clear()
+        if closed:
+            return
+        request = newest
+        request_id, colors, pairs = request
+        if colors is None:
+            continue
+        start = time.perf_counter()
+        best = search.best_node(colors, pairs, start + time_budget, lambda: closed or newest is not request)
+        if closed:
+            return
+        cancelled = search.depth_reached < len(pairs) and newest is not request
+        move = best[4] if best is not None else ai.ACTIONS[0]
+        pickle.dump((request_id, move, time.perf_counter() - start, cancelled), stdout)
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    serve(int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]))
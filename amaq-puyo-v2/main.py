@@ -4,7 +4,57 @@ import random
 import math
 import os
 import time
+import argparse
+import asyncio
+import collections
+import threading
 from pygame.locals import *
+import ai
+import bitboard
+import engine
+import netplay
+import replay
+import snapshot
+import spectate
+from chain_potential import ChainPotential
+from hints import HintWorker
+from engine import GRID_WIDTH, GRID_HEIGHT
+from chain_playback import ChainPlayback
+from compositor import Compositor
+from text_cache import TextCache
+from sprite_atlas import SpriteAtlas
+from particles import ParticleSystem
+from wall import BoardWall
+
+# Command line options
+parser = argparse.ArgumentParser(description='AWS Puyo Puyo')
+parser.add_argument('--seed', type=int, help='Seed for the piece colours')
+parser.add_argument('--record', metavar='PATH',
+                    help='Save a replay of each game, numbered: PATH-1.pyrp, PATH-2.pyrp, ...')
+parser.add_argument('--replay', metavar='PATH', help='Play back a replay file at real speed')
+parser.add_argument('--stats', action='store_true',
+                    help='Print frame times, missed frames and surfaces allocated per frame once a second')
+parser.add_argument('--hints', action='store_true', help='Show the suggested move from the start (H key)')
+parser.add_argument('--cpu', action='store_true', help='Let the beam search AI play')
+parser.add_argument('--practice', action='store_true',
+                    help='Practice mode: Backspace rewinds to where the last piece appeared')
+parser.add_argument('--versus', metavar='HOST:PORT',
+                    help='Play against another copy of the game at HOST:PORT over UDP (same --seed on both)')
+parser.add_argument('--port', type=int, default=47474, help='UDP port to listen on with --versus')
+parser.add_argument('--net-latency', type=float, default=0.0, metavar='MS',
+                    help='Hold back every packet this long, for trying --versus on one machine')
+parser.add_argument('--net-loss', type=float, default=0.0, metavar='FRACTION',
+                    help='Drop this fraction of the packets, for trying --versus on one machine')
+parser.add_argument('--spectate-port', type=int, metavar='PORT',
+                    help='Let spectators watch the game live over TCP on PORT')
+parser.add_argument('--wall', type=int, metavar='N', help='Show N AI games side by side instead of playing')
+parser.add_argument('--watch', metavar='HOST:PORT',
+                    help='Watch the games of a --spectate-port game at HOST:PORT side by side')
+args = parser.parse_args()
+if args.practice and args.versus:
+    # A rewind would change the local game under the other player's copy of it
+    parser.error("--practice cannot be used with --versus")
+replay_file = replay.load(args.replay) if args.replay else None
 
 # Initialize pygame
 pygame.init()
@@ -13,17 +63,52 @@ pygame.init()
 SCREEN_WIDTH = 600
 SCREEN_HEIGHT = 700
 GRID_SIZE = 40
-GRID_WIDTH = 6
-GRID_HEIGHT = 14
 BOARD_LEFT = 50  # Move board to the left side
 BOARD_TOP = (SCREEN_HEIGHT - GRID_HEIGHT * GRID_SIZE) // 2
 FPS = 60
 
+# Side panel, to the right of the board
+NEXT_AREA_X = BOARD_LEFT + GRID_WIDTH * GRID_SIZE + 30
+NEXT_AREA_Y = BOARD_TOP
+INFO_AREA_Y = NEXT_AREA_Y + 150
+STATS_Y = INFO_AREA_Y + 80
+CONTROLS_Y = STATS_Y + 100
+HEATMAP_Y = CONTROLS_Y + 155
+HEATMAP_CELL = (30, 22)  # Width and height of a heatmap cell
+REMOTE_X = NEXT_AREA_X + 135  # The other player's board in versus mode
+REMOTE_Y = NEXT_AREA_Y - 22
+REMOTE_CELL = 10
+WALL_WIDTH = 1280  # Window with --wall and --watch
+WALL_HEIGHT = 720
+WALL_BOARDS = 16  # Boards shown by --watch without --wall
+WALL_RESTART_TICKS = 2 * engine.TICK_RATE  # A lost game on the wall starts again after this
+
 # Animation constants
 CLEAR_BLINK_FRAMES = 20  # Increased number of frames for blinking animation (slower)
 CLEAR_DELAY = 800        # Increased milliseconds between chain reactions (slower)
+FALL_DELAY = 50          # Milliseconds to show puyos after they fall
+INPUT_BUFFER_SIZE = 4    # Keys remembered during a chain for the next piece
 POP_ANIMATION_FRAMES = 10 # Increased number of frames for pop animation (slower)
 CHAIN_DISPLAY_DURATION = 1500  # Duration to display chain text in milliseconds
+REWIND_SNAPSHOTS = 200   # Pieces that can be taken back in practice mode
+
+# Simulation timing: game logic runs in fixed ticks, rendering interpolates between them
+TICK_MS = 1000 / engine.TICK_RATE
+TICKS_PER_FRAME = engine.TICK_RATE // FPS  # Animations were tuned in 60 FPS frames
+MAX_FRAME_TIME = 250  # Milliseconds of simulation caught up at most per frame
+MISSED_FRAME_TIME = 1.5 * 1000 / FPS  # A longer gap between frames means one was dropped
+WOBBLE_TICKS = 500 * engine.TICK_RATE // 1000
+WOBBLE_STEP = 0.1 / TICKS_PER_FRAME
+WOBBLE_AMOUNT = 3  # Pixels a landed puyo wobbles by
+POP_ANIMATION_TICKS = POP_ANIMATION_FRAMES * TICKS_PER_FRAME
+
+# Screen layers of the playing screen, back to front
+LAYER_BACKGROUND = 0  # Gradient (static)
+LAYER_CLOUDS = 1      # Moving clouds
+LAYER_CHROME = 2      # Board outline, grid, labels (static)
+LAYER_PUYOS = 3       # Board puyos, piece, landing prediction, pops, next piece
+LAYER_HUD = 4         # Score values and chain text
+LAYER_COUNT = 5
 
 # Game states
 STATE_TITLE = 0
@@ -41,19 +126,21 @@ BACKGROUND_COLOR = (240, 240, 240)
 ORANGE = (255, 140, 0)
 LIGHT_BLUE = (173, 216, 230)
 
-# AWS Service colors (for reference)
+# AWS Service colors (for reference, service types are defined in engine.py)
 # Red: CloudTrail
 # Blue: Aurora
 # Yellow: EC2
 # Green: S3
 # Purple: Amazon VPC
 
-# Service types
-SERVICE_CLOUDTRAIL = 0  # Red
-SERVICE_AURORA = 1      # Blue
-SERVICE_EC2 = 2         # Yellow
-SERVICE_S3 = 3          # Green
-SERVICE_VPC = 4         # Purple
+# Landing prediction and hint colors by service type
+PREDICTION_COLORS = {
+    0: (220, 60, 60, 100),    # Red for CloudTrail
+    1: (60, 60, 220, 100),    # Blue for Aurora
+    2: (220, 220, 60, 100),   # Yellow for EC2
+    3: (60, 220, 60, 100),    # Green for S3
+    4: (180, 60, 220, 100)    # Purple for VPC
+}
 
 # Game over animation constants
 GAME_OVER_AMPLITUDE = 10  # Amplitude of the game over text wobble
@@ -67,7 +154,10 @@ CONTINUE_OPTION_YES = 0
 CONTINUE_OPTION_NO = 1
 
 # Create the screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+if args.wall or args.watch:
+    screen = pygame.display.set_mode((WALL_WIDTH, WALL_HEIGHT))
+else:
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 pygame.display.set_caption('AWS Puyo Puyo')
 
 # Load images
@@ -107,6 +197,7 @@ try:
     # Try to use Japanese fonts
     font = pygame.font.SysFont('MS Gothic', 24)  # Windows Japanese font
     large_font = pygame.font.SysFont('MS Gothic', 36)
+    small_font = pygame.font.SysFont('MS Gothic', 16)
     game_over_font = pygame.font.SysFont('MS Gothic', 48)  # Larger font for game over
     title_font = pygame.font.SysFont('MS Gothic', 72)  # Large font for title
     countdown_font = pygame.font.SysFont('MS Gothic', 96)  # Extra large font for countdown
@@ -114,38 +205,25 @@ except:
     # Fallback to default fonts
     font = pygame.font.SysFont('Arial', 24)
     large_font = pygame.font.SysFont('Arial', 36)
+    small_font = pygame.font.SysFont('Arial', 16)
     game_over_font = pygame.font.SysFont('Arial', 48)
     title_font = pygame.font.SysFont('Arial', 72)
     countdown_font = pygame.font.SysFont('Arial', 96)
 
 # Load images
 images = load_images()
+atlas = SpriteAtlas(images, POP_ANIMATION_TICKS)  # Every sprite and pop frame, rendered once
 
-# Background elements
-cloud_positions = []
-for _ in range(10):
-    cloud_positions.append([
-        random.randint(0, SCREEN_WIDTH),
-        random.randint(0, SCREEN_HEIGHT // 2),
-        random.randint(30, 70),  # Size
-        random.random() * 0.5 + 0.2  # Speed
-    ])
-
-# AWS icons for title screen
-aws_icons = []
-for i in range(20):  # Create 20 random AWS icons
-    service_type = random.randint(0, 4)
-    aws_icons.append({
-        'type': service_type,
-        'x': random.randint(0, SCREEN_WIDTH),
-        'y': random.randint(0, SCREEN_HEIGHT),
-        'speed': random.random() * 1 + 0.5,
-        'size': random.random() * 0.5 + 0.5  # Scale factor
-    })
+# Background elements, moved as particles (see particles.py)
+CLOUD_COUNT = 10
+CLOUD_SIZES = range(30, 71)
+ICON_COUNT = 20  # AWS icons for title screen
+ICON_SIZES = range(GRID_SIZE // 2, GRID_SIZE)
 
 # Define screen functions
-def draw_background():
-    # Create a gradient background
+def render_gradient():
+    # Create a gradient background once
+    surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
     for y in range(SCREEN_HEIGHT):
         # Gradient from light blue at top to white at bottom
         ratio = y / SCREEN_HEIGHT
@@ -154,25 +232,69 @@ def draw_background():
             int(LIGHT_BLUE[1] + (WHITE[1] - LIGHT_BLUE[1]) * ratio),
             int(LIGHT_BLUE[2] + (WHITE[2] - LIGHT_BLUE[2]) * ratio)
         )
-        pygame.draw.line(screen, color, (0, y), (SCREEN_WIDTH, y))
-    
-    # Draw AWS-style clouds
-    for cloud in cloud_positions:
-        x, y, size, speed = cloud
-        
-        # Draw a fluffy cloud
-        pygame.draw.circle(screen, WHITE, (int(x), int(y)), size)
-        pygame.draw.circle(screen, WHITE, (int(x - size*0.6), int(y + size*0.2)), int(size*0.7))
-        pygame.draw.circle(screen, WHITE, (int(x + size*0.6), int(y + size*0.2)), int(size*0.7))
-        
-        # Move cloud
-        cloud[0] -= speed
-        if cloud[0] < -size:
-            cloud[0] = SCREEN_WIDTH + size
-            cloud[1] = random.randint(0, SCREEN_HEIGHT // 2)
-            cloud[2] = random.randint(30, 70)
-            cloud[3] = random.random() * 0.5 + 0.2
-    
+        pygame.draw.line(surface, color, (0, y), (SCREEN_WIDTH, y))
+    return surface.convert()
+
+def cloud_image(size):
+    # Clouds are drawn once per size and then only blitted
+    if size not in cloud_images:
+        width = int(size * 1.3) * 2 + 2
+        height = int(size * 1.9) + 2
+        cx = width // 2
+        cy = size
+        img = pygame.Surface((width, height), pygame.SRCALPHA)
+        pygame.draw.circle(img, WHITE, (cx, cy), size)
+        pygame.draw.circle(img, WHITE, (int(cx - size*0.6), int(cy + size*0.2)), int(size*0.7))
+        pygame.draw.circle(img, WHITE, (int(cx + size*0.6), int(cy + size*0.2)), int(size*0.7))
+        cloud_images[size] = (img.convert_alpha(), cx, cy)
+    return cloud_images[size]
+
+def create_cloud_particles():
+    # One kind per cloud size, placed by the center of the main circle
+    clouds = [cloud_image(size) for size in CLOUD_SIZES]
+    particles = ParticleSystem([[img] for img, cx, cy in clouds], [(cx, cy) for img, cx, cy in clouds])
+    for _ in range(CLOUD_COUNT):
+        spawn_cloud(particles, random.randint(0, SCREEN_WIDTH))
+    return particles
+
+def spawn_cloud(particles, x=None):
+    size = random.randint(30, 70)
+    speed = random.random() * 0.5 + 0.2
+    if x is None:
+        x = SCREEN_WIDTH + size  # Just off the right edge
+    # The cloud is recycled once it has moved off the left edge
+    lifetime = int((x + size) / speed) + 1
+    particles.spawn(size - CLOUD_SIZES[0], x, random.randint(0, SCREEN_HEIGHT // 2), lifetime, vx=-speed)
+
+def update_clouds():
+    # Move clouds, once per frame
+    dead_kinds, _, _ = cloud_particles.update()
+    for _ in range(len(dead_kinds)):
+        spawn_cloud(cloud_particles)
+
+def create_icon_particles():
+    # One kind per service type and size, placed by the top left corner
+    animations = [[atlas.scaled_sprite(service_type, size)]
+                  for service_type in range(engine.NUM_SERVICES) for size in ICON_SIZES]
+    particles = ParticleSystem(animations, [(0, 0)] * len(animations))
+    for _ in range(ICON_COUNT):
+        kind = random.randint(0, 4) * len(ICON_SIZES) + random.randrange(len(ICON_SIZES))
+        spawn_icon(particles, kind, random.randint(0, SCREEN_WIDTH), random.randint(0, SCREEN_HEIGHT),
+                   random.random() * 1 + 0.5)
+    return particles
+
+def spawn_icon(particles, kind, x, y, speed):
+    # The icon is recycled once it has fallen below the screen
+    lifetime = int((SCREEN_HEIGHT - y) / speed) + 1
+    particles.spawn(kind, x, y, lifetime, vy=speed)
+
+def update_icons():
+    # Move icons; fallen ones start again from the top
+    dead_kinds, _, dead_velocities = icon_particles.update()
+    for kind, (vx, vy) in zip(dead_kinds.tolist(), dead_velocities.tolist()):
+        spawn_icon(icon_particles, kind, random.randint(0, SCREEN_WIDTH), -50, vy)
+
+def draw_decorations(surface):
     # Draw AWS logo-inspired elements
     # Orange arrow
     arrow_points = [
@@ -180,80 +302,51 @@ def draw_background():
         (SCREEN_WIDTH - 60, 30),
         (SCREEN_WIDTH - 80, 50)
     ]
-    pygame.draw.polygon(screen, ORANGE, arrow_points)
+    pygame.draw.polygon(surface, ORANGE, arrow_points)
     
     # Draw some decorative elements that resemble AWS services
-    pygame.draw.rect(screen, LIGHT_GRAY, (20, 20, 40, 40), 2)
-    pygame.draw.circle(screen, LIGHT_GRAY, (100, 40), 20, 2)
+    pygame.draw.rect(surface, LIGHT_GRAY, (20, 20, 40, 40), 2)
+    pygame.draw.circle(surface, LIGHT_GRAY, (100, 40), 20, 2)
+
+def draw_background():
+    # Draw AWS-themed background
+    screen.blit(background_surface, (0, 0))
+    
+    # Draw AWS-style clouds
+    screen.blits(cloud_particles.sprites(), doreturn=False)
+    
+    draw_decorations(screen)
 
 def draw_title_screen():
     # Draw AWS-themed background
     draw_background()
     
     # Draw floating AWS icons
-    for icon in aws_icons:
-        # Move icons
-        icon['y'] += icon['speed']
-        if icon['y'] > SCREEN_HEIGHT:
-            icon['y'] = -50
-            icon['x'] = random.randint(0, SCREEN_WIDTH)
-        
-        # Draw the icon
-        img = images[icon['type']]
-        size = int(GRID_SIZE * icon['size'])
-        scaled_img = pygame.transform.scale(img, (size, size))
-        screen.blit(scaled_img, (icon['x'], icon['y']))
+    update_icons()
+    screen.blits(icon_particles.sprites(), doreturn=False)
     
     # Draw title text with orange outline and white fill
     title_text = "あまぷよ！！"
     
-    # First render the text in white
-    title_surface = title_font.render(title_text, True, WHITE)
+    title_surface = text_cache.render(title_font, title_text, WHITE, ORANGE, 4)
     title_rect = title_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 3))
-    
-    # Create orange outline
-    outline_size = 4
-    for dx in range(-outline_size, outline_size + 1):
-        for dy in range(-outline_size, outline_size + 1):
-            if dx != 0 or dy != 0:
-                outline_rect = title_rect.copy()
-                outline_rect.x += dx
-                outline_rect.y += dy
-                outline_text = title_font.render(title_text, True, ORANGE)
-                screen.blit(outline_text, outline_rect)
-    
-    # Draw the main white text on top
     screen.blit(title_surface, title_rect)
     
     # Draw press space instruction with black outline
-    space_text = font.render("スペースキーを押してスタート", True, WHITE)
-    space_rect = space_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT * 2 // 3))
-    
-    # Add black outline to the text
     outline_size = 2
-    for dx in range(-outline_size, outline_size + 1):
-        for dy in range(-outline_size, outline_size + 1):
-            if dx != 0 or dy != 0:
-                outline_rect = space_rect.copy()
-                outline_rect.x += dx
-                outline_rect.y += dy
-                outline_text = font.render("スペースキーを押してスタート", True, BLACK)
-                screen.blit(outline_text, outline_rect)
-    
-    # Draw the main white text on top
+    space_text = text_cache.render(font, "スペースキーを押してスタート", WHITE, BLACK, outline_size)
+    space_rect = space_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT * 2 // 3))
     screen.blit(space_text, space_rect)
     
     # Make the text blink
     if (pygame.time.get_ticks() // 500) % 2 == 0:
-        pygame.draw.rect(screen, WHITE, space_rect, 2)
+        pygame.draw.rect(screen, WHITE, space_rect.inflate(-outline_size * 2, -outline_size * 2), 2)
 
 def draw_continue_screen():
     global continue_option, continue_start_time, game_state, fade_alpha, game_over_start_time
     
     # Draw background with semi-transparency
-    s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
-    s.fill((0, 0, 0, 128))  # Semi-transparent black
-    screen.blit(s, (0, 0))
+    screen.blit(dim_overlay, (0, 0))
     
     # Calculate game over text position - falling animation
     elapsed_time = min(GAME_OVER_FALL_DURATION, pygame.time.get_ticks() - game_over_start_time)
@@ -268,28 +361,15 @@ def draw_continue_screen():
     wobble_x = math.sin(pygame.time.get_ticks() / 500 * GAME_OVER_SPEED) * GAME_OVER_AMPLITUDE
     
     # Create a stylized game over text with orange outline and white fill
-    game_over_text = game_over_font.render(GAME_OVER_TEXT, True, WHITE)
+    game_over_text = text_cache.render(game_over_font, GAME_OVER_TEXT, WHITE, ORANGE, 3)
     text_rect = game_over_text.get_rect(center=(SCREEN_WIDTH // 2 + wobble_x, current_y))
-    
-    # Create orange outline
-    outline_size = 3
-    for dx in range(-outline_size, outline_size + 1):
-        for dy in range(-outline_size, outline_size + 1):
-            if dx != 0 or dy != 0:
-                outline_rect = game_over_text.get_rect(
-                    center=(SCREEN_WIDTH // 2 + wobble_x + dx, current_y + dy)
-                )
-                outline_text = game_over_font.render(GAME_OVER_TEXT, True, ORANGE)
-                screen.blit(outline_text, outline_rect)
-    
-    # Draw the main white text on top
     screen.blit(game_over_text, text_rect)
     
     # Only show continue options after the game over text has finished falling
     if elapsed_time >= GAME_OVER_FALL_DURATION:
         # Draw continue text
         continue_text = "コンティニューする？"
-        continue_surface = large_font.render(continue_text, True, WHITE)
+        continue_surface = text_cache.render(large_font, continue_text, WHITE)
         continue_rect = continue_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
         screen.blit(continue_surface, continue_rect)
         
@@ -300,8 +380,8 @@ def draw_continue_screen():
         yes_color = ORANGE if continue_option == CONTINUE_OPTION_YES else WHITE
         no_color = ORANGE if continue_option == CONTINUE_OPTION_NO else WHITE
         
-        yes_surface = font.render(yes_text, True, yes_color)
-        no_surface = font.render(no_text, True, no_color)
+        yes_surface = text_cache.render(font, yes_text, yes_color)
+        no_surface = text_cache.render(font, no_text, no_color)
         
         yes_rect = yes_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 50))
         no_rect = no_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2 + 90))
@@ -325,57 +405,15 @@ def draw_continue_screen():
             
             # Draw countdown with pop style
             count_text = str(remaining)
-            count_surface = countdown_font.render(count_text, True, WHITE)
             
             # Add pulsating effect based on the decimal part of the time
             decimal_part = (pygame.time.get_ticks() - continue_start_time) % 1000 / 1000.0
             scale_factor = 1.0 + 0.2 * math.sin(decimal_part * 2 * math.pi)
             
-            scaled_width = int(count_surface.get_width() * scale_factor)
-            scaled_height = int(count_surface.get_height() * scale_factor)
-            scaled_surface = pygame.transform.scale(count_surface, (scaled_width, scaled_height))
-            
-            count_rect = scaled_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3 // 4))
-            
-            # Draw orange outline
-            outline_size = 3
-            for dx in range(-outline_size, outline_size + 1):
-                for dy in range(-outline_size, outline_size + 1):
-                    if dx != 0 or dy != 0:
-                        outline_rect = count_rect.copy()
-                        outline_rect.x += dx
-                        outline_rect.y += dy
-                        outline_text = pygame.transform.scale(countdown_font.render(count_text, True, ORANGE), 
-                                                            (scaled_width, scaled_height))
-                        screen.blit(outline_text, outline_rect)
-            
-            # Draw the main white text on top
-            screen.blit(scaled_surface, count_rect)
-        
-        # Add pulsating effect based on the decimal part of the time
-        decimal_part = (pygame.time.get_ticks() - continue_start_time) % 1000 / 1000.0
-        scale_factor = 1.0 + 0.2 * math.sin(decimal_part * 2 * math.pi)
-        
-        scaled_width = int(count_surface.get_width() * scale_factor)
-        scaled_height = int(count_surface.get_height() * scale_factor)
-        scaled_surface = pygame.transform.scale(count_surface, (scaled_width, scaled_height))
-        
-        count_rect = scaled_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3 // 4))
-        
-        # Draw orange outline
-        outline_size = 3
-        for dx in range(-outline_size, outline_size + 1):
-            for dy in range(-outline_size, outline_size + 1):
-                if dx != 0 or dy != 0:
-                    outline_rect = count_rect.copy()
-                    outline_rect.x += dx
-                    outline_rect.y += dy
-                    outline_text = pygame.transform.scale(countdown_font.render(count_text, True, ORANGE), 
-                                                        (scaled_width, scaled_height))
-                    screen.blit(outline_text, outline_rect)
-        
-        # Draw the main white text on top
-        screen.blit(scaled_surface, count_rect)
+            # White text with an orange outline
+            count_surface = text_cache.render(countdown_font, count_text, WHITE, ORANGE, 3, scale_factor)
+            count_rect = count_surface.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT * 3 // 4))
+            screen.blit(count_surface, count_rect)
 
 def draw_fade_out():
     global fade_alpha, game_state
@@ -387,651 +425,652 @@ def draw_fade_out():
         game_state = STATE_TITLE  # Return to title screen after fade
     
     # Draw black overlay with increasing opacity
-    s = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
-    s.fill(BLACK)
-    s.set_alpha(fade_alpha)
-    screen.blit(s, (0, 0))
+    fade_overlay.set_alpha(fade_alpha)
+    screen.blit(fade_overlay, (0, 0))
+
+class PuyoAnimation:
+    """Wobble and blink state, only for puyos that are animating."""
+    __slots__ = ('wobble_phase', 'wobble_ticks', 'blink_frame')
+
+    def __init__(self):
+        self.wobble_phase = 0.0
+        self.wobble_ticks = 0       # Ticks of wobble left
+        self.blink_frame = None     # Ticks since the blink started (None = not clearing)
 
 class Puyo:
+    """Visual state of one puyo on screen. The rules live in engine.py."""
+    __slots__ = ('service_type', 'x', 'y', 'animation')
+
     def __init__(self, service_type, x, y):
         self.service_type = service_type
         self.x = x
         self.y = y
-        self.wobble_phase = 0
-        self.wobble_speed = 5
-        self.wobble_amount = 3
-        self.is_wobbling = False
-        self.wobble_start_time = 0
-        self.wobble_duration = 500  # milliseconds
-        self.is_clearing = False    # Whether this puyo is being cleared
-        self.blink_frame = 0        # Current frame of blink animation
-        self.pop_scale = 1.0        # Scale for pop animation (1.0 = normal size)
-        self.pop_alpha = 255        # Alpha for pop animation (255 = fully opaque)
+        self.animation = None  # PuyoAnimation while animating
+
+    def animate(self):
+        # Give this puyo animation state and update it every tick
+        if self.animation is None:
+            self.animation = PuyoAnimation()
+            animating_sprites.add(self)
+        return self.animation
 
     def start_wobble(self):
-        self.is_wobbling = True
-        self.wobble_start_time = pygame.time.get_ticks()
-        self.wobble_phase = random.random() * 2 * math.pi  # Random starting phase
+        animation = self.animate()
+        animation.wobble_ticks = WOBBLE_TICKS
+        animation.wobble_phase = random.random() * 2 * math.pi  # Random starting phase
 
-    def update_wobble(self):
-        if not self.is_wobbling:
-            return
-        
-        current_time = pygame.time.get_ticks()
-        if current_time - self.wobble_start_time > self.wobble_duration:
-            self.is_wobbling = False
-            return
-        
-        # Update wobble phase
-        self.wobble_phase += 0.1
+    def start_blink(self):
+        self.animate().blink_frame = 0
 
-    def draw(self, surface, offset_x=0, offset_y=0):
-        wobble_x = 0
-        wobble_y = 0
-        
-        # Calculate wobble effect if active
-        if self.is_wobbling:
-            wobble_x = math.sin(self.wobble_phase) * self.wobble_amount
-            wobble_y = math.cos(self.wobble_phase) * self.wobble_amount
-            self.update_wobble()
-        
-        # Calculate position
-        x_pos = BOARD_LEFT + (self.x + offset_x) * GRID_SIZE + wobble_x
-        y_pos = BOARD_TOP + (self.y + offset_y) * GRID_SIZE + wobble_y
-        
-        # If this puyo is being cleared, make it blink
-        if self.is_clearing:
-            # Skip drawing on certain frames to create blinking effect
-            if (self.blink_frame // 3) % 2 == 0:
-                return
-        
-        # Get the image
-        img = images[self.service_type].copy()
+    def update_animation(self):
+        # Called once per simulation tick; returns False once nothing is animating
+        animation = self.animation
+        if animation.wobble_ticks > 0:
+            animation.wobble_ticks -= 1
+            # Update wobble phase
+            animation.wobble_phase += WOBBLE_STEP
+        if animation.blink_frame is not None:
+            animation.blink_frame += 1
+        if animation.wobble_ticks <= 0 and animation.blink_frame is None:
+            self.animation = None
+            return False
+        return True
+
+    def layout(self, offset_x=0, offset_y=0, alpha=0.0):
+        # Image and rect to blit, or None while blinked out
+        # alpha is how far we are between the last tick and the next one
+        x_pos = BOARD_LEFT + (self.x + offset_x) * GRID_SIZE
+        y_pos = BOARD_TOP + (self.y + offset_y) * GRID_SIZE
         
-        # Apply pop animation if needed
-        if self.pop_scale != 1.0:
-            # Scale the image
-            orig_size = img.get_width()
-            new_size = int(orig_size * self.pop_scale)
-            if new_size > 0:  # Prevent scaling to zero
-                img = pygame.transform.scale(img, (new_size, new_size))
+        animation = self.animation
+        if animation is not None:
+            # Calculate wobble effect if active
+            if animation.wobble_ticks > 0:
+                phase = animation.wobble_phase + alpha * WOBBLE_STEP
+                x_pos += math.sin(phase) * WOBBLE_AMOUNT
+                y_pos += math.cos(phase) * WOBBLE_AMOUNT
             
-            # Set transparency
-            img.set_alpha(self.pop_alpha)
+            # If this puyo is being cleared, make it blink
+            if animation.blink_frame is not None:
+                # Skip drawing on certain frames to create blinking effect
+                if (animation.blink_frame // (3 * TICKS_PER_FRAME)) % 2 == 0:
+                    return None
         
-        # Draw the image
+        img = atlas.sprite(self.service_type)
         img_rect = img.get_rect(center=(x_pos + GRID_SIZE // 2, y_pos + GRID_SIZE // 2))
-        surface.blit(img, img_rect)
+        return img, img_rect
 
-class PuyoPair:
-    def __init__(self):
-        # Randomly select service types for the pair
-        self.main_puyo = Puyo(random.randint(0, 4), GRID_WIDTH // 2, 0)
-        self.sub_puyo = Puyo(random.randint(0, 4), GRID_WIDTH // 2, 1)
-        self.rotation = 0  # 0: sub below, 1: sub right, 2: sub above, 3: sub left
-        self.drop_speed = 0  # For fast drop
-        self.last_drop_time = 0
-
-    def rotate_clockwise(self):
-        # Save original positions
-        orig_main_x, orig_main_y = self.main_puyo.x, self.main_puyo.y
-        orig_sub_x, orig_sub_y = self.sub_puyo.x, self.sub_puyo.y
-        orig_rotation = self.rotation
-        
-        # Calculate new position based on rotation
-        if self.rotation == 0:  # sub is below -> move to right
-            self.sub_puyo.x = self.main_puyo.x + 1
-            self.sub_puyo.y = self.main_puyo.y
-            self.rotation = 1
-        elif self.rotation == 1:  # sub is right -> move to above
-            self.sub_puyo.x = self.main_puyo.x
-            self.sub_puyo.y = self.main_puyo.y - 1
-            self.rotation = 2
-        elif self.rotation == 2:  # sub is above -> move to left
-            self.sub_puyo.x = self.main_puyo.x - 1
-            self.sub_puyo.y = self.main_puyo.y
-            self.rotation = 3
-        elif self.rotation == 3:  # sub is left -> move to below
-            self.sub_puyo.x = self.main_puyo.x
-            self.sub_puyo.y = self.main_puyo.y + 1
-            self.rotation = 0
-
-        # Check if rotation is valid
-        if not is_valid_position(self):
-            # Try wall kick - move the whole piece left or right if it's against a wall
-            if self.sub_puyo.x < 0:
-                # Move right
-                self.main_puyo.x += 1
-                self.sub_puyo.x += 1
-            elif self.sub_puyo.x >= GRID_WIDTH:
-                # Move left
-                self.main_puyo.x -= 1
-                self.sub_puyo.x -= 1
-            elif self.sub_puyo.y < 0:
-                # Move down
-                self.main_puyo.y += 1
-                self.sub_puyo.y += 1
-            elif self.sub_puyo.y >= GRID_HEIGHT:
-                # Move up
-                self.main_puyo.y -= 1
-                self.sub_puyo.y -= 1
-            
-            # Check if the wall kick worked
-            if not is_valid_position(self):
-                # Revert to original position
-                self.main_puyo.x, self.main_puyo.y = orig_main_x, orig_main_y
-                self.sub_puyo.x, self.sub_puyo.y = orig_sub_x, orig_sub_y
-                self.rotation = orig_rotation
-
-    def rotate_counterclockwise(self):
-        # Save original positions
-        orig_main_x, orig_main_y = self.main_puyo.x, self.main_puyo.y
-        orig_sub_x, orig_sub_y = self.sub_puyo.x, self.sub_puyo.y
-        orig_rotation = self.rotation
-        
-        # Opposite of rotate_clockwise
-        if self.rotation == 0:  # sub is below -> move to left
-            self.sub_puyo.x = self.main_puyo.x - 1
-            self.sub_puyo.y = self.main_puyo.y
-            self.rotation = 3
-        elif self.rotation == 3:  # sub is left -> move to above
-            self.sub_puyo.x = self.main_puyo.x
-            self.sub_puyo.y = self.main_puyo.y - 1
-            self.rotation = 2
-        elif self.rotation == 2:  # sub is above -> move to right
-            self.sub_puyo.x = self.main_puyo.x + 1
-            self.sub_puyo.y = self.main_puyo.y
-            self.rotation = 1
-        elif self.rotation == 1:  # sub is right -> move to below
-            self.sub_puyo.x = self.main_puyo.x
-            self.sub_puyo.y = self.main_puyo.y + 1
-            self.rotation = 0
-            
-        # Check if rotation is valid
-        if not is_valid_position(self):
-            # Try wall kick - move the whole piece left or right if it's against a wall
-            if self.sub_puyo.x < 0:
-                # Move right
-                self.main_puyo.x += 1
-                self.sub_puyo.x += 1
-            elif self.sub_puyo.x >= GRID_WIDTH:
-                # Move left
-                self.main_puyo.x -= 1
-                self.sub_puyo.x -= 1
-            elif self.sub_puyo.y < 0:
-                # Move down
-                self.main_puyo.y += 1
-                self.sub_puyo.y += 1
-            elif self.sub_puyo.y >= GRID_HEIGHT:
-                # Move up
-                self.main_puyo.y -= 1
-                self.sub_puyo.y -= 1
-            
-            # Check if the wall kick worked
-            if not is_valid_position(self):
-                # Revert to original position
-                self.main_puyo.x, self.main_puyo.y = orig_main_x, orig_main_y
-                self.sub_puyo.x, self.sub_puyo.y = orig_sub_x, orig_sub_y
-                self.rotation = orig_rotation
-
-    def move_left(self):
-        self.main_puyo.x -= 1
-        self.sub_puyo.x -= 1
-        if not is_valid_position(self):
-            self.main_puyo.x += 1
-            self.sub_puyo.x += 1
-
-    def move_right(self):
-        self.main_puyo.x += 1
-        self.sub_puyo.x += 1
-        if not is_valid_position(self):
-            self.main_puyo.x -= 1
-            self.sub_puyo.x -= 1
-
-    def move_down(self):
-        self.main_puyo.y += 1
-        self.sub_puyo.y += 1
-        if not is_valid_position(self):
-            self.main_puyo.y -= 1
-            self.sub_puyo.y -= 1
-            return False  # Cannot move down
-        return True  # Successfully moved down
-        
-    def start_fast_drop(self):
-        self.drop_speed = 30  # Very fast drop speed
-        
-    def stop_fast_drop(self):
-        self.drop_speed = 0
-        
-    def hard_drop(self):
-        # Move down until it can't move anymore
-        drop_distance = 0
-        while self.move_down():
-            drop_distance += 1
-        return drop_distance
-
-    def draw(self, surface):
-        # Draw the landing prediction
-        self.draw_landing_prediction(surface)
-        
-        # Draw the actual piece
-        self.main_puyo.draw(surface)
-        self.sub_puyo.draw(surface)
-        
-    def draw_landing_prediction(self, surface):
-        # Create a copy of the current piece to find landing position
-        temp_main = Puyo(self.main_puyo.service_type, self.main_puyo.x, self.main_puyo.y)
-        temp_sub = Puyo(self.sub_puyo.service_type, self.sub_puyo.x, self.sub_puyo.y)
-        temp_piece = PuyoPair()
-        temp_piece.main_puyo = temp_main
-        temp_piece.sub_puyo = temp_sub
-        
-        # Move the temp piece down until it can't move anymore
-        while True:
-            temp_piece.main_puyo.y += 1
-            temp_piece.sub_puyo.y += 1
-            if not is_valid_position(temp_piece):
-                temp_piece.main_puyo.y -= 1
-                temp_piece.sub_puyo.y -= 1
-                break
-        
-        # Draw small colored circles at landing position with transparency
-        for puyo in [temp_piece.main_puyo, temp_piece.sub_puyo]:
-            x_pos = BOARD_LEFT + puyo.x * GRID_SIZE + GRID_SIZE // 2
-            y_pos = BOARD_TOP + puyo.y * GRID_SIZE + GRID_SIZE // 2
-            
-            # Color map for the prediction circles
-            color_map = {
-                0: (220, 60, 60, 100),    # Red for CloudTrail
-                1: (60, 60, 220, 100),    # Blue for Aurora
-                2: (220, 220, 60, 100),   # Yellow for EC2
-                3: (60, 220, 60, 100),    # Green for S3
-                4: (180, 60, 220, 100)    # Purple for VPC
-            }
-            
-            # Draw a small circle with the corresponding color
-            circle_surface = pygame.Surface((GRID_SIZE, GRID_SIZE), pygame.SRCALPHA)
-            pygame.draw.circle(circle_surface, color_map[puyo.service_type], 
-                              (GRID_SIZE // 2, GRID_SIZE // 2), GRID_SIZE // 4)
-            surface.blit(circle_surface, (x_pos - GRID_SIZE // 2, y_pos - GRID_SIZE // 2))
-
-def is_valid_position(piece):
-    # Check if the piece is within bounds and not colliding with placed puyos
-    for puyo in [piece.main_puyo, piece.sub_puyo]:
-        x, y = puyo.x, puyo.y
-        
-        # Check boundaries
-        if x < 0 or x >= GRID_WIDTH or y >= GRID_HEIGHT:
-            return False
-        
-        # Check collision with placed puyos
-        if y >= 0 and board[y][x] is not None:
-            # Special case: if this position was just cleared, allow placement
-            if hasattr(board[y][x], 'is_clearing') and board[y][x].is_clearing:
-                continue
-            return False
-    
-    return True
+def sync_sprites():
+    # Rebuild the visual puyos from the engine board
+    global board_sprites
+    board_sprites = {}
+    for y in range(GRID_HEIGHT):
+        for x in range(GRID_WIDTH):
+            if game.board.cells[y][x] is not None:
+                board_sprites[(x, y)] = Puyo(game.board.cells[y][x], x, y)
 
-def create_new_piece():
-    global current_piece, next_piece
-    if next_piece is None:
-        next_piece = PuyoPair()
-    
-    current_piece = next_piece
-    next_piece = PuyoPair()
+def draw_piece(piece):
+    # Draw the landing prediction and the suggested move
+    draw_landing_prediction(piece)
+    if hint_worker is not None:
+        draw_hint(piece)
+    
+    # Draw the actual piece
+    for i, (x, y, service_type) in enumerate(piece.cells()):
+        x_pos = BOARD_LEFT + x * GRID_SIZE + GRID_SIZE // 2
+        y_pos = BOARD_TOP + y * GRID_SIZE + GRID_SIZE // 2
+        img = atlas.sprite(service_type)
+        compositor.add(LAYER_PUYOS, ('piece', i), img, img.get_rect(center=(x_pos, y_pos)).topleft, img)
 
-def lock_piece():
-    global board, score
-    
-    # Place the main puyo
-    if 0 <= current_piece.main_puyo.y < GRID_HEIGHT and 0 <= current_piece.main_puyo.x < GRID_WIDTH:
-        board[current_piece.main_puyo.y][current_piece.main_puyo.x] = current_piece.main_puyo
-        current_piece.main_puyo.start_wobble()  # Start wobble animation when landing
-    
-    # Place the sub puyo
-    if 0 <= current_piece.sub_puyo.y < GRID_HEIGHT and 0 <= current_piece.sub_puyo.x < GRID_WIDTH:
-        board[current_piece.sub_puyo.y][current_piece.sub_puyo.x] = current_piece.sub_puyo
-        current_piece.sub_puyo.start_wobble()  # Start wobble animation when landing
+def load_prediction_images():
+    # Small transparent circles for the landing prediction, one per color
+    prediction_images = {}
+    for service_type, color in PREDICTION_COLORS.items():
+        circle_surface = pygame.Surface((GRID_SIZE, GRID_SIZE), pygame.SRCALPHA)
+        pygame.draw.circle(circle_surface, color, (GRID_SIZE // 2, GRID_SIZE // 2), GRID_SIZE // 4)
+        prediction_images[service_type] = circle_surface
+    return prediction_images
 
-def apply_gravity():
-    moved = False
-    
-    # Process each column separately
-    for x in range(GRID_WIDTH):
-        # First, collect all puyos in this column (from bottom to top)
-        puyos = []
-        for y in range(GRID_HEIGHT-1, -1, -1):
-            if board[y][x] is not None:
-                puyos.append(board[y][x])
-                board[y][x] = None  # Remove from the board temporarily
-        
-        # Then place them back starting from the bottom
-        current_y = GRID_HEIGHT - 1
-        for puyo in puyos:
-            # Find the first empty space from the bottom
-            while current_y >= 0 and board[current_y][x] is not None:
-                current_y -= 1
-                
-            if current_y >= 0:  # If we found a valid position
-                if puyo.y != current_y:  # If the puyo has moved
-                    puyo.y = current_y
-                    puyo.start_wobble()
-                    moved = True
-                board[current_y][x] = puyo
-                current_y -= 1  # Move up for the next puyo
-    
-    return moved
-
-def find_connected_groups():
-    visited = [[False for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-    groups = []
-    
-    def dfs(y, x, service_type, group):
-        if (y < 0 or y >= GRID_HEIGHT or x < 0 or x >= GRID_WIDTH or 
-            visited[y][x] or board[y][x] is None or 
-            board[y][x].service_type != service_type):
-            return
-        
-        visited[y][x] = True
-        group.append((y, x))
-        
-        # Check all four directions
-        dfs(y + 1, x, service_type, group)  # down
-        dfs(y - 1, x, service_type, group)  # up
-        dfs(y, x + 1, service_type, group)  # right
-        dfs(y, x - 1, service_type, group)  # left
-    
-    # Find all connected groups
-    for y in range(GRID_HEIGHT):
+def landing_prediction(piece):
+    # Landing cells for every rotation in the piece's column, kept until the board changes
+    if piece.x not in landing_cache:
+        landing_cache[piece.x] = engine.landing_positions(game.board, piece.x)
+    return landing_cache[piece.x][piece.rotation]
+
+def load_hint_images():
+    # Rings around the cells of the suggested move, one per color
+    hint_images = {}
+    for service_type, color in PREDICTION_COLORS.items():
+        ring_surface = pygame.Surface((GRID_SIZE, GRID_SIZE), pygame.SRCALPHA)
+        pygame.draw.circle(ring_surface, color[:3] + (200,), (GRID_SIZE // 2, GRID_SIZE // 2),
+                           GRID_SIZE // 2 - 3, 3)
+        hint_images[service_type] = ring_surface
+    return hint_images
+
+def update_hint():
+    # Ask for a hint for each new piece and pick up the answer when it is
+    # there; never waits for the search
+    global hint_piece, hint_request, hint_move
+    piece = game.current_piece
+    if piece is not hint_piece:
+        # The old request is stale now
+        hint_piece = piece
+        hint_move = None
+        if piece is None:
+            hint_worker.cancel()
+        else:
+            hint_request = hint_worker.request(game)
+    elif hint_move is None and piece is not None:
+        hint_move = hint_worker.hint(hint_request)
+
+def draw_hint(piece):
+    if hint_move is None:
+        return
+    column, rotation = hint_move
+    if column not in landing_cache:
+        landing_cache[column] = engine.landing_positions(game.board, column)
+    landed = landing_cache[column][rotation]
+    if landed is None:
+        return
+    for i, ((x, y), service_type) in enumerate(zip(landed, (piece.main_type, piece.sub_type))):
+        if y >= 0:
+            compositor.add(LAYER_PUYOS, ('hint', i), hint_images[service_type],
+                           (BOARD_LEFT + x * GRID_SIZE, BOARD_TOP + y * GRID_SIZE), service_type)
+
+def update_potential():
+    # Work out the chain potential of the settled board and redraw the heatmap
+    global potential_version
+    potential.update(bitboard.from_board(game.board).colors)
+    render_potential()
+    potential_version += 1
+
+def draw_remote():
+    # The other player's board beside NEXT, drawn again only when it changes.
+    # The remote game changes only when the session plays a tick or rolls back.
+    global remote_key
+    key = (versus.round, versus.tick, versus.rollbacks, versus.remote_over)
+    if key != remote_key:
+        remote_key = key
+        render_remote(versus.state)
+    compositor.add(LAYER_HUD, 'remote', remote_surface, (REMOTE_X, REMOTE_Y), remote_key)
+
+def render_remote(state):
+    # Redraw remote_surface in place
+    surface = remote_surface
+    surface.fill((0, 0, 0, 0))
+    label = f"相手 {state.score}" + (" ×" if versus.remote_over else "")
+    surface.blit(text_cache.render(small_font, label, BLACK), (0, 0))
+    board_rect = remote_shade.get_rect(topleft=(0, 20))
+    pygame.draw.rect(surface, WHITE, board_rect)
+    cells = [(x, y, service_type) for y, row in enumerate(state.board.cells)
+             for x, service_type in enumerate(row) if service_type is not None]
+    if state.current_piece is not None:
+        cells += [cell for cell in state.current_piece.cells() if cell[1] >= 0]
+    for x, y, service_type in cells:
+        surface.blit(atlas.scaled_sprite(service_type, REMOTE_CELL), (x * REMOTE_CELL, 20 + y * REMOTE_CELL))
+    if versus.remote_over:
+        surface.blit(remote_shade, board_rect)
+    pygame.draw.rect(surface, GRAY, board_rect, 1)
+
+def render_potential():
+    # Rows are colors, columns are board columns; the redder, the longer
+    # the chain one puyo of that color dropped there would start. Redraws
+    # potential_surface in place
+    cell_width, cell_height = HEATMAP_CELL
+    icon_size = cell_height - 2
+    surface = potential_surface
+    surface.fill((0, 0, 0, 0))
+    surface.blit(text_cache.render(small_font, "連鎖マップ", BLACK), (0, 0))
+    for service_type in range(engine.NUM_SERVICES):
+        y = 20 + service_type * cell_height
+        surface.blit(atlas.scaled_sprite(service_type, icon_size), (0, y + 1))
         for x in range(GRID_WIDTH):
-            if not visited[y][x] and board[y][x] is not None:
-                group = []
-                dfs(y, x, board[y][x].service_type, group)
-                if len(group) >= 4:  # Only consider groups of 4 or more
-                    groups.append(group)
-    
-    return groups
+            cell_rect = pygame.Rect(icon_size + 4 + x * cell_width, y, cell_width - 2, cell_height - 2)
+            chain = potential.chains[x][service_type]
+            if chain:
+                heat = min(chain, 4) / 4
+                pygame.draw.rect(surface, (255, int(200 - 160 * heat), int(120 - 120 * heat)), cell_rect)
+                label = text_cache.render(small_font, str(chain), BLACK)
+                surface.blit(label, label.get_rect(center=cell_rect.center))
+            else:
+                pygame.draw.rect(surface, LIGHT_GRAY, cell_rect, 1)
 
-def start_clear_animation(groups):
-    global clearing_groups, clear_animation_frame, clear_animation_start_time, chain_count, is_chain_active
-    global chain_display_time, max_chain, total_cleared
-    
-    if not groups:
-        return False
-    
-    # Mark all puyos in the groups as clearing
-    total_in_groups = 0
-    for group in groups:
-        total_in_groups += len(group)
-        for y, x in group:
-            if board[y][x] is not None:
-                board[y][x].is_clearing = True
-                board[y][x].blink_frame = 0
-    
-    # Update statistics
-    total_cleared += total_in_groups
-    
-    clearing_groups = groups
-    clear_animation_frame = 0
-    clear_animation_start_time = pygame.time.get_ticks()
-    chain_display_time = pygame.time.get_ticks()
-    is_chain_active = True
-    chain_count += 1
-    
-    # Update max chain if current chain is higher
-    if chain_count > max_chain:
-        max_chain = chain_count
+def draw_landing_prediction(piece):
+    landed = landing_prediction(piece)
+    if landed is None:
+        return
     
-    return True
+    # Draw small colored circles at landing position with transparency
+    for i, ((x, y), service_type) in enumerate(zip(landed, (piece.main_type, piece.sub_type))):
+        if y < 0:
+            continue  # Only while a new piece is stuck at the top
+        x_pos = BOARD_LEFT + x * GRID_SIZE
+        y_pos = BOARD_TOP + y * GRID_SIZE
+        compositor.add(LAYER_PUYOS, ('prediction', i), prediction_images[service_type],
+                       (x_pos, y_pos), service_type)
 
-def update_clear_animation():
-    global clearing_groups, clear_animation_frame, is_chain_active, score, pop_animations
-    
-    if not clearing_groups:
-        return False
-    
-    current_time = pygame.time.get_ticks()
-    
-    # Update blink animation
-    for group in clearing_groups:
-        for y, x in group:
-            if board[y][x] is not None:
-                board[y][x].blink_frame += 1
-    
-    clear_animation_frame += 1
-    
-    # When animation is complete, remove the puyos and start pop animations
-    if clear_animation_frame >= CLEAR_BLINK_FRAMES:
-        # Add score based on group size and chain count
-        chain_bonus = chain_count * 50  # Bonus increases with chain count
+def sim_time():
+    # Milliseconds of simulated play, advanced only by ticks
+    return sim_ticks * TICK_MS
+
+def start_chain_playback(settlement, score, total_cleared, max_chain):
+    global playback
+    
+    playback = ChainPlayback(settlement, score, total_cleared, max_chain, sim_time(),
+                             fall_duration=FALL_DELAY,
+                             blink_duration=CLEAR_BLINK_FRAMES * 1000 // FPS,
+                             clear_delay=CLEAR_DELAY)
+    # Show the lock right away
+    update_chain_playback(sim_time())
+
+def update_chain_playback(current_time):
+    global playback, clearing_groups, chain_display_time
+    
+    for event in playback.update(current_time):
+        if event.kind == 'lock':
+            # Start wobble animation when landing
+            for x, y, service_type in event.cells:
+                sprite = Puyo(service_type, x, y)
+                sprite.start_wobble()
+                board_sprites[(x, y)] = sprite
         
-        for group in clearing_groups:
-            # Add score based on group size
-            group_score = len(group) * 10 * (1 + (chain_count - 1) * 0.5)  # Base score + chain bonus
-            score += int(group_score)
-            
-            # Start pop animations for each puyo
-            for y, x in group:
-                if board[y][x] is not None:
-                    # Create a copy of the puyo for the pop animation
-                    pop_puyo = Puyo(board[y][x].service_type, x, y)
-                    pop_animations.append({
-                        'puyo': pop_puyo,
-                        'frame': 0,
-                        'x': x,
-                        'y': y
-                    })
-                    
-                    # Remove the puyo from the board
-                    board[y][x] = None
+        elif event.kind == 'fall':
+            # Move the visual puyos along with the board
+            moved_sprites = [(x, to_y, board_sprites.pop((x, from_y), None)) for x, from_y, to_y in event.cells]
+            for x, to_y, sprite in moved_sprites:
+                if sprite is not None:
+                    sprite.y = to_y
+                    sprite.start_wobble()
+                    board_sprites[(x, to_y)] = sprite
         
-        clearing_groups = []
-        is_chain_active = False
-        return True
-    
-    return False
+        elif event.kind == 'blink':
+            # Mark all puyos in the groups as clearing
+            for group in event.cells:
+                for y, x in group:
+                    sprite = board_sprites.get((x, y))
+                    if sprite is not None:
+                        sprite.start_blink()
+            clearing_groups = event.cells
+            chain_display_time = current_time
+        
+        elif event.kind == 'clear':
+            # Remove the puyos and start pop animations
+            for group in event.cells:
+                for y, x in group:
+                    sprite = board_sprites.pop((x, y), None)
+                    if sprite is not None:
+                        animating_sprites.discard(sprite)
+                        pop_particles.spawn(sprite.service_type,
+                                            BOARD_LEFT + x * GRID_SIZE + GRID_SIZE // 2,
+                                            BOARD_TOP + y * GRID_SIZE + GRID_SIZE // 2,
+                                            POP_ANIMATION_TICKS)
+            clearing_groups = []
+    
+    if playback.done:
+        # The keys pressed during the chain stay queued for the new piece
+        playback = None
 
-def update_pop_animations():
-    global pop_animations
+def update_animations():
+    # Advance wobble, blink and pop by one tick; still puyos cost nothing
+    finished = [sprite for sprite in animating_sprites if not sprite.update_animation()]
+    if finished:
+        animating_sprites.difference_update(finished)
+    pop_particles.update()
+
+def cpu_inputs():
+    # Steer the piece to where the AI wants it: rotate, move, then drop
+    return cpu_pilot.inputs(game)
+
+def simulate_tick(down_held):
+    global sim_ticks, game_state, end_time, continue_start_time, game_over_start_time, continue_option
+    global recorded_games
+    
+    sim_ticks += 1
+    update_animations()
+    
+    # Play back the chain; the piece waits until it is done
+    if playback is not None:
+        update_chain_playback(sim_time())
+        if versus is not None:
+            versus.advance(netplay.INPUT_WAIT)
+        return
     
-    if not pop_animations:
+    if replay_file is not None:
+        # Inputs come from the replay instead of the keyboard
+        inputs = replay_file.inputs[game.ticks] if game.ticks < len(replay_file.inputs) else 0
+    elif args.cpu:
+        inputs = cpu_inputs()
+    else:
+        inputs = input_queue.pop(0) if input_queue else 0
+        if down_held:
+            inputs |= engine.INPUT_DOWN
+    recorder.record(inputs)
+    
+    score, total_cleared, max_chain = game.score, game.total_cleared, game.max_chain
+    settlement = engine.tick(game, inputs)
+    if versus is not None:
+        versus.advance(inputs)
+    if spectate_server is not None:
+        spectate_server.publish_threadsafe(0, *spectate_publisher.frames(game, settlement))
+    if settlement is None:
         return
     
-    # Update each pop animation
-    for i in range(len(pop_animations) - 1, -1, -1):
-        anim = pop_animations[i]
-        anim['frame'] += 1
-        
-        # Update the puyo's scale and alpha based on the animation frame
-        progress = anim['frame'] / POP_ANIMATION_FRAMES
-        anim['puyo'].pop_scale = 1.0 + progress * 0.5  # Grow slightly before popping
-        anim['puyo'].pop_alpha = 255 * (1 - progress)  # Fade out
-        
-        # Remove completed animations
-        if anim['frame'] >= POP_ANIMATION_FRAMES:
-            pop_animations.pop(i)
-
-def check_game_over():
-    # Game is over if there are puyos in the top row
-    for x in range(GRID_WIDTH):
-        if board[0][x] is not None:
-            return True
-    return False
-
-def draw_board():
-    # Draw AWS-themed background
-    draw_background()
+    # The board changed, so the landing predictions did too
+    landing_cache.clear()
+    if show_potential:
+        update_potential()
+    
+    # The piece locked and the whole chain is resolved: show it over time
+    start_chain_playback(settlement, score, total_cleared, max_chain)
+    if args.practice and not settlement.game_over:
+        rewind_buffer.push(snapshot.snapshot(game))
+    
+    # Check for game over
+    if settlement.game_over:
+        if args.record:
+            recorded_games += 1
+            replay.save(recorder.finish(game), f"{args.record}-{recorded_games}.pyrp")
+        end_time = pygame.time.get_ticks()  # Record end time when game over
+        game_state = STATE_CONTINUE  # Show continue screen
+        continue_start_time = 0  # Will be set after animation completes
+        game_over_start_time = pygame.time.get_ticks()  # Start game over animation
+        continue_option = CONTINUE_OPTION_YES  # Default to Yes
+
+def rewind():
+    # Go back to where the last piece appeared (practice mode); once the
+    # game is over, to where the piece that lost appeared
+    global playback, clearing_groups, animating_sprites, hint_piece, hint_move, game_state
+    if not game.game_over and len(rewind_buffer) > 1:
+        rewind_buffer.pop()
+    data = rewind_buffer.peek()
+    if data is None:
+        return
+    snapshot.restore(data, game)
+    recorder.truncate(game.ticks)
+    spectate_publisher.countdown = 0  # Spectators get the rewound game as a keyframe
+    sync_sprites()
+    landing_cache.clear()
+    input_queue.clear()
+    clearing_groups = []
+    playback = None
+    pop_particles.clear()
+    animating_sprites = set()
+    hint_piece = None
+    hint_move = None
+    if show_potential:
+        update_potential()
+    game_state = STATE_PLAYING
+
+def render_chrome():
+    # Everything on the playing screen that never changes, drawn once
+    surface = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+    draw_decorations(surface)
     
     # Draw board outline
     board_rect = pygame.Rect(BOARD_LEFT - 2, BOARD_TOP - 2, 
                             GRID_WIDTH * GRID_SIZE + 4, GRID_HEIGHT * GRID_SIZE + 4)
-    pygame.draw.rect(screen, BLACK, board_rect, 2)
+    pygame.draw.rect(surface, BLACK, board_rect, 2)
     
     # Draw grid
     for y in range(GRID_HEIGHT):
         for x in range(GRID_WIDTH):
             cell_rect = pygame.Rect(BOARD_LEFT + x * GRID_SIZE, BOARD_TOP + y * GRID_SIZE, 
                                    GRID_SIZE, GRID_SIZE)
-            pygame.draw.rect(screen, LIGHT_GRAY, cell_rect, 1)
+            pygame.draw.rect(surface, LIGHT_GRAY, cell_rect, 1)
+    
+    # Draw next piece area
+    next_rect = pygame.Rect(NEXT_AREA_X, NEXT_AREA_Y, 120, 120)
+    pygame.draw.rect(surface, LIGHT_GRAY, next_rect, 2)
+    
+    next_text = font.render("NEXT", True, BLACK)
+    surface.blit(next_text, (NEXT_AREA_X + 35, NEXT_AREA_Y - 30))
+    
+    # Draw controls in the bottom right
+    controls_title = font.render("操作方法:", True, BLACK)
+    surface.blit(controls_title, (NEXT_AREA_X, CONTROLS_Y))
+    
+    controls = [
+        "←→: 左右移動",
+        "↑/SPACE: 回転",
+        "↓: 高速落下",
+        "H: ヒント",
+        "C: 連鎖マップ"
+    ]
+    if args.practice:
+        controls.append("BS: 巻き戻し")
+    
+    for i, control in enumerate(controls):
+        control_text = font.render(control, True, BLACK)
+        surface.blit(control_text, (NEXT_AREA_X, CONTROLS_Y + 25 + i * 20))
+    
+    return surface.convert_alpha()
+
+def draw_board(alpha=0.0):
+    # Add the moving parts of the playing screen to the compositor;
+    # the gradient and the board chrome are static layers
+    
+    # Draw AWS-style clouds
+    for i, (img, position) in enumerate(cloud_particles.sprites()):
+        compositor.add(LAYER_CLOUDS, ('cloud', i), img, position, img.get_size())
     
     # Draw placed puyos
-    for y in range(GRID_HEIGHT):
-        for x in range(GRID_WIDTH):
-            if board[y][x] is not None:
-                board[y][x].draw(screen)
+    for (x, y), sprite in board_sprites.items():
+        sprite_layout = sprite.layout(alpha=alpha)
+        if sprite_layout is not None:
+            img, img_rect = sprite_layout
+            compositor.add(LAYER_PUYOS, ('puyo', x, y), img, img_rect.topleft, img)
     
-    # Draw current piece
-    if current_piece:
-        current_piece.draw(screen)
+    # Draw current piece (the next one is already spawned while a chain plays)
+    if game.current_piece and playback is None:
+        draw_piece(game.current_piece)
     
     # Draw pop animations
-    for anim in pop_animations:
-        anim['puyo'].draw(screen)
-    
-    # Draw next piece preview - moved to the right side
-    next_area_x = BOARD_LEFT + GRID_WIDTH * GRID_SIZE + 30
-    next_area_y = BOARD_TOP
+    for i, (img, position) in enumerate(pop_particles.sprites(alpha)):
+        compositor.add(LAYER_PUYOS, ('pop', i), img, position, img)
     
-    # Draw next piece area
-    next_rect = pygame.Rect(next_area_x, next_area_y, 120, 120)
-    pygame.draw.rect(screen, LIGHT_GRAY, next_rect, 2)
+    if versus is not None:
+        draw_remote()
     
-    next_text = font.render("NEXT", True, BLACK)
-    screen.blit(next_text, (next_area_x + 35, next_area_y - 30))
+    # Chain potential heatmap, redrawn only when the board settles
+    if show_potential and potential_version:
+        compositor.add(LAYER_HUD, 'potential', potential_surface, (NEXT_AREA_X, HEATMAP_Y), potential_version)
     
-    if next_piece:
+    if game.next_piece:
         # Draw next piece centered in the next area
         # Fixed positioning for the next piece preview
-        next_main_x = next_area_x + 60
-        next_main_y = next_area_y + 40
-        next_sub_x = next_area_x + 60
-        next_sub_y = next_area_y + 80
+        next_main_x = NEXT_AREA_X + 60
+        next_main_y = NEXT_AREA_Y + 40
+        next_sub_x = NEXT_AREA_X + 60
+        next_sub_y = NEXT_AREA_Y + 80
         
         # Draw main puyo
-        main_img = images[next_piece.main_puyo.service_type]
+        main_img = atlas.sprite(game.next_piece.main_type)
         main_rect = main_img.get_rect(center=(next_main_x, next_main_y))
-        screen.blit(main_img, main_rect)
+        compositor.add(LAYER_PUYOS, ('next', 0), main_img, main_rect.topleft, game.next_piece.main_type)
         
         # Draw sub puyo
-        sub_img = images[next_piece.sub_puyo.service_type]
+        sub_img = atlas.sprite(game.next_piece.sub_type)
         sub_rect = sub_img.get_rect(center=(next_sub_x, next_sub_y))
-        screen.blit(sub_img, sub_rect)
-    
-    # Draw score and level at the bottom right
-    info_area_x = next_area_x
-    info_area_y = next_area_y + 150
-    
-    score_text = font.render(f"トータルスコア: {score}", True, BLACK)
-    screen.blit(score_text, (info_area_x, info_area_y))
-    
-    level_text = font.render(f"レベル: {level}", True, BLACK)
-    screen.blit(level_text, (info_area_x, info_area_y + 40))
-    
-    # Draw statistics
-    stats_y = info_area_y + 80
-    
-    # Draw total cleared puyos
-    cleared_text = font.render(f"消した数: {total_cleared}", True, BLACK)
-    screen.blit(cleared_text, (info_area_x, stats_y))
-    
-    # Draw max chain
-    max_chain_text = font.render(f"最大れんさ数: {max_chain}", True, BLACK)
-    screen.blit(max_chain_text, (info_area_x, stats_y + 30))
+        compositor.add(LAYER_PUYOS, ('next', 1), sub_img, sub_rect.topleft, game.next_piece.sub_type)
+    
+    # Draw score and level at the bottom right, following the chain while it plays
+    hud = playback if playback is not None else game
+    hud_values = [
+        ('score', "トータルスコア: ", f"{hud.score}", INFO_AREA_Y),
+        ('level', "レベル: ", f"{game.level}", INFO_AREA_Y + 40),
+        # Statistics
+        ('cleared', "消した数: ", f"{hud.total_cleared}", STATS_Y),
+        ('max_chain', "最大れんさ数: ", f"{hud.max_chain}", STATS_Y + 30)
+    ]
     
     # Draw play time
     if start_time > 0:
-        if game_over:
+        if game.game_over:
             # If game is over, use the end time
             play_time = (end_time - start_time) // 1000  # Convert to seconds
         else:
             # If game is still active, use current time
             play_time = (pygame.time.get_ticks() - start_time) // 1000
-        
-        time_text = font.render(f"プレイタイム: {play_time}秒", True, BLACK)
-        screen.blit(time_text, (info_area_x, stats_y + 60))
-    
-    # Draw controls in the bottom right
-    controls_y = stats_y + 100
-    controls_title = font.render("操作方法:", True, BLACK)
-    screen.blit(controls_title, (info_area_x, controls_y))
-    
-    controls = [
-        "←→: 左右移動",
-        "↑/SPACE: 回転",
-        "↓: 高速落下"
-    ]
-    
-    for i, control in enumerate(controls):
-        control_text = font.render(control, True, BLACK)
-        screen.blit(control_text, (info_area_x, controls_y + 25 + i * 20))
-    
-    # Draw chain count if active
-    if chain_count > 1 and is_chain_active:
+        hud_values.append(('time', "プレイタイム: ", f"{play_time}秒", STATS_Y + 60))
+    
+    # The label and each character of the value are cached separately,
+    # so a changing value never renders a new surface
+    for key, label, value, y in hud_values:
+        label_surface = text_cache.render(font, label, BLACK)
+        compositor.add(LAYER_HUD, (key, 'label'), label_surface, (NEXT_AREA_X, y), label)
+        x = NEXT_AREA_X + label_surface.get_width()
+        for i, char in enumerate(value):
+            char_surface = text_cache.render(font, char, BLACK)
+            compositor.add(LAYER_HUD, (key, i), char_surface, (x, y), char)
+            x += char_surface.get_width()
+    
+    # Draw chain count while its puyos blink
+    if hud.chain_count > 1 and clearing_groups:
         # Only display for a certain duration
-        if pygame.time.get_ticks() - chain_display_time < CHAIN_DISPLAY_DURATION:
-            # Create chain text with orange fill and black outline
-            chain_text = large_font.render(f"{chain_count}れんさ！", True, ORANGE)
-            
-            # Calculate position - center of screen
+        if sim_time() - chain_display_time < CHAIN_DISPLAY_DURATION:
+            # Orange text with a black outline in the center of the screen
+            text = f"{hud.chain_count}れんさ！"
+            chain_text = text_cache.render(large_font, text, ORANGE, BLACK, 2)
             chain_rect = chain_text.get_rect(center=(SCREEN_WIDTH // 2, SCREEN_HEIGHT // 2))
-            
-            # Draw black outline
-            outline_size = 2
-            for dx in range(-outline_size, outline_size + 1):
-                for dy in range(-outline_size, outline_size + 1):
-                    if dx != 0 or dy != 0:
-                        outline_rect = chain_text.get_rect(
-                            center=(SCREEN_WIDTH // 2 + dx, SCREEN_HEIGHT // 2 + dy)
-                        )
-                        outline_text = large_font.render(f"{chain_count}れんさ！", True, BLACK)
-                        screen.blit(outline_text, outline_rect)
-            
-            # Draw the main orange text on top
-            screen.blit(chain_text, chain_rect)
+            compositor.add(LAYER_HUD, 'chain', chain_text, chain_rect.topleft, text)
+
+def surface_allocations():
+    # Surfaces made since startup by the sprite atlas and the text cache
+    return atlas.allocations + text_cache.misses
+
+def update_stats(work_time, frame_time):
+    # For --stats: print the frame time, missed frames and surface
+    # allocations once a second, and how the hints are doing
+    global stats_frames, stats_work_time, stats_worst_time, stats_missed_frames
+    global stats_allocations, stats_report_time
+    
+    stats_frames += 1
+    stats_work_time += work_time
+    stats_worst_time = max(stats_worst_time, work_time)
+    if frame_time > MISSED_FRAME_TIME:
+        stats_missed_frames += 1
+    now = pygame.time.get_ticks()
+    if now - stats_report_time < 1000:
+        return
+    
+    allocations = surface_allocations() - stats_allocations
+    report = (f"{stats_frames} frames, {stats_work_time * 1000 / stats_frames:.2f} ms per frame, "
+              f"worst {stats_worst_time * 1000:.2f} ms, {stats_missed_frames} missed, "
+              f"{allocations} surfaces allocated ({allocations / stats_frames:.2f} per frame)")
+    if hint_worker is not None and hint_worker.answers:
+        report += (f", hints so far: {hint_worker.answers} in "
+                   f"{hint_worker.search_time * 1000 / hint_worker.answers:.1f} ms on average, "
+                   f"{hint_worker.cancelled} cancelled")
+    print(report)
+    stats_frames = 0
+    stats_work_time = 0.0
+    stats_worst_time = 0.0
+    stats_missed_frames = 0
+    stats_allocations += allocations
+    stats_report_time = now
 
 def reset_game():
-    global board, current_piece, next_piece, game_over, score, level, fall_speed, last_fall_time
-    global clearing_groups, clear_animation_frame, chain_count, is_chain_active, pop_animations
-    global total_cleared, max_chain, start_time, end_time, game_state
-    
-    board = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-    current_piece = None
-    next_piece = None
-    game_over = False
-    score = 0
-    level = 1
-    fall_speed = 0.5
-    last_fall_time = pygame.time.get_ticks()
+    global game, recorder, board_sprites, sim_ticks, sim_accumulator
+    global clearing_groups, playback, animating_sprites
+    global start_time, end_time, game_state, hint_piece, hint_move
+    global versus, versus_round
+    
+    if replay_file is not None:
+        game = engine.new_game(replay_file.seed, replay_file.width, replay_file.height)
+    elif versus_transport is not None:
+        # Both players get the same pieces; the other one's game is followed with rollback
+        versus_round += 1
+        seed = (args.seed or 0) + versus_round
+        game = engine.new_game(seed)
+        versus = netplay.RollbackSession(engine.new_game(seed), versus_transport, versus_round)
+    else:
+        game = engine.new_game(args.seed)
+    recorder = replay.ReplayRecorder(game)
+    spectate_publisher.countdown = 0
+    board_sprites = {}
+    landing_cache.clear()
+    rewind_buffer.clear()
+    if args.practice:
+        rewind_buffer.push(snapshot.snapshot(game))
+    hint_piece = None
+    hint_move = None
+    sim_ticks = 0
+    sim_accumulator = 0.0
+    input_queue.clear()
     
     # Reset animation variables
     clearing_groups = []
-    clear_animation_frame = 0
-    chain_count = 0
-    is_chain_active = False
-    pop_animations = []
+    playback = None
+    pop_particles.clear()
+    animating_sprites = set()
     
     # Reset statistics
-    total_cleared = 0
-    max_chain = 0
     start_time = pygame.time.get_ticks()
     end_time = 0
     
+    if show_potential:
+        update_potential()
+    
     # Set game state to playing
     game_state = STATE_PLAYING
-    
-    create_new_piece()
 
 # Game variables initialization
 clock = pygame.time.Clock()
-board = [[None for _ in range(GRID_WIDTH)] for _ in range(GRID_HEIGHT)]
-current_piece = None
-next_piece = None
-game_over = False
-score = 0
-level = 1
-fall_speed = 0.5  # Initial fall speed in seconds
-last_fall_time = 0
+cloud_images = {}  # Cloud surfaces by size
+cloud_particles = create_cloud_particles()
+icon_particles = create_icon_particles()
+background_surface = render_gradient()
+prediction_images = load_prediction_images()
+hint_images = load_hint_images()
+potential = ChainPotential()  # Chains one more puyo would start, for the heatmap
+show_potential = False  # Heatmap on or off (C key)
+potential_surface = pygame.Surface((HEATMAP_CELL[1] + 2 + GRID_WIDTH * HEATMAP_CELL[0],
+                                    20 + engine.NUM_SERVICES * HEATMAP_CELL[1]), pygame.SRCALPHA)
+potential_version = 0  # Times potential_surface was drawn, 0 before the first time
+text_cache = TextCache()  # Rendered labels, outlines included
+dim_overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+dim_overlay.fill((0, 0, 0, 128))  # Semi-transparent black behind the continue screen
+fade_overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+fade_overlay.fill(BLACK)
+compositor = Compositor(screen, LAYER_COUNT)  # Redraws only what changed on the playing screen
+compositor.set_static(LAYER_BACKGROUND, background_surface)
+compositor.set_static(LAYER_CHROME, render_chrome())
+game = engine.GameState()  # Rules state, replaced by reset_game()
+recorder = replay.ReplayRecorder(game)  # Inputs of the current game
+recorded_games = 0  # Replays saved with --record
+board_sprites = {}  # Visual puyos on the board keyed by (x, y)
+landing_cache = {}  # engine.landing_positions() by column for the current board
+sim_ticks = 0  # Simulation ticks since the game started
+sim_accumulator = 0.0  # Real milliseconds not yet simulated
+last_frame_time = 0
+input_queue = []  # engine.INPUT_* masks waiting for the next ticks
+rewind_buffer = snapshot.RewindBuffer(REWIND_SNAPSHOTS)  # Game at each new piece in practice mode
+cpu_pilot = ai.Autopilot(ai.BeamSearch().best_move)  # Plays with --cpu
+hint_worker = HintWorker() if args.hints else None  # While hints are on (H key)
+hint_piece = None  # The piece hint_request was made for
+hint_request = 0
+hint_move = None  # Suggested (column, rotation) for hint_piece once it arrived
+versus_transport = None  # UDP socket to the other player with --versus
+if args.versus:
+    peer_host, peer_port = args.versus.rsplit(':', 1)
+    versus_transport = netplay.UdpTransport(args.port, (peer_host, int(peer_port)),
+                                            args.net_latency / 1000, loss=args.net_loss)
+versus = None  # RollbackSession of the current round
+spectate_server = None  # Sends the game to spectators with --spectate-port
+if args.spectate_port:
+    spectate_server = spectate.SpectatorServer()
+    try:
+        spectate_server.start_in_thread(port=args.spectate_port)
+    except OSError as e:
+        pygame.quit()
+        sys.exit(f"--spectate-port {args.spectate_port}: {e}")
+spectate_publisher = spectate.GamePublisher(0)
+versus_round = 0
+remote_surface = pygame.Surface((GRID_WIDTH * REMOTE_CELL + 30, 20 + GRID_HEIGHT * REMOTE_CELL),
+                                pygame.SRCALPHA)  # The other player's board, drawn small
+remote_shade = pygame.Surface((GRID_WIDTH * REMOTE_CELL, GRID_HEIGHT * REMOTE_CELL), pygame.SRCALPHA)
+remote_shade.fill((128, 128, 128, 160))  # Over the remote board once that game is over
+remote_key = None  # What remote_surface shows
 
 # Game state
 game_state = STATE_TITLE
@@ -1042,14 +1081,11 @@ game_over_start_time = 0  # When game over animation started
 
 # Animation variables
 clearing_groups = []  # Groups of puyos being cleared
-clear_animation_frame = 0  # Current frame of clear animation
-clear_animation_start_time = 0  # When the current clear animation started
-chain_count = 0  # Current chain count
-max_chain = 0  # Maximum chain achieved
-is_chain_active = False  # Whether a chain reaction is in progress
-pop_animations = []  # List of pop animations in progress
-chain_display_time = 0  # When the current chain text started displaying
-total_cleared = 0  # Total number of puyos cleared
+playback = None  # ChainPlayback of the last lock while it is being shown
+# Pop animations in progress, one particle kind per service type
+pop_particles = ParticleSystem([atlas.pops[service_type] for service_type in range(engine.NUM_SERVICES)])
+animating_sprites = set()  # Puyos with animation state, updated every tick
+chain_display_time = 0  # Simulation time the current chain text started displaying
 start_time = 0  # When the game started
 end_time = 0   # When the game ended (for game over)
 
@@ -1057,9 +1093,92 @@ end_time = 0   # When the game ended (for game over)
 game_state = STATE_TITLE  # Start at title screen
 start_time = pygame.time.get_ticks()  # Record the start time
 
+# Statistics for --stats
+stats_frames = 0
+stats_work_time = 0.0  # Seconds spent on frames, without waiting for the next one
+stats_worst_time = 0.0
+stats_missed_frames = 0  # Frames that came later than MISSED_FRAME_TIME after the last one
+stats_allocations = surface_allocations()
+stats_report_time = pygame.time.get_ticks()
+
+# Key to engine input for the playing screen
+PIECE_INPUTS = {
+    K_LEFT: engine.INPUT_LEFT,
+    K_RIGHT: engine.INPUT_RIGHT,
+    K_UP: engine.INPUT_ROTATE,
+    K_SPACE: engine.INPUT_ROTATE
+}
+
+def watch_frames(host, port):
+    # Frames from a spectate server, read in a thread and applied by run_wall()
+    frames = collections.deque()
+    
+    async def read():
+        reader, writer = await spectate.subscribe(host, port)
+        async for frame in spectate.read_frames(reader):
+            frames.append(frame)
+    
+    threading.Thread(target=asyncio.run, args=(read(),), daemon=True).start()
+    return frames
+
+def run_wall():
+    # --wall and --watch: many small live boards instead of the game
+    count = args.wall or WALL_BOARDS
+    board_wall = BoardWall(screen, atlas, count, small_font, text_cache)
+    if args.watch:
+        host, port = args.watch.rsplit(':', 1)
+        frames = watch_frames(host, int(port))
+        mirrors = {}  # spectate.Mirror by game id, in the order the games were first seen
+    else:
+        search = ai.BeamSearch(depth=1, time_budget=math.inf)
+        seed = args.seed or 0
+        games = [engine.new_game(seed + i) for i in range(count)]
+        pilots = [ai.Autopilot(search.best_move, input_interval=4) for _ in games]
+        lost_ticks = [0] * count  # Ticks each game has been over for
+        seed += count
+    accumulator = 0.0
+    last_time = pygame.time.get_ticks()
+    while True:
+        for event in pygame.event.get():
+            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                pygame.quit()
+                sys.exit()
+        
+        if args.watch:
+            while frames:
+                game_id, kind, data = frames.popleft()
+                if game_id in mirrors or len(mirrors) < count:
+                    mirrors.setdefault(game_id, spectate.Mirror()).apply(kind, data)
+            states = [mirror.state for mirror in mirrors.values()]
+        else:
+            current_time = pygame.time.get_ticks()
+            accumulator += min(current_time - last_time, MAX_FRAME_TIME)
+            last_time = current_time
+            while accumulator >= TICK_MS:
+                accumulator -= TICK_MS
+                for i, game in enumerate(games):
+                    if not game.game_over:
+                        engine.tick(game, pilots[i].inputs(game))
+                        continue
+                    lost_ticks[i] += 1
+                    if lost_ticks[i] >= WALL_RESTART_TICKS:
+                        games[i] = engine.new_game(seed)
+                        lost_ticks[i] = 0
+                        seed += 1
+            states = games
+        
+        pygame.display.update(board_wall.draw(states))
+        clock.tick(FPS)
+
+if args.wall or args.watch:
+    run_wall()
+
 # Main game loop
 while True:
     current_time = pygame.time.get_ticks()
+    frame_time = min(current_time - last_frame_time, MAX_FRAME_TIME)
+    last_frame_time = current_time
+    frame_start = time.perf_counter()
     
     # Handle events
     for event in pygame.event.get():
@@ -1073,28 +1192,26 @@ while True:
                 reset_game()  # Start the game
         
         # Playing state controls
-        elif game_state == STATE_PLAYING and not is_chain_active:
-            if event.type == KEYDOWN:
-                if event.key == K_LEFT:
-                    if current_piece:
-                        current_piece.move_left()
-                elif event.key == K_RIGHT:
-                    if current_piece:
-                        current_piece.move_right()
-                elif event.key == K_DOWN:
-                    if current_piece:
-                        current_piece.start_fast_drop()
-                elif event.key == K_UP or event.key == K_SPACE:
-                    if current_piece:
-                        current_piece.rotate_clockwise()
-                elif event.key == K_SPACE:
-                    if current_piece:
-                        current_piece.hard_drop()
-            
-            if event.type == KEYUP:
-                if event.key == K_DOWN:
-                    if current_piece:
-                        current_piece.stop_fast_drop()
+        elif game_state == STATE_PLAYING:
+            if event.type == KEYDOWN and event.key in PIECE_INPUTS:
+                # Applied on the next ticks; during a chain only a few are kept
+                if playback is None or len(input_queue) < INPUT_BUFFER_SIZE:
+                    input_queue.append(PIECE_INPUTS[event.key])
+            elif event.type == KEYDOWN and event.key == K_h:
+                # Toggle the suggested move; the search runs in another process
+                if hint_worker is None:
+                    hint_worker = HintWorker()
+                else:
+                    hint_worker.close()
+                    hint_worker = None
+                hint_piece = None
+                hint_move = None
+            elif event.type == KEYDOWN and event.key == K_c:
+                show_potential = not show_potential
+                if show_potential:
+                    update_potential()
+            elif event.type == KEYDOWN and event.key == K_BACKSPACE and args.practice:
+                rewind()
         
         # Continue screen controls
         elif game_state == STATE_CONTINUE:
@@ -1102,106 +1219,52 @@ while True:
                 if event.key == K_UP or event.key == K_DOWN:
                     # Toggle between Yes and No
                     continue_option = 1 - continue_option
+                elif event.key == K_BACKSPACE and args.practice:
+                    rewind()  # Take the losing piece back
                 elif event.key == K_RETURN:
                     if continue_option == CONTINUE_OPTION_YES:
                         reset_game()  # Restart the game
                     else:
                         game_state = STATE_TITLE  # Return to title screen
     
+    if versus is not None:
+        # Inputs from the other player; the rollback happens here
+        versus.poll()
+    
+    update_clouds()
+    display_updated = False
+    
     # Title screen logic
     if game_state == STATE_TITLE:
         draw_title_screen()
     
     # Playing state logic
     elif game_state == STATE_PLAYING:
-        # Update pop animations
-        update_pop_animations()
-        
-        # Handle chain reactions
-        if is_chain_active:
-            # Update clear animation
-            if update_clear_animation():
-                # When animation is complete, apply gravity
-                gravity_applied = True
-                while gravity_applied:
-                    gravity_applied = apply_gravity()
-                    # Small delay to make the falling visible
-                    pygame.time.delay(50)
-                    # Draw the board to show the falling animation
-                    draw_board()
-                    pygame.display.flip()
-                
-                # Find new groups after gravity
-                new_groups = find_connected_groups()
-                if new_groups:
-                    # Start a new chain reaction after a delay
-                    pygame.time.delay(CLEAR_DELAY)  # Longer delay between chains
-                    start_clear_animation(new_groups)
-                else:
-                    # No more chains, reset chain count and continue game
-                    is_chain_active = False
-                    chain_count = 0
-                    
-                    # Create a new piece if needed
-                    if current_piece is None:
-                        create_new_piece()
-        
-        # Handle continuous fast drop when down key is pressed
-        elif current_piece:  # Only if not in chain animation and piece exists
-            keys = pygame.key.get_pressed()
-            if keys[K_DOWN] and current_time - current_piece.last_drop_time > 30:  # Fast drop speed
-                current_piece.move_down()
-                current_piece.last_drop_time = current_time
-            
-            # Handle automatic falling
-            if current_time - last_fall_time > fall_speed * 1000:
-                if not current_piece.move_down():
-                    # Piece cannot move down further, lock it in place
-                    lock_piece()
-                    
-                    # Apply gravity immediately after locking a piece
-                    gravity_applied = True
-                    while gravity_applied:
-                        gravity_applied = apply_gravity()
-                        # Small delay to make the falling visible
-                        pygame.time.delay(50)
-                        # Draw the board to show the falling animation
-                        draw_board()
-                        pygame.display.flip()
-                    
-                    # Check for chains
-                    groups = find_connected_groups()
-                    if groups:
-                        # Start chain reaction
-                        start_clear_animation(groups)
-                    else:
-                        # No chains, create a new piece
-                        create_new_piece()
-                    
-                    # Check for game over
-                    if check_game_over():
-                        game_over = True
-                        end_time = pygame.time.get_ticks()  # Record end time when game over
-                        game_state = STATE_CONTINUE  # Show continue screen
-                        continue_start_time = 0  # Will be set after animation completes
-                        game_over_start_time = pygame.time.get_ticks()  # Start game over animation
-                        continue_option = CONTINUE_OPTION_YES  # Default to Yes
-                    
-                    # Update level and fall speed based on score
-                    new_level = 1 + score // 1000
-                    if new_level > level:
-                        level = new_level
-                        fall_speed = max(0.1, 0.5 - (level - 1) * 0.05)
-                
-                last_fall_time = current_time
+        # Run the simulation in fixed ticks for the time that passed
+        down_held = pygame.key.get_pressed()[K_DOWN]
+        sim_accumulator += frame_time
+        while sim_accumulator >= TICK_MS and game_state == STATE_PLAYING:
+            if versus is not None and not versus.can_advance():
+                # Too far ahead of the other player: wait for their inputs
+                sim_accumulator = 0.0
+                break
+            sim_accumulator -= TICK_MS
+            simulate_tick(down_held)
+        if hint_worker is not None:
+            update_hint()
         
-        # Draw the game board
-        draw_board()
+        # Draw the game board between the last tick and the next one
+        # and update only the parts of the display that changed
+        draw_board(sim_accumulator / TICK_MS)
+        compositor.end_frame()
+        display_updated = True
     
     # Continue screen logic
     elif game_state == STATE_CONTINUE:
         # Draw the game board in the background
         draw_board()
+        compositor.invalidate()
+        compositor.end_frame(update_display=False)
         # Draw the continue screen overlay
         draw_continue_screen()
     
@@ -1209,12 +1272,19 @@ while True:
     elif game_state == STATE_FADE_OUT:
         # Draw the continue screen in the background
         draw_board()
+        compositor.invalidate()
+        compositor.end_frame(update_display=False)
         draw_continue_screen()
         # Draw the fade out effect
         draw_fade_out()
     
-    # Update the display
-    pygame.display.flip()
+    if not display_updated:
+        # Other screens draw over everything: redraw the whole board next time
+        compositor.invalidate()
+        pygame.display.flip()
+    
+    if args.stats:
+        update_stats(time.perf_counter() - frame_start, frame_time)
     
     # Cap the frame rate
     clock.tick(FPS)
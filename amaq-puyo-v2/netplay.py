@@ -0,0 +1,252 @@
+"""Two player versus over UDP with rollback: no input delay.
+
+Both players play the same seeded pieces, and a game is a pure function
+of its seed and its inputs (see engine.py), so each client only sends
+its inputs, one byte per tick. The local game ticks with the local
+inputs at once. The remote game is run on the same ticks with the
+remote inputs where they have arrived and a guess where they have not:
+held bits (down, waiting) are kept, presses are not. When the real
+inputs arrive and differ from the guess, the remote game is put back to
+a snapshot (snapshot.py) from before the first wrong tick and played
+again up to the present, within the frame.
+
+The boards do not interact (the rules have no garbage), so only the
+remote game is ever rolled back. The local game may run at most
+max_rollback ticks ahead of the last remote input that arrived;
+can_advance() says when it has to wait.
+
+Every packet carries the local inputs the peer has not acknowledged yet,
+so a lost packet costs nothing but the time until the next one.
+UdpTransport can hold packets back and drop them, to try all this on
+localhost:
+
+    transport = UdpTransport(5001, ('127.0.0.1', 5002), latency=0.05, loss=0.05)
+    session = RollbackSession(engine.new_game(seed), transport)
+    # every tick
+    session.poll()
+    if session.can_advance():
+        engine.tick(game, inputs)
+        session.advance(inputs)
+    session.state  # The remote game, as well as it is known
+"""
+import heapq
+import random
+import socket
+import struct
+import time
+
+import engine
+import snapshot
+
+INPUT_WAIT = 0x80  # Not an engine input: the game did not tick (a chain was being shown)
+HOLD_INPUTS = engine.INPUT_DOWN | INPUT_WAIT  # Guessed to stay as they were
+MAX_ROLLBACK = 60  # Ticks, half a second
+RESEND_INTERVAL = 0.02  # Seconds between packets while no ticks are sent
+
+MAGIC = b'PYNP'
+PACKET = struct.Struct('<4sIII')  # Magic, round, remote ticks received, first tick; inputs follow
+MAX_PACKET = 1400
+
+
+class UdpTransport:
+    """A non-blocking UDP socket to one peer.
+
+    latency (seconds, plus up to jitter more) and loss (a fraction of the
+    packets) are added on the sending side, for testing.
+    """
+
+    def __init__(self, port, peer, latency=0.0, jitter=0.0, loss=0.0, seed=None, host='0.0.0.0'):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((host, port))
+        self.socket.setblocking(False)
+        self.peer = peer
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.delayed = []  # Heap of (send time, number, packet)
+        self.count = 0
+        # Statistics
+        self.sent = 0
+        self.dropped = 0
+        self.received = 0
+
+    def send(self, packet):
+        self.sent += 1
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay <= 0:
+            self._send(packet)
+        else:
+            self.count += 1
+            heapq.heappush(self.delayed, (time.perf_counter() + delay, self.count, packet))
+
+    def receive(self):
+        """Packets that arrived since the last call. Also sends the held back packets that are due."""
+        now = time.perf_counter()
+        while self.delayed and self.delayed[0][0] <= now:
+            self._send(heapq.heappop(self.delayed)[2])
+        packets = []
+        while True:
+            try:
+                packet, _ = self.socket.recvfrom(MAX_PACKET)
+            except BlockingIOError:
+                return packets
+            except ConnectionError:
+                # The peer is not listening yet
+                continue
+            self.received += 1
+            packets.append(packet)
+
+    def _send(self, packet):
+        try:
+            self.socket.sendto(packet, self.peer)
+        except OSError:
+            pass
+
+    def close(self):
+        self.socket.close()
+
+
+class RollbackSession:
+    """The remote game of a versus round, kept up to date with rollback.
+
+    state is the remote engine.GameState. round tells the rounds apart:
+    packets of another round are ignored, so the player who starts a
+    round first waits for the other.
+    """
+
+    def __init__(self, state, transport, round=0, max_rollback=MAX_ROLLBACK):
+        self.state = state
+        self.transport = transport
+        self.round = round
+        self.max_rollback = max_rollback
+        self.tick = 0  # Ticks played
+        # Local inputs from tick local_base on; the peer has all before acked
+        self.local_inputs = bytearray()
+        self.local_base = 0
+        self.acked = 0
+        # Remote inputs from tick remote_base on, known up to confirmed and guessed after
+        self.remote_inputs = bytearray()
+        self.remote_base = 0
+        self.confirmed = 0
+        self.over_tick = None  # Tick the remote game ended on, as well as it is known
+        self.remote_over = False  # The remote game is over for certain
+        # Snapshot of the remote game before each of the last ticks, by tick % size
+        self.snapshots = [None] * (max_rollback + 1)
+        self.last_send = 0.0
+        # Statistics
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.worst_rollback = 0  # Ticks
+        self.worst_resimulation = 0.0  # Seconds
+        self.resimulation_time = 0.0
+        self.stalls = 0  # can_advance() calls that said no
+
+    def can_advance(self):
+        """True if the local game may tick now, False while it is too far ahead of the remote one."""
+        if self.remote_over or self.tick - self.confirmed < self.max_rollback:
+            return True
+        self.stalls += 1
+        return False
+
+    def advance(self, inputs):
+        """Play one tick: inputs are the local ones for it, or INPUT_WAIT if the local game did not tick."""
+        tick = self.tick
+        self.local_inputs.append(inputs)
+        self.tick += 1
+        if self.remote_over:
+            # Nothing the remote player does matters any more
+            self._send()
+            return
+        if tick >= self.confirmed:
+            self.remote_inputs.append(self._guess())
+        self.snapshots[tick % len(self.snapshots)] = snapshot.snapshot(self.state)
+        self._play(tick)
+        self._send()
+
+    def poll(self):
+        """Take in the packets that arrived, rolling back if a guess was wrong. Call every frame."""
+        wrong = None
+        for packet in self.transport.receive():
+            if len(packet) < PACKET.size:
+                continue
+            magic, round, acked, first = PACKET.unpack_from(packet)
+            if magic != MAGIC or round != self.round:
+                continue
+            self.acked = max(self.acked, acked)
+            if self.remote_over:
+                continue
+            inputs = packet[PACKET.size:]
+            # Only what follows on from the inputs already known
+            for tick in range(max(first, self.confirmed), first + len(inputs)):
+                if tick != self.confirmed:
+                    break
+                value = inputs[tick - first]
+                index = tick - self.remote_base
+                if index < len(self.remote_inputs):
+                    if self.remote_inputs[index] != value and wrong is None:
+                        wrong = tick
+                    self.remote_inputs[index] = value
+                else:
+                    self.remote_inputs.append(value)
+                self.confirmed += 1
+        if wrong is not None and wrong < self.tick:
+            self._rollback(wrong)
+        if self.over_tick is not None and self.over_tick < self.confirmed:
+            self.remote_over = True
+        self._trim()
+        if time.perf_counter() - self.last_send >= RESEND_INTERVAL:
+            self._send()
+
+    def _guess(self):
+        if not self.confirmed:
+            return 0
+        return self.remote_inputs[self.confirmed - 1 - self.remote_base] & HOLD_INPUTS
+
+    def _play(self, tick):
+        # Tick the remote game with the input known or guessed for tick
+        inputs = self.remote_inputs[tick - self.remote_base]
+        if not inputs & INPUT_WAIT:
+            engine.tick(self.state, inputs)
+        if self.over_tick is None and self.state.game_over:
+            self.over_tick = tick
+
+    def _rollback(self, tick):
+        start = time.perf_counter()
+        snapshots = self.snapshots
+        snapshot.restore(snapshots[tick % len(snapshots)], self.state)
+        if self.over_tick is not None and self.over_tick >= tick:
+            self.over_tick = None
+        guess = self._guess()
+        for replayed in range(tick, self.tick):
+            if replayed > tick:
+                snapshots[replayed % len(snapshots)] = snapshot.snapshot(self.state)
+            if replayed >= self.confirmed:
+                self.remote_inputs[replayed - self.remote_base] = guess
+            self._play(replayed)
+        elapsed = time.perf_counter() - start
+        self.rollbacks += 1
+        self.resimulated += self.tick - tick
+        self.resimulation_time += elapsed
+        self.worst_rollback = max(self.worst_rollback, self.tick - tick)
+        self.worst_resimulation = max(self.worst_resimulation, elapsed)
+
+    def _trim(self):
+        # Keep only the inputs that can still be needed, so memory stays flat
+        drop = min(self.acked, self.tick) - self.local_base
+        if drop > 256:
+            del self.local_inputs[:drop]
+            self.local_base += drop
+        drop = min(self.confirmed, self.tick) - 1 - self.remote_base
+        if drop > 256:
+            del self.remote_inputs[:drop]
+            self.remote_base += drop
+
+    def _send(self):
+        first = max(self.acked, self.local_base)
+        inputs = self.local_inputs[first - self.local_base:][:MAX_PACKET - PACKET.size]
+        self.transport.send(PACKET.pack(MAGIC, self.round, self.confirmed, first) + inputs)
+        self.last_send = time.perf_counter()
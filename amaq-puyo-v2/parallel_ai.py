@@ -0,0 +1,157 @@
+"""Move search split over worker processes, deepening until a deadline.
+
+The root moves (every column and rotation of the current pair) are
+searched in parallel: a worker drops one root move and runs the beam
+search of ai.py on the pairs after it. The first round searches the
+current and next pairs, then every round goes one pair deeper until the
+time runs out. Pairs after the next one are not shown to the player, so
+a round averages the best results over a few sampled sequences of pairs,
+the same sequences for every root move. The move comes from the deepest
+round that every root move finished.
+
+Boards go to the workers as bytes (pack_colors()), and each worker keeps
+its own transposition table from task to task.
+
+    with ParallelSearch(workers=4, time_budget=0.2) as search:
+        column, rotation = search.best_move(game)
+        print(search.depth_reached, search.nodes_per_second)
+"""
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+import ai
+import bitboard
+import engine
+
+MASK_BYTES = (ai.WIDTH * ai.HEIGHT + 7) // 8
+LOSS_VALUE = -10 ** 9  # Value of a move after which every move loses
+
+_search = None  # The BeamSearch of this worker process
+
+
+def pack_colors(colors):
+    """Colour masks as bytes, MASK_BYTES per colour."""
+    return b''.join(mask.to_bytes(MASK_BYTES, 'little') for mask in colors)
+
+
+def unpack_colors(data):
+    return tuple(int.from_bytes(data[i:i + MASK_BYTES], 'little')
+                 for i in range(0, len(data), MASK_BYTES))
+
+
+def search_root(data, pairs, action, depth, samples, seed, beam_width, deadline):
+    """Value of playing action with pairs[0] on a packed board, looking depth pairs ahead.
+
+    Pairs past the known ones are sampled from seed, samples times.
+    deadline is a time.time() value. Returns (value, nodes, finished).
+    """
+    global _search
+    if _search is None:
+        _search = ai.BeamSearch()
+    _search.beam_width = beam_width
+    colors = unpack_colors(data)
+    main, sub = pairs[0]
+    child, key, gained, _, over = _search.table.simulate(colors, ai.zobrist(colors), main, sub, *action)
+    if over:
+        return LOSS_VALUE, 1, True
+
+    local_deadline = time.perf_counter() + (deadline - time.time())
+    rng = random.Random(seed)
+    unknown = max(0, depth - len(pairs))
+    runs = samples if unknown else 1
+    total = 0
+    nodes = 1
+    done = 0
+    while done < runs:
+        if done and time.perf_counter() > local_deadline:
+            # Samples left that there is no time for
+            break
+        rest = list(pairs[1:depth])
+        rest += [(rng.randrange(engine.NUM_SERVICES), rng.randrange(engine.NUM_SERVICES))
+                 for _ in range(unknown)]
+        best = _search.best_node(child, rest, local_deadline)
+        nodes += _search.nodes
+        # None is a subtree searched to the end where every move loses
+        total += gained + (LOSS_VALUE if best is None else best[0])
+        done += 1
+        if _search.cut_short:
+            break
+    finished = done == runs and not _search.cut_short
+    return total / done, nodes, finished
+
+
+class ParallelSearch:
+    """Root-split iterative deepening on a ProcessPoolExecutor.
+
+    workers defaults to the number of cores. The search stops at
+    max_depth pairs or when time_budget seconds are up.
+    """
+
+    def __init__(self, workers=None, time_budget=0.1, beam_width=8, samples=4, max_depth=5):
+        self.pool = ProcessPoolExecutor(workers)
+        self.time_budget = time_budget
+        self.beam_width = beam_width
+        self.samples = samples
+        self.max_depth = max_depth
+        self.seed = 0
+        # Statistics of the last search
+        self.nodes = 0
+        self.depth_reached = 0
+        self.elapsed = 0.0
+        self.nodes_per_second = 0.0
+
+    def best_move(self, state):
+        """(column, rotation) for the current piece of an engine.GameState."""
+        pairs = [(piece.main_type, piece.sub_type)
+                 for piece in (state.current_piece, state.next_piece) if piece is not None]
+        return self.search(tuple(bitboard.from_board(state.board).colors), pairs)
+
+    def search(self, colors, pairs):
+        """Best (column, rotation) for pairs[0]; the other known pairs follow it."""
+        start = time.time()
+        deadline = start + self.time_budget
+        data = pack_colors(colors)
+        self.seed += 1
+        self.nodes = 0
+        self.depth_reached = 0
+        best = None
+        fallback = {}
+        for depth in range(min(2, len(pairs)), self.max_depth + 1):
+            futures = {self.pool.submit(search_root, data, pairs, action, depth, self.samples,
+                                        self.seed, self.beam_width, deadline): action
+                       for action in ai.ACTIONS}
+            done, not_done = wait(futures, timeout=max(0.0, deadline - time.time()))
+            for future in not_done:
+                future.cancel()
+            values = {}
+            complete = not not_done
+            for future in done:
+                value, nodes, finished = future.result()
+                self.nodes += nodes
+                values[futures[future]] = value
+                complete = complete and finished
+            if not complete:
+                # Better than nothing if not even the first round finished
+                fallback = values
+                break
+            best = max(ai.ACTIONS, key=values.get)
+            self.depth_reached = depth
+            if time.time() > deadline:
+                break
+
+        self.elapsed = time.time() - start
+        self.nodes_per_second = self.nodes / self.elapsed if self.elapsed else 0.0
+        if best is None:
+            tried = [action for action in ai.ACTIONS if action in fallback]
+            best = max(tried, key=fallback.get) if tried else ai.ACTIONS[0]
+        return best
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,140 @@
+"""Effects kept in NumPy arrays and updated in batches.
+
+Every particle has a position, a velocity, an acceleration, an age and a
+lifetime, all in steps (ticks or frames, whatever update() is called
+with). It shows one frame of its kind's animation, picked by how far
+through its lifetime it is; scale and fade are baked into the frames,
+like in the sprite atlas. Dead particles are swap-removed: live particles
+from the end of the arrays move into the free slots, so the live ones
+always fill the first count entries and nothing is allocated per frame.
+"""
+import numpy as np
+
+INITIAL_CAPACITY = 64
+
+
+class ParticleSystem:
+    """A batch of particles. animations[kind] is the list of frames of that kind.
+
+    anchors[kind] is the point of the frames placed at the particle's
+    position; by default the center of each frame.
+    """
+
+    def __init__(self, animations, anchors=None, capacity=INITIAL_CAPACITY):
+        self.animations = [list(frames) for frames in animations]
+        self.last_frame = np.array([len(frames) - 1 for frames in self.animations], dtype=np.int32)
+
+        # Offset from the position to the top left corner, per kind and frame
+        frame_count = max(len(frames) for frames in self.animations)
+        self.offsets = np.zeros((len(self.animations), frame_count, 2), dtype=np.float32)
+        for kind, frames in enumerate(self.animations):
+            for frame, surface in enumerate(frames):
+                if anchors is None or anchors[kind] is None:
+                    self.offsets[kind, frame] = (surface.get_width() // 2, surface.get_height() // 2)
+                else:
+                    self.offsets[kind, frame] = anchors[kind]
+
+        self.count = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.position = np.zeros((capacity, 2), dtype=np.float32)
+        self.velocity = np.zeros((capacity, 2), dtype=np.float32)
+        self.acceleration = np.zeros((capacity, 2), dtype=np.float32)
+        self.age = np.zeros(capacity, dtype=np.float32)
+        self.lifetime = np.ones(capacity, dtype=np.float32)
+        self.kind = np.zeros(capacity, dtype=np.int32)
+
+    def _arrays(self):
+        return (self.position, self.velocity, self.acceleration, self.age, self.lifetime, self.kind)
+
+    def _reserve(self, count):
+        capacity = len(self.age)
+        if self.count + count <= capacity:
+            return
+        while capacity < self.count + count:
+            capacity *= 2
+        old = self._arrays()
+        self._allocate(capacity)
+        for new_array, old_array in zip(self._arrays(), old):
+            new_array[:self.count] = old_array[:self.count]
+
+    def spawn(self, kind, x, y, lifetime, vx=0.0, vy=0.0, ax=0.0, ay=0.0):
+        self._reserve(1)
+        i = self.count
+        self.position[i] = (x, y)
+        self.velocity[i] = (vx, vy)
+        self.acceleration[i] = (ax, ay)
+        self.age[i] = 0
+        self.lifetime[i] = lifetime
+        self.kind[i] = kind
+        self.count += 1
+
+    def spawn_many(self, kind, position, lifetime, velocity=0.0, acceleration=0.0):
+        """Spawn len(position) particles. Arguments broadcast like NumPy arrays."""
+        count = len(position)
+        self._reserve(count)
+        start, end = self.count, self.count + count
+        self.position[start:end] = position
+        self.velocity[start:end] = velocity
+        self.acceleration[start:end] = acceleration
+        self.age[start:end] = 0
+        self.lifetime[start:end] = lifetime
+        self.kind[start:end] = kind
+        self.count = end
+
+    def update(self, steps=1):
+        """Advance every particle and remove the dead ones.
+
+        Returns the kinds, positions and velocities of the particles that
+        died, so the caller can recycle them.
+        """
+        n = self.count
+        velocity = self.velocity[:n]
+        velocity += self.acceleration[:n] * steps
+        self.position[:n] += velocity * steps
+        self.age[:n] += steps
+
+        dead = np.flatnonzero(self.age[:n] >= self.lifetime[:n])
+        if dead.size == 0:
+            return self.kind[:0], self.position[:0], self.velocity[:0]
+        died = self.kind[dead], self.position[dead], self.velocity[dead]
+        self._remove(dead)
+        return died
+
+    def _remove(self, dead):
+        # Swap-remove: fill the dead slots in front of the new end with
+        # the live particles behind it
+        n = self.count
+        end = n - len(dead)
+        alive = np.ones(n - end, dtype=bool)
+        alive[dead[dead >= end] - end] = False
+        holes = dead[dead < end]
+        movers = np.flatnonzero(alive) + end
+        for array in self._arrays():
+            array[holes] = array[movers]
+        self.count = end
+
+    def clear(self):
+        self.count = 0
+
+    def frames(self, alpha=0.0):
+        """Frame index of every live particle, alpha steps after the last update."""
+        n = self.count
+        kind = self.kind[:n]
+        last_frame = self.last_frame[kind]
+        progress = np.minimum((self.age[:n] + alpha) / self.lifetime[:n], 1.0)
+        return np.minimum((progress * last_frame + 0.5).astype(np.int32), last_frame)
+
+    def sprites(self, alpha=0.0):
+        """[(surface, (x, y))] to blit, in the format Surface.blits() takes."""
+        n = self.count
+        if n == 0:
+            return []
+        kind = self.kind[:n]
+        frames = self.frames(alpha)
+        position = self.position[:n] + self.velocity[:n] * alpha
+        topleft = (position - self.offsets[kind, frames]).astype(np.int32).tolist()
+        animations = self.animations
+        return [(animations[k][f], (x, y))
+                for k, f, (x, y) in zip(kind.tolist(), frames.tolist(), topleft)]
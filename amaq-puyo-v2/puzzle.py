@@ -0,0 +1,262 @@
+"""Chain puzzle solver: placements of a fixed list of pairs that reach a target chain.
+
+A Puzzle is a starting board, the pairs to place in order, and a target:
+a chain at least that long started by one placement, a total score at
+least that high, or both. A solution is the list of (column, rotation)
+up to the placement that reaches the target; later pairs are not used.
+Placements are simulated with ai.simulate(), so they score like the game.
+
+The search is depth first over every (column, rotation) of each pair:
+- Boards already searched from without a solution are remembered by
+  (pair index, Zobrist key, score) and not searched again.
+- A branch is cut when even clearing every puyo of the board and the
+  remaining pairs cannot reach the target: each chain step clears at least
+  MIN_GROUP_SIZE puyos of one colour, which bounds the chain length and
+  the score (max_chain(), max_score()).
+- With more than one worker the first placements are made here and the
+  branches after them searched in worker processes. Solutions come back
+  through a bounded queue as they are found, so a caller can stop at the
+  first one and nothing waits in memory for a slow reader.
+
+    puzzle = Puzzle(['.GRB..',
+                     'BBGG..',
+                     'GGRRRY'], 'BB YB', chain=3)
+    solver = PuzzleSolver(workers=4)
+    for moves, chain, score in solver.solutions(puzzle):
+        print(moves, chain, score)
+"""
+import multiprocessing
+
+import ai
+import bitboard
+import engine
+
+# Letters of the service types in puzzle boards and pairs
+LETTERS = 'RBYGP'  # CloudTrail, Aurora, EC2, S3, VPC
+MAX_ENTRIES = 1 << 20  # Boards remembered without a solution
+QUEUE_SIZE = 256  # Solutions on their way from the workers at most
+
+_search = None  # The Search of this worker process
+_results = None  # Queue to the main process
+
+
+class Puzzle:
+    """Board rows (top to bottom, '.' for empty), pairs like 'RB GY' (main then sub) and a target."""
+
+    def __init__(self, rows, pairs, chain=0, score=0, name=''):
+        if not chain and not score:
+            raise ValueError("A puzzle needs a target chain or score")
+        board = bitboard.BitBoard(ai.WIDTH, ai.HEIGHT)
+        top = ai.HEIGHT - len(rows)
+        for y, row in enumerate(rows):
+            if len(row) != ai.WIDTH:
+                raise ValueError(f"Board rows must be {ai.WIDTH} cells wide: {row!r}")
+            for x, cell in enumerate(row):
+                if cell != '.':
+                    board.set(x, top + y, LETTERS.index(cell))
+        bitboard.apply_gravity(board)
+        if bitboard.find_group_masks(board):
+            raise ValueError("The board has groups that would clear")
+        self.colors = tuple(board.colors)
+        if isinstance(pairs, str):
+            pairs = [(LETTERS.index(text[0]), LETTERS.index(text[1])) for text in pairs.split()]
+        self.pairs = list(pairs)
+        self.chain = chain
+        self.score = score
+        self.name = name
+
+    def reached(self, chain, score):
+        return chain >= self.chain and score >= self.score
+
+
+def max_chain(counts):
+    """Longest chain that puyos of these counts per colour could make."""
+    return sum(count // engine.MIN_GROUP_SIZE for count in counts)
+
+
+def max_score(counts):
+    """Most points that clearing puyos of these counts per colour could give.
+
+    Every step but the last clears the fewest puyos, the last one the rest,
+    as one chain: group_score() only grows with the chain.
+    """
+    steps = max_chain(counts)
+    if not steps:
+        return 0
+    clearable = sum(count for count in counts if count >= engine.MIN_GROUP_SIZE)
+    score = sum(engine.group_score(engine.MIN_GROUP_SIZE, chain) for chain in range(1, steps))
+    return score + engine.group_score(clearable - engine.MIN_GROUP_SIZE * (steps - 1), steps)
+
+
+class Search:
+    """Depth first search of one puzzle, in one process. prune and memo switch the two speed-ups off for comparison."""
+
+    def __init__(self, puzzle, prune=True, memo=True, max_entries=MAX_ENTRIES):
+        self.puzzle = puzzle
+        self.prune = prune
+        self.memo = memo
+        self.max_entries = max_entries
+        self.table = ai.TranspositionTable()
+        self.dead = set()
+        # Puyos per colour in the pairs from each index on
+        self.remaining = []
+        counts = [0] * engine.NUM_SERVICES
+        for main, sub in reversed(puzzle.pairs):
+            counts[main] += 1
+            counts[sub] += 1
+            self.remaining.append(counts[:])
+        self.remaining.reverse()
+        self.remaining.append([0] * engine.NUM_SERVICES)
+        # Statistics
+        self.nodes = 0
+        self.pruned = 0
+        self.memo_hits = 0
+        self.found = 0
+
+    def children(self, colors, key, index, score):
+        """(action, colors, key, total score, chain) of every placement of pair index that does not lose."""
+        main, sub = self.puzzle.pairs[index]
+        for action in ai.ACTIONS:
+            child, child_key, gained, chain, over = self.table.simulate(colors, key, main, sub, *action)
+            self.nodes += 1
+            if not over:
+                yield action, child, child_key, score + gained, chain
+
+    def hopeless(self, colors, index, score):
+        """True if the pairs from index on cannot reach the target from this board."""
+        puzzle = self.puzzle
+        if index >= len(puzzle.pairs):
+            return True
+        if not self.prune:
+            return False
+        counts = [mask.bit_count() + extra for mask, extra in zip(colors, self.remaining[index])]
+        if max_chain(counts) < puzzle.chain or score + max_score(counts) < puzzle.score:
+            self.pruned += 1
+            return True
+        return False
+
+    def solutions(self, colors, key, index=0, score=0, moves=()):
+        """Solutions (moves, chain, score) that place pairs from index on, after moves."""
+        puzzle = self.puzzle
+        for action, child, child_key, total, chain in self.children(colors, key, index, score):
+            path = moves + (action,)
+            if puzzle.reached(chain, total):
+                self.found += 1
+                yield list(path), chain, total
+                continue
+            if self.hopeless(child, index + 1, total):
+                continue
+            # The score only matters when the target has one
+            entry = (index + 1, child_key, total if puzzle.score else 0)
+            if self.memo and entry in self.dead:
+                self.memo_hits += 1
+                continue
+            found = self.found
+            yield from self.solutions(child, child_key, index + 1, total, path)
+            if self.memo and self.found == found:
+                if len(self.dead) >= self.max_entries:
+                    self.dead.clear()
+                self.dead.add(entry)
+
+
+def _init_worker(puzzle, prune, memo, results):
+    global _search, _results
+    _search = Search(puzzle, prune, memo)
+    _results = results
+
+
+def _search_branch(branch):
+    # Search on from a board the main process reached; solutions go to the queue
+    moves, colors, key, index, score = branch
+    nodes, pruned, memo_hits = _search.nodes, _search.pruned, _search.memo_hits
+    for solution in _search.solutions(colors, key, index, score, tuple(moves)):
+        _results.put(('solution', solution))
+    _results.put(('done', (_search.nodes - nodes, _search.pruned - pruned, _search.memo_hits - memo_hits)))
+
+
+class PuzzleSolver:
+    """Streams the solutions of a Puzzle, from worker processes when workers is more than 1.
+
+    workers defaults to the number of cores. split_depth pairs are
+    placed in this process before the branches go to the workers; by
+    default enough for a few branches per worker.
+    """
+
+    def __init__(self, workers=None, split_depth=None, prune=True, memo=True):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.split_depth = split_depth
+        self.prune = prune
+        self.memo = memo
+        # Statistics of the last solutions() call, up to date once it is done
+        self.nodes = 0
+        self.pruned = 0
+        self.memo_hits = 0
+        self.branches = 0
+
+    def solutions(self, puzzle):
+        """Generator of (moves, chain, score) in no particular order. Stopping early stops the workers."""
+        search = Search(puzzle, self.prune, self.memo)
+        colors = puzzle.colors
+        if self.workers == 1:
+            try:
+                yield from search.solutions(colors, ai.zobrist(colors))
+            finally:
+                self._add(search.nodes, search.pruned, search.memo_hits, reset=True)
+            return
+
+        split_depth = self.split_depth
+        if split_depth is None:
+            split_depth = 1 if len(ai.ACTIONS) >= 4 * self.workers else 2
+        split_depth = min(split_depth, len(puzzle.pairs) - 1)
+        frontier = [((), colors, ai.zobrist(colors), 0)]
+        for index in range(split_depth):
+            next_frontier = []
+            for moves, node_colors, key, score in frontier:
+                for action, child, child_key, total, chain in search.children(node_colors, key, index, score):
+                    path = moves + (action,)
+                    if puzzle.reached(chain, total):
+                        yield list(path), chain, total
+                    elif not search.hopeless(child, index + 1, total):
+                        next_frontier.append((path, child, child_key, total))
+            frontier = next_frontier
+        branches = [(moves, node_colors, key, split_depth, score)
+                    for moves, node_colors, key, score in frontier]
+        self._add(search.nodes, search.pruned, 0, reset=True)
+        self.branches = len(branches)
+        if not branches:
+            return
+
+        results = multiprocessing.Queue(QUEUE_SIZE)
+        pool = multiprocessing.Pool(self.workers, _init_worker, (puzzle, self.prune, self.memo, results))
+        try:
+            pool.map_async(_search_branch, branches, chunksize=1,
+                           error_callback=lambda error: results.put(('error', error)))
+            done = 0
+            while done < len(branches):
+                kind, value = results.get()
+                if kind == 'solution':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    done += 1
+                    self._add(*value)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def first(self, puzzle):
+        """One solution, or None if there is none."""
+        solutions = self.solutions(puzzle)
+        try:
+            return next(solutions, None)
+        finally:
+            solutions.close()
+
+    def _add(self, nodes, pruned, memo_hits, reset=False):
+        if reset:
+            self.nodes = self.pruned = self.memo_hits = 0
+            self.branches = 0
+        self.nodes += nodes
+        self.pruned += pruned
+        self.memo_hits += memo_hits
@@ -0,0 +1,164 @@
+"""Record and play back games as a seed plus the inputs of every tick.
+
+File layout (little endian):
+    header  "PYRP", version, width, height, seed (u64), ticks (u32),
+            score (u32), max_chain (u16), total_cleared (u32)
+    body    runs of identical inputs: input mask (u8) + run length (varint)
+
+Idle ticks are long runs of the same mask, so a game costs a few bytes per
+input rather than per tick. The header keeps the final results, which
+lets a corpus of replays be used as a scoring regression test:
+
+    python replay.py replays/*.pyrp
+"""
+import struct
+import sys
+import time
+
+import engine
+
+MAGIC = b'PYRP'
+VERSION = 1
+HEADER = struct.Struct('<4sBBBQIIHI')
+
+
+class Replay:
+    """A seed, board size, per-tick inputs and the results they led to."""
+
+    def __init__(self, seed, width=engine.GRID_WIDTH, height=engine.GRID_HEIGHT, inputs=None,
+                 score=0, max_chain=0, total_cleared=0):
+        self.seed = seed
+        self.width = width
+        self.height = height
+        self.inputs = inputs if inputs is not None else []
+        self.score = score
+        self.max_chain = max_chain
+        self.total_cleared = total_cleared
+
+
+class ReplayRecorder:
+    """Collects the inputs given to engine.tick() during a game."""
+
+    def __init__(self, state):
+        self.replay = Replay(state.queue.seed, state.board.width, state.board.height)
+
+    def record(self, inputs):
+        self.replay.inputs.append(inputs)
+
+    def truncate(self, ticks):
+        """Forget the inputs after the first ticks, when the game was rewound to that tick."""
+        del self.replay.inputs[ticks:]
+
+    def finish(self, state):
+        self.replay.score = state.score
+        self.replay.max_chain = state.max_chain
+        self.replay.total_cleared = state.total_cleared
+        return self.replay
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def encode(replay):
+    # Negative seeds are stored as the unsigned seed they play as
+    out = bytearray(HEADER.pack(MAGIC, VERSION, replay.width, replay.height, replay.seed & engine.MASK64,
+                                len(replay.inputs), replay.score, replay.max_chain,
+                                replay.total_cleared))
+    inputs = replay.inputs
+    i = 0
+    while i < len(inputs):
+        mask = inputs[i]
+        run = 1
+        while i + run < len(inputs) and inputs[i + run] == mask:
+            run += 1
+        out.append(mask)
+        _write_varint(out, run)
+        i += run
+    return bytes(out)
+
+
+def decode(data):
+    magic, version, width, height, seed, ticks, score, max_chain, total_cleared = \
+        HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a replay file")
+
+    inputs = []
+    pos = HEADER.size
+    while pos < len(data):
+        mask = data[pos]
+        run, pos = _read_varint(data, pos + 1)
+        inputs.extend([mask] * run)
+    if len(inputs) != ticks:
+        raise ValueError("Replay is truncated")
+    return Replay(seed, width, height, inputs, score, max_chain, total_cleared)
+
+
+def save(replay, path):
+    with open(path, 'wb') as f:
+        f.write(encode(replay))
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def play(replay):
+    """Run a replay headless as fast as possible and return the final GameState."""
+    state = engine.new_game(replay.seed, replay.width, replay.height)
+    for inputs in replay.inputs:
+        if state.game_over:
+            break
+        engine.tick(state, inputs)
+    return state
+
+
+def matches(replay, state):
+    return (state.score == replay.score and state.max_chain == replay.max_chain and
+            state.total_cleared == replay.total_cleared)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python replay.py REPLAY...")
+        sys.exit(2)
+
+    failures = 0
+    ticks = 0
+    start = time.perf_counter()
+    for path in sys.argv[1:]:
+        replay = load(path)
+        state = play(replay)
+        ticks += len(replay.inputs)
+        if matches(replay, state):
+            print(f"OK        {path}: score {state.score}, max chain {state.max_chain}")
+        else:
+            failures += 1
+            print(f"MISMATCH  {path}: score {state.score} (recorded {replay.score}), "
+                  f"max chain {state.max_chain} (recorded {replay.max_chain})")
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(sys.argv) - 1} replays, {ticks} ticks in {elapsed:.2f} s "
+          f"({ticks / elapsed:,.0f} ticks/s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
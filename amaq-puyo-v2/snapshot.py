@@ -0,0 +1,156 @@
+"""Compact snapshots of a game and a rewind buffer of them.
+
+The board is packed at 3 bits per cell (0 for empty, service type + 1),
+row by row from the top: 32 bytes for the 6 x 14 board. The pieces,
+score, timers and queue position follow in a fixed struct (STATE), so a
+whole engine.GameState fits in SNAPSHOT_SIZE bytes and comes back exactly,
+random pieces included: the queue is a pure function of seed and index.
+
+Rows are looked up in a table of every possible row rather than packed
+cell by cell, which keeps snapshot() and restore() to a few
+microseconds.
+
+    data = snapshot(game)
+    ...
+    restore(data, game)  # or game = restore(data)
+
+RewindBuffer keeps the last few snapshots in a fixed number of slots,
+so it costs the same however long the game runs.
+"""
+import itertools
+import struct
+
+import engine
+
+CELL_BITS = 3
+NO_PIECE = 255
+# Current piece (main, sub, x, y, rotation), next piece (main, sub), game over,
+# chain count, level, max chain, score, total cleared, ticks, fall and drop
+# timers, queue seed and index
+STATE = struct.Struct('<BBbbBBBBBHHIIIHHQI')
+
+_rows = {}  # (row codes by row tuple, row tuples by code) by board width
+
+
+def _row_tables(width):
+    if width not in _rows:
+        values = (None,) + tuple(range(engine.NUM_SERVICES))
+        codes = {}
+        for row in itertools.product(values, repeat=width):
+            code = 0
+            for service_type in row:
+                code = (code << CELL_BITS) | (0 if service_type is None else service_type + 1)
+            codes[row] = code
+        _rows[width] = (codes, {code: row for row, code in codes.items()})
+    return _rows[width]
+
+
+def board_size(width=engine.GRID_WIDTH, height=engine.GRID_HEIGHT):
+    """Bytes of an encoded board."""
+    return (width * height * CELL_BITS + 7) // 8
+
+
+def encode_board(board):
+    codes = _row_tables(board.width)[0]
+    row_bits = board.width * CELL_BITS
+    code = 0
+    for row in board.cells:
+        code = (code << row_bits) | codes[tuple(row)]
+    return code.to_bytes(board_size(board.width, board.height), 'little')
+
+
+def decode_board(data, board):
+    """Fill an engine.Board of the same size from encode_board() bytes."""
+    rows = _row_tables(board.width)[1]
+    row_bits = board.width * CELL_BITS
+    row_mask = (1 << row_bits) - 1
+    code = int.from_bytes(data, 'little')
+    cells = board.cells
+    for y in range(board.height - 1, -1, -1):
+        cells[y] = list(rows[code & row_mask])
+        code >>= row_bits
+    # Settled boards only: nothing to check for groups, nothing to compact
+    heights = [0] * board.width
+    for y in range(board.height - 1, -1, -1):
+        for x, service_type in enumerate(cells[y]):
+            if service_type is not None:
+                heights[x] = board.height - y
+    board.heights = heights
+    board.dirty = set()
+    board.dirty_columns = set()
+    return board
+
+
+def snapshot(state):
+    """The whole state of a game between ticks, as bytes."""
+    piece = state.current_piece
+    if piece is not None:
+        current = (piece.main_type, piece.sub_type, piece.x, piece.y, piece.rotation)
+    else:
+        current = (NO_PIECE, NO_PIECE, 0, 0, 0)
+    piece = state.next_piece
+    upcoming = (piece.main_type, piece.sub_type) if piece is not None else (NO_PIECE, NO_PIECE)
+    return encode_board(state.board) + STATE.pack(
+        *current, *upcoming, state.game_over, state.chain_count, state.level, state.max_chain,
+        state.score, state.total_cleared, state.ticks, state.fall_timer, state.drop_timer,
+        state.queue.seed & engine.MASK64, state.queue.index)
+
+
+def restore(data, state=None):
+    """Put a snapshot() back into state, or into a new GameState. Returns the state.
+
+    The level curve is a setting rather than game state, so state keeps its own.
+    """
+    if state is None:
+        state = engine.GameState(0)
+    board = state.board
+    size = board_size(board.width, board.height)
+    decode_board(data[:size], board)
+    (main, sub, x, y, rotation, next_main, next_sub, game_over, state.chain_count, state.level,
+     state.max_chain, state.score, state.total_cleared, state.ticks, state.fall_timer,
+     state.drop_timer, state.queue.seed, state.queue.index) = STATE.unpack_from(data, size)
+    state.current_piece = engine.Piece(main, sub, x, y, rotation) if main != NO_PIECE else None
+    state.next_piece = engine.Piece(next_main, next_sub, board.width // 2, 0) if next_main != NO_PIECE else None
+    state.game_over = bool(game_over)
+    # As engine.update_level() left it, on the level curve of state
+    state.fall_speed = state.curve.fall_speed(state.level)
+    return state
+
+
+SNAPSHOT_SIZE = board_size() + STATE.size
+
+
+class RewindBuffer:
+    """The newest capacity snapshots, oldest overwritten first."""
+
+    def __init__(self, capacity):
+        self.slots = [None] * capacity
+        self.newest = -1  # Slot of the newest snapshot
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def push(self, data):
+        self.newest = (self.newest + 1) % len(self.slots)
+        self.slots[self.newest] = data
+        self.count = min(self.count + 1, len(self.slots))
+
+    def peek(self):
+        """The newest snapshot, or None if there is none."""
+        return self.slots[self.newest] if self.count else None
+
+    def pop(self):
+        """Remove and return the newest snapshot, or None if there is none."""
+        if not self.count:
+            return None
+        data = self.slots[self.newest]
+        self.slots[self.newest] = None
+        self.newest = (self.newest - 1) % len(self.slots)
+        self.count -= 1
+        return data
+
+    def clear(self):
+        self.slots = [None] * len(self.slots)
+        self.newest = -1
+        self.count = 0
@@ -0,0 +1,341 @@
+"""Live spectating: what happens in games, fanned out to many TCP clients.
+
+GamePublisher turns a game into frames, tick by tick: the piece moving,
+the next piece, the puyos locked (lock_piece), moved down
+(apply_gravity) and cleared with their chain step and points, the score
+and level, and game over. Every keyframe_ticks ticks it sends a keyframe
+instead, the whole game as a snapshot.py snapshot (73 bytes).
+
+A frame is its length (u16, of what follows), the game id (u16), a kind
+byte and the data of that kind (see the *_DATA structs).
+
+SpectatorServer runs on asyncio. A client connects and sends the game
+ids it wants (none for every game), gets the newest keyframe of each and
+the frames since, then every frame as it comes. publish() and flush()
+never wait for a client: frames go into each client's write buffer, and
+a client whose buffer grows past HIGH_WATER is skipped. Once its buffer
+is down to LOW_WATER it is sent the keyframes again and goes on from
+there; one that stays behind for LAG_TIMEOUT seconds is disconnected.
+The game runs at the same speed whoever is watching.
+
+    server = SpectatorServer()
+    server.start_in_thread('0.0.0.0', 4747)
+    publisher = GamePublisher(game_id=0)
+    # every tick
+    settlement = engine.tick(game, inputs)
+    server.publish_threadsafe(0, *publisher.frames(game, settlement))
+
+Mirror rebuilds a game from the frames on the spectator's side:
+
+    reader, writer = await subscribe('127.0.0.1', 4747)
+    mirrors = {}
+    async for game_id, kind, data in read_frames(reader):
+        mirrors.setdefault(game_id, Mirror()).apply(kind, data)
+"""
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import engine
+import snapshot
+
+# Frame kinds
+KEYFRAME = ord('K')
+PIECE = ord('P')
+NEXT = ord('N')
+LOCK = ord('L')
+FALL = ord('F')
+CLEAR = ord('C')
+SCORE = ord('S')
+OVER = ord('O')
+
+HEADER = struct.Struct('<HHB')  # Length of the rest, game id, kind
+PIECE_DATA = struct.Struct('<BBbbB')  # Main, sub, x, y, rotation
+NEXT_DATA = struct.Struct('<BB')  # Main, sub
+CLEAR_DATA = struct.Struct('<BI')  # Chain step, points; cleared cells (u8 index) follow
+SCORE_DATA = struct.Struct('<IHHI')  # Score, level, max chain, total cleared
+SUBSCRIBE = struct.Struct('<H')  # Number of game ids (u16) that follow
+
+KEYFRAME_TICKS = 120
+HIGH_WATER = 256 * 1024  # Bytes waiting for a client before it is skipped
+LOW_WATER = 16 * 1024    # ... and before it is sent keyframes again
+LAG_TIMEOUT = 5.0        # Seconds a client may stay behind
+SEND_BUFFER = 64 * 1024  # Socket send buffer: a small one lets a slow client show up in the write buffer soon
+
+
+def frame(game_id, kind, data=b''):
+    return HEADER.pack(len(data) + 3, game_id, kind) + data
+
+
+class GamePublisher:
+    """Frames for one game: what changed since the last call."""
+
+    def __init__(self, game_id, keyframe_ticks=KEYFRAME_TICKS):
+        self.game_id = game_id
+        self.keyframe_ticks = keyframe_ticks
+        self.countdown = 0  # Calls until the next keyframe
+        self.piece = None
+        self.next = None
+        self.score = None
+        self.over = False
+
+    def frames(self, state, settlement=None):
+        """(frames as bytes, keyframe) after a tick; settlement is what engine.tick() returned."""
+        if self.countdown <= 0:
+            self.countdown = self.keyframe_ticks
+            self._remember(state)
+            return frame(self.game_id, KEYFRAME, snapshot.snapshot(state)), True
+        self.countdown -= 1
+
+        game_id = self.game_id
+        width = state.board.width
+        frames = []
+        if settlement is not None:
+            frames.append(frame(game_id, LOCK, bytes(
+                value for x, y, service_type in settlement.placed for value in (y * width + x, service_type))))
+            if settlement.falls:
+                frames.append(self._falls(settlement.falls))
+            for step in settlement.steps:
+                cleared = bytes(y * width + x for group in step.groups for y, x in group)
+                frames.append(frame(game_id, CLEAR, CLEAR_DATA.pack(step.chain, step.score) + cleared))
+                if step.falls:
+                    frames.append(self._falls(step.falls))
+            self.piece = None  # Locking took it off; the new one is sent even if it looks the same
+
+        piece = state.current_piece
+        piece = (piece.main_type, piece.sub_type, piece.x, piece.y, piece.rotation) if piece else None
+        if piece != self.piece and piece is not None:
+            frames.append(frame(game_id, PIECE, PIECE_DATA.pack(*piece)))
+        next_piece = state.next_piece
+        next_piece = (next_piece.main_type, next_piece.sub_type) if next_piece else None
+        if next_piece != self.next and next_piece is not None:
+            frames.append(frame(game_id, NEXT, NEXT_DATA.pack(*next_piece)))
+        score = (state.score, state.level, state.max_chain, state.total_cleared)
+        if score != self.score:
+            frames.append(frame(game_id, SCORE, SCORE_DATA.pack(*score)))
+        if state.game_over and not self.over:
+            frames.append(frame(game_id, OVER))
+        self.piece, self.next, self.score, self.over = piece, next_piece, score, state.game_over
+        return b''.join(frames), False
+
+    def _falls(self, falls):
+        return frame(self.game_id, FALL, bytes(value for fall in falls for value in fall))
+
+    def _remember(self, state):
+        piece, next_piece = state.current_piece, state.next_piece
+        self.piece = (piece.main_type, piece.sub_type, piece.x, piece.y, piece.rotation) if piece else None
+        self.next = (next_piece.main_type, next_piece.sub_type) if next_piece else None
+        self.score = (state.score, state.level, state.max_chain, state.total_cleared)
+        self.over = state.game_over
+
+
+class Subscriber:
+    def __init__(self, writer, games):
+        self.writer = writer
+        self.games = games  # Game ids, or None for all
+        self.behind_since = None  # When the client was last skipped, while it is behind
+
+
+class SpectatorServer:
+    """Sends the frames of every game to the clients watching it."""
+
+    def __init__(self):
+        self.server = None
+        self.loop = None
+        self.subscribers = set()
+        self.keyframes = {}  # Newest keyframe by game id
+        self.recent = {}     # Frames since it by game id
+        self.pending = {}    # Frames not flushed yet by game id
+        # Statistics
+        self.bytes_sent = 0
+        self.resyncs = 0
+        self.dropped = 0
+
+    async def start(self, host='0.0.0.0', port=4747):
+        self.loop = asyncio.get_running_loop()
+        self.server = await asyncio.start_server(self._connected, host, port)
+        return self.server
+
+    def start_in_thread(self, host='0.0.0.0', port=4747):
+        """Run the server on an event loop in a daemon thread, for a game that is not asyncio."""
+        started = threading.Event()
+        error = []  # What start() raised, such as the port being in use
+
+        def run():
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(self.start(host, port))
+            except Exception as e:
+                error.append(e)
+                loop.close()
+                return
+            finally:
+                started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        if error:
+            raise error[0]
+
+    def publish(self, game_id, data, keyframe=False):
+        """Queue frames of one game; they go out on the next flush()."""
+        if keyframe:
+            self.keyframes[game_id] = data
+            self.recent[game_id] = []
+        else:
+            self.recent.setdefault(game_id, []).append(data)
+        self.pending.setdefault(game_id, []).append(data)
+
+    def publish_threadsafe(self, game_id, data, keyframe=False):
+        """publish() and flush() from another thread."""
+        self.loop.call_soon_threadsafe(self._publish_and_flush, game_id, data, keyframe)
+
+    def _publish_and_flush(self, game_id, data, keyframe):
+        self.publish(game_id, data, keyframe)
+        self.flush()
+
+    def flush(self):
+        """Write the queued frames to every client that keeps up."""
+        pending = self.pending
+        if not pending:
+            return
+        batches = {game_id: b''.join(frames) for game_id, frames in pending.items()}
+        everything = None
+        now = time.monotonic()
+        for subscriber in list(self.subscribers):
+            transport = subscriber.writer.transport
+            if transport.is_closing():
+                self.subscribers.discard(subscriber)
+                continue
+            if subscriber.behind_since is not None:
+                if transport.get_write_buffer_size() <= LOW_WATER:
+                    self.resyncs += 1
+                    self._resync(subscriber)
+                elif now - subscriber.behind_since > LAG_TIMEOUT:
+                    self.dropped += 1
+                    self.subscribers.discard(subscriber)
+                    transport.abort()
+                continue
+            if subscriber.games is None:
+                if everything is None:
+                    everything = b''.join(batches.values())
+                data = everything
+            else:
+                data = b''.join(batches[game_id] for game_id in subscriber.games if game_id in batches)
+            if data:
+                subscriber.writer.write(data)
+                self.bytes_sent += len(data)
+            if transport.get_write_buffer_size() > HIGH_WATER:
+                subscriber.behind_since = now
+        self.pending = {}
+
+    def _resync(self, subscriber):
+        # The newest keyframe and the frames since, for every game the client watches
+        games = self.keyframes if subscriber.games is None else subscriber.games
+        data = b''.join(self.keyframes[game_id] + b''.join(self.recent[game_id])
+                        for game_id in games if game_id in self.keyframes)
+        subscriber.writer.write(data)
+        self.bytes_sent += len(data)
+        subscriber.behind_since = None
+
+    async def _connected(self, reader, writer):
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER)
+        try:
+            count, = SUBSCRIBE.unpack(await reader.readexactly(SUBSCRIBE.size))
+            ids = struct.unpack(f'<{count}H', await reader.readexactly(2 * count))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        subscriber = Subscriber(writer, set(ids) if ids else None)
+        self._resync(subscriber)
+        self.subscribers.add(subscriber)
+        try:
+            # Nothing more is expected; wait for the client to go
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        self.subscribers.discard(subscriber)
+        writer.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        for subscriber in self.subscribers:
+            subscriber.writer.transport.abort()
+        self.subscribers.clear()
+
+
+async def subscribe(host, port, games=(), **connection):
+    """Connect to a SpectatorServer and ask for games (all of them if none). Returns (reader, writer).
+
+    connection is passed on to asyncio.open_connection(), such as sock
+    for a socket already connected (host and port None).
+    """
+    reader, writer = await asyncio.open_connection(host, port, **connection)
+    writer.write(SUBSCRIBE.pack(len(games)) + struct.pack(f'<{len(games)}H', *games))
+    await writer.drain()
+    return reader, writer
+
+
+async def read_frames(reader):
+    """(game id, kind, data) of every frame until the connection closes."""
+    while True:
+        try:
+            length_data = await reader.readexactly(2)
+            body = await reader.readexactly(int.from_bytes(length_data, 'little'))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return
+        yield int.from_bytes(body[:2], 'little'), body[2], body[3:]
+
+
+class Mirror:
+    """One game as a spectator sees it, rebuilt from its frames. state is None until the first keyframe."""
+
+    def __init__(self):
+        self.state = None
+        self.last_clear = None  # (chain step, points, cells) of the newest clear
+
+    def apply(self, kind, data):
+        if kind == KEYFRAME:
+            self.state = snapshot.restore(data, self.state)
+            return
+        state = self.state
+        if state is None:
+            return  # Waiting for a keyframe
+        board = state.board
+        cells = board.cells
+        width = board.width
+        if kind == PIECE:
+            main, sub, x, y, rotation = PIECE_DATA.unpack(data)
+            state.current_piece = engine.Piece(main, sub, x, y, rotation)
+        elif kind == NEXT:
+            state.next_piece = engine.Piece(*NEXT_DATA.unpack(data), width // 2, 0)
+        elif kind == LOCK:
+            for i in range(0, len(data), 2):
+                y, x = divmod(data[i], width)
+                cells[y][x] = data[i + 1]
+            state.current_piece = None
+        elif kind == FALL:
+            for i in range(0, len(data), 3):
+                x, from_y, to_y = data[i], data[i + 1], data[i + 2]
+                cells[to_y][x] = cells[from_y][x]
+                cells[from_y][x] = None
+        elif kind == CLEAR:
+            chain, points = CLEAR_DATA.unpack_from(data)
+            cleared = [divmod(index, width) for index in data[CLEAR_DATA.size:]]
+            for y, x in cleared:
+                cells[y][x] = None
+            self.last_clear = (chain, points, cleared)
+        elif kind == SCORE:
+            state.score, state.level, state.max_chain, state.total_cleared = SCORE_DATA.unpack(data)
+        elif kind == OVER:
+            state.game_over = True
+        if kind in (LOCK, FALL, CLEAR):
+            board.refresh()
@@ -0,0 +1,71 @@
+"""Cache of rendered text surfaces.
+
+Labels are drawn every frame but rarely change. TextCache rasterises each
+(font, text, color, outline, scale) once, with the outline composited into
+the same surface, and keeps the most recently used surfaces. Scales are
+rounded to SCALE_STEP so pulsing text reuses a few sizes.
+"""
+from collections import OrderedDict
+
+import pygame
+
+SCALE_STEP = 0.02
+MAX_ENTRIES = 256
+
+
+def render_text(font, text, color, outline_color=None, outline_size=0, scale=1.0):
+    """Render text, optionally scaled and outlined, into one surface.
+
+    The outline adds outline_size pixels on each side, so the text stays
+    centered when the surface is positioned by its center.
+    """
+    text_surface = font.render(text, True, color)
+    if scale != 1.0:
+        size = (int(text_surface.get_width() * scale), int(text_surface.get_height() * scale))
+        text_surface = pygame.transform.scale(text_surface, size)
+    if outline_color is None or outline_size <= 0:
+        return text_surface
+
+    outline_surface = font.render(text, True, outline_color)
+    if scale != 1.0:
+        outline_surface = pygame.transform.scale(outline_surface, text_surface.get_size())
+    width, height = text_surface.get_size()
+    surface = pygame.Surface((width + outline_size * 2, height + outline_size * 2), pygame.SRCALPHA)
+    # Transparent outline color, so antialiased edges blend towards the outline and not black
+    surface.fill(tuple(outline_color[:3]) + (0,))
+    for dx in range(-outline_size, outline_size + 1):
+        for dy in range(-outline_size, outline_size + 1):
+            if dx != 0 or dy != 0:
+                surface.blit(outline_surface, (outline_size + dx, outline_size + dy))
+    surface.blit(text_surface, (outline_size, outline_size))
+    return surface
+
+
+class TextCache:
+    """Least recently used cache of render_text() results."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, color, outline_color=None, outline_size=0, scale=1.0):
+        scale_bucket = round(scale / SCALE_STEP)
+        key = (font, text, color, outline_color, outline_size, scale_bucket)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = render_text(font, text, color, outline_color, outline_size,
+                              scale_bucket * SCALE_STEP)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.entries.clear()
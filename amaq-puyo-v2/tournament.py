@@ -0,0 +1,308 @@
+"""Self-play tournament: many seeded headless games per AI policy, on every core.
+
+Each game is played tick by tick with engine.tick(), the AI steering its
+pieces with ai.Autopilot, so the fall speed and level curve decide how
+long it survives. Every policy plays the same seeds, so they can be
+compared game for game. Chains resolve within the tick they start in,
+so survival time is the time spent moving pieces.
+
+Results go to a directory with one file per column (COLUMNS), appended
+as the games finish, and run.json with the settings. The files are
+flushed every few seconds. A run that stops for any reason continues
+where it left off when it is started again with the same directory and
+settings; a partly written last row is dropped.
+
+    python tournament.py OUT_DIR [--games N] [--policy beam --policy random:input_interval=8]
+                         [--workers N] [--points-per-level 1000] [--initial-fall-speed 0.5]
+                         [--fall-speed-step 0.05] [--min-fall-speed 0.1] [--max-minutes 10]
+    python tournament.py OUT_DIR --summary
+
+Policies are random, greedy (one pair ahead) and beam (two pairs ahead),
+optionally followed by :name=value,... for the ai.BeamSearch or
+ai.Autopilot settings, such as beam:depth=3,beam_width=16.
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import signal
+import time
+
+import numpy as np
+
+import ai
+import engine
+
+# Column name and numpy type of each value stored per game
+COLUMNS = [
+    ('policy', np.int16),        # Index into the run's policy list
+    ('seed', np.int64),
+    ('score', np.int64),
+    ('max_chain', np.int32),
+    ('total_cleared', np.int32),
+    ('ticks', np.int64),         # Survival time in engine ticks
+    ('game_over', np.int8),      # 0 if the game reached the time limit
+]
+# Per game values the summary reports, with how to show them
+SUMMARY_COLUMNS = [('score', 'score'), ('max_chain', 'max chain'),
+                   ('total_cleared', 'cleared'), ('seconds', 'survival s')]
+CURVE_SETTINGS = ['points_per_level', 'initial_fall_speed', 'fall_speed_step', 'min_fall_speed']
+SEARCH_SETTINGS = {'greedy': {'depth': 1}, 'beam': {'depth': 2}}
+PILOT_SETTINGS = ('input_interval', 'fast_drop')
+FLUSH_SECONDS = 5.0
+Z_95 = 1.96
+
+_policies = None  # The parsed policies of this worker process
+_curve = None  # The engine.LevelCurve of the run
+_max_ticks = 0
+
+
+def parse_policy(spec):
+    """(name, BeamSearch settings, Autopilot settings) of 'name[:key=value,...]'."""
+    name, _, options = spec.partition(':')
+    if name not in ('random', 'greedy', 'beam'):
+        raise ValueError(f"Unknown policy {name!r}")
+    search = dict(SEARCH_SETTINGS.get(name, {}))
+    pilot = {}
+    for option in filter(None, options.split(',')):
+        key, _, value = option.partition('=')
+        if key in PILOT_SETTINGS:
+            pilot[key] = int(value)
+        elif key in ('depth', 'beam_width') and name != 'random':
+            search[key] = int(value)
+        else:
+            raise ValueError(f"Unknown setting {key!r} for policy {name!r}")
+    return name, search, pilot
+
+
+def _init_worker(settings):
+    global _policies, _curve, _max_ticks
+    # Ctrl+C is for the main process, which stops the workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _curve = engine.LevelCurve(**{name: settings[name] for name in CURVE_SETTINGS})
+    _max_ticks = round(settings['max_minutes'] * 60 * engine.TICK_RATE)
+    _policies = []
+    for spec in settings['policies']:
+        name, search, pilot = parse_policy(spec)
+        # No time budget, so the same seed always gives the same game
+        searcher = ai.BeamSearch(time_budget=math.inf, **search) if name != 'random' else None
+        _policies.append((searcher, pilot))
+
+
+def play_game(task):
+    """Play one game of (policy index, seed). Returns a row of COLUMNS."""
+    policy, seed = task
+    searcher, pilot_settings = _policies[policy]
+    if searcher is None:
+        rng = random.Random(seed)
+        choose = lambda state: rng.choice(ai.ACTIONS)
+    else:
+        choose = searcher.best_move
+    pilot = ai.Autopilot(choose, **pilot_settings)
+    state = engine.new_game(seed, curve=_curve)
+    while not state.game_over and state.ticks < _max_ticks:
+        engine.tick(state, pilot.inputs(state))
+    return (policy, seed, state.score, state.max_chain, state.total_cleared,
+            state.ticks, int(state.game_over))
+
+
+class ResultFiles:
+    """The column files of a run directory, appended to a batch of rows at a time."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = None
+
+    def path(self, name):
+        return os.path.join(self.directory, name + '.bin')
+
+    def rows(self):
+        """Complete rows on disk; longer column files are cut back to that."""
+        sizes = []
+        for name, dtype in COLUMNS:
+            path = self.path(name)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            sizes.append(size // np.dtype(dtype).itemsize)
+        rows = min(sizes)
+        for name, dtype in COLUMNS:
+            if os.path.exists(self.path(name)):
+                os.truncate(self.path(name), rows * np.dtype(dtype).itemsize)
+        return rows
+
+    def load(self):
+        """Every column as a numpy array."""
+        rows = self.rows()
+        if not rows:
+            return {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS}
+        return {name: np.fromfile(self.path(name), dtype=dtype, count=rows) for name, dtype in COLUMNS}
+
+    def append(self, rows):
+        if self.files is None:
+            self.files = [open(self.path(name), 'ab') for name, _ in COLUMNS]
+        for (_, dtype), values, file in zip(COLUMNS, zip(*rows), self.files):
+            np.asarray(values, dtype=dtype).tofile(file)
+        for file in self.files:
+            file.flush()
+            os.fsync(file.fileno())
+
+    def close(self):
+        if self.files is not None:
+            for file in self.files:
+                file.close()
+            self.files = None
+
+
+def open_run(directory, settings):
+    """Settings and ResultFiles of a run, new or continued. Settings must match a continued run."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, 'run.json')
+    if os.path.exists(path):
+        with open(path) as file:
+            saved = json.load(file)
+        if settings is not None and saved != settings:
+            changed = sorted(key for key in set(saved) | set(settings) if saved.get(key) != settings.get(key))
+            raise SystemExit(f"{directory} holds a run with other settings ({', '.join(changed)}); "
+                             "use another directory")
+        settings = saved
+    elif settings is None:
+        raise SystemExit(f"No run in {directory}")
+    else:
+        with open(path, 'w') as file:
+            json.dump(settings, file, indent=2)
+    return settings, ResultFiles(directory)
+
+
+def run(directory, settings, workers=None, chunk_size=4):
+    settings, results = open_run(directory, settings)
+    columns = results.load()
+    done = set(zip(columns['policy'].tolist(), columns['seed'].tolist()))
+    # Seeds outermost, so a partial run has every policy on the same seeds
+    tasks = [(policy, seed)
+             for seed in range(settings['seed'], settings['seed'] + settings['games'])
+             for policy in range(len(settings['policies']))
+             if (policy, seed) not in done]
+    total = settings['games'] * len(settings['policies'])
+    if done:
+        print(f"Continuing: {len(done)} of {total} games already played")
+
+    pending = []
+    played = 0
+    start = last_flush = time.perf_counter()
+    pool = multiprocessing.Pool(workers, _init_worker, (settings,))
+    try:
+        for row in pool.imap_unordered(play_game, tasks, chunk_size):
+            pending.append(row)
+            played += 1
+            now = time.perf_counter()
+            if now - last_flush >= FLUSH_SECONDS:
+                results.append(pending)
+                pending = []
+                last_flush = now
+                rate = played / (now - start)
+                print(f"{len(done) + played}/{total} games, {rate:.1f} games/s", flush=True)
+    except KeyboardInterrupt:
+        print("Stopped; run again with the same arguments to continue")
+    finally:
+        # A second Ctrl+C must not cut the last rows short
+        handler = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        pool.terminate()
+        pool.join()
+        if pending:
+            results.append(pending)
+        results.close()
+        signal.signal(signal.SIGINT, handler)
+    elapsed = time.perf_counter() - start
+    if played:
+        print(f"Played {played} games in {elapsed:.1f} s ({played / elapsed:.1f} games/s)")
+    return settings, results
+
+
+def mean_interval(values):
+    """(mean, half width of the 95% confidence interval) by the normal approximation."""
+    n = len(values)
+    if n == 0:
+        return math.nan, math.nan
+    mean = float(values.mean())
+    if n < 2:
+        return mean, math.nan
+    return mean, Z_95 * float(values.std(ddof=1)) / math.sqrt(n)
+
+
+def summarize(settings, results):
+    columns = results.load()
+    columns['seconds'] = columns['ticks'] / engine.TICK_RATE
+    policies = settings['policies']
+    print(f"Curve: level = 1 + score // {settings['points_per_level']}, "
+          f"fall_speed = max({settings['min_fall_speed']}, {settings['initial_fall_speed']} "
+          f"- (level - 1) * {settings['fall_speed_step']}); games end after {settings['max_minutes']} minutes")
+    print(f"{'policy':24}{'games':>8}" + ''.join(f"{label:>22}" for _, label in SUMMARY_COLUMNS)
+          + f"{'game over':>11}")
+    for index, spec in enumerate(policies):
+        rows = columns['policy'] == index
+        line = f"{spec:24}{int(rows.sum()):>8}"
+        for name, _ in SUMMARY_COLUMNS:
+            mean, half = mean_interval(columns[name][rows])
+            line += f"{f'{mean:.1f} ± {half:.1f}':>22}"
+        line += f"{columns['game_over'][rows].mean() if rows.any() else math.nan:>10.1%}"
+        print(line)
+
+    # Paired differences on the seeds both policies finished
+    if len(policies) > 1:
+        base = columns['policy'] == 0
+        for index, spec in enumerate(policies[1:], 1):
+            other = columns['policy'] == index
+            seeds = np.intersect1d(columns['seed'][base], columns['seed'][other])
+            if not len(seeds):
+                continue
+            line = f"{spec + ' - ' + policies[0]:32}"
+            for name, _ in SUMMARY_COLUMNS:
+                a = _by_seed(columns, base, name, seeds)
+                b = _by_seed(columns, other, name, seeds)
+                mean, half = mean_interval(b - a)
+                line += f"{f'{mean:+.1f} ± {half:.1f}':>22}"
+            print(line + f"  ({len(seeds)} seeds)")
+
+
+def _by_seed(columns, rows, name, seeds):
+    order = np.argsort(columns['seed'][rows])
+    seed_values = columns['seed'][rows][order]
+    return columns[name][rows][order][np.searchsorted(seed_values, seeds)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Self-play tournament of AI policies')
+    parser.add_argument('directory', help='Run directory: column files and run.json')
+    parser.add_argument('--summary', action='store_true', help='Only print the summary of the run')
+    parser.add_argument('--policy', action='append', dest='policies', metavar='SPEC',
+                        help='random, greedy or beam[:key=value,...]; repeat to compare (default: beam)')
+    parser.add_argument('--games', type=int, default=1000, help='Games per policy')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the first game')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: number of cores)')
+    parser.add_argument('--chunk-size', type=int, default=4, help='Games handed to a worker at once')
+    parser.add_argument('--max-minutes', type=float, default=10.0, help='Game time after which a game stops')
+    parser.add_argument('--points-per-level', type=int, default=engine.POINTS_PER_LEVEL)
+    parser.add_argument('--initial-fall-speed', type=float, default=engine.INITIAL_FALL_SPEED)
+    parser.add_argument('--fall-speed-step', type=float, default=engine.FALL_SPEED_STEP)
+    parser.add_argument('--min-fall-speed', type=float, default=engine.MIN_FALL_SPEED)
+    args = parser.parse_args()
+
+    if args.summary:
+        settings, results = open_run(args.directory, None)
+    else:
+        settings = {'policies': args.policies or ['beam'], 'games': args.games, 'seed': args.seed,
+                    'max_minutes': args.max_minutes}
+        for name in CURVE_SETTINGS:
+            settings[name] = getattr(args, name)
+        try:
+            for spec in settings['policies']:
+                parse_policy(spec)
+        except ValueError as error:
+            parser.error(str(error))
+        settings, results = run(args.directory, settings, args.workers, args.chunk_size)
+    summarize(settings, results)
+
+
+if __name__ == '__main__':
+    main()
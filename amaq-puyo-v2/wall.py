@@ -0,0 +1,206 @@
+"""Many live boards in one window, for spectating and AI showcases.
+
+BoardWall tiles count boards over a surface, at the largest cell size
+that fits. The board chrome (background, grid and outline) is rendered
+once at that size and every puyo is the atlas's scaled sprite, so all
+boards share the same few surfaces. Each board remembers what it shows:
+a frame compares the rows of every board with it and redraws only the
+cells that changed (the cell's chrome, then its puyo), plus the score
+label when the score changed. draw() returns one dirty rect per board
+that changed, for pygame.display.update().
+
+    wall = BoardWall(screen, atlas, 16, small_font, text_cache)
+    # every frame; a state may be None while a game has not started
+    pygame.display.update(wall.draw(states))
+"""
+import math
+
+import pygame
+
+from engine import GRID_WIDTH, GRID_HEIGHT
+
+GAP = 6  # Pixels between boards
+MIN_CELL = 2
+BACKGROUND_COLOR = (240, 240, 240)
+BOARD_COLOR = (255, 255, 255)
+GRID_COLOR = (200, 200, 200)
+OUTLINE_COLOR = (0, 0, 0)
+LABEL_COLOR = (0, 0, 0)
+OVER_SHADE = (128, 128, 128, 160)
+
+
+def layout(size, count, label_height=0):
+    """(columns, cell size) that fit count boards into size with the largest cells."""
+    width, height = size
+    best = None
+    for columns in range(1, count + 1):
+        rows = math.ceil(count / columns)
+        cell = min((width // columns - GAP) // GRID_WIDTH,
+                   (height // rows - GAP - label_height) // GRID_HEIGHT)
+        if cell >= MIN_CELL and (best is None or cell > best[1]):
+            best = (columns, cell)
+    if best is None:
+        raise ValueError(f"{count} boards do not fit in {width}x{height}")
+    return best
+
+
+class BoardView:
+    """What one board of the wall shows, to tell what changed."""
+
+    def __init__(self, rect, board_rect):
+        self.rect = rect              # The board and its label
+        self.board_rect = board_rect  # The cells
+        self.rows = None    # Cell rows drawn, None before the first draw
+        self.piece = {}     # Falling piece cells drawn, (x, y): service type
+        self.score = None
+        self.over = False
+
+
+class BoardWall:
+    """count boards tiled over surface, redrawn cell by cell."""
+
+    def __init__(self, surface, atlas, count, font=None, text_cache=None):
+        self.surface = surface
+        self.atlas = atlas
+        self.font = font
+        self.text_cache = text_cache
+        self.label_height = font.get_linesize() if font is not None else 0
+        self.columns, self.cell = layout(surface.get_size(), count, self.label_height)
+        cell = self.cell
+        board_size = (GRID_WIDTH * cell, GRID_HEIGHT * cell)
+        # Centered on the surface
+        rows = math.ceil(count / self.columns)
+        margin_x = (surface.get_width() - self.columns * (board_size[0] + GAP)) // 2
+        margin_y = (surface.get_height() - rows * (board_size[1] + self.label_height + GAP)) // 2
+        self.views = []
+        for i in range(count):
+            row, column = divmod(i, self.columns)
+            left = margin_x + GAP // 2 + column * (board_size[0] + GAP)
+            top = margin_y + GAP // 2 + row * (board_size[1] + self.label_height + GAP)
+            rect = pygame.Rect(left, top, board_size[0], board_size[1] + self.label_height)
+            board_rect = pygame.Rect(left, top + self.label_height, *board_size)
+            self.views.append(BoardView(rect, board_rect))
+
+        # The chrome of an empty board, shared by all of them
+        self.chrome = pygame.Surface(board_size).convert()
+        self.chrome.fill(BOARD_COLOR)
+        for y in range(GRID_HEIGHT):
+            for x in range(GRID_WIDTH):
+                pygame.draw.rect(self.chrome, GRID_COLOR, (x * cell, y * cell, cell, cell), 1)
+        pygame.draw.rect(self.chrome, OUTLINE_COLOR, self.chrome.get_rect(), 1)
+        self.shade = pygame.Surface(board_size, pygame.SRCALPHA)
+        self.shade.fill(OVER_SHADE)
+        self.sprites = [atlas.scaled_sprite(service_type, cell) for service_type in range(len(atlas.images))]
+        self.full_redraw = True
+        # Statistics
+        self.cells_drawn = 0
+
+    def invalidate(self):
+        """Draw everything again on the next draw()."""
+        self.full_redraw = True
+
+    def draw(self, states):
+        """Bring the boards up to date with states (one per board, or None). Returns the dirty rects."""
+        if self.full_redraw:
+            self.full_redraw = False
+            self.surface.fill(BACKGROUND_COLOR)
+            for view in self.views:
+                view.rows = None
+                view.score = None
+            for view, state in zip(self.views, states):
+                self._draw_board(view, state)
+            return [self.surface.get_rect()]
+
+        dirty = []
+        for view, state in zip(self.views, states):
+            if self._update_board(view, state):
+                dirty.append(view.rect)
+        return dirty
+
+    def _update_board(self, view, state):
+        # Redraw what changed on one board; True if anything did
+        if state is None:
+            if view.rows is None:
+                return False
+            self._draw_board(view, None)
+            return True
+        if view.rows is None or state.game_over != view.over or (view.over and state.board.cells != view.rows):
+            # New, ended or, once ended, changed under the shade
+            self._draw_board(view, state)
+            return True
+
+        changed = set()
+        shown = view.rows
+        for y, row in enumerate(state.board.cells):
+            if row != shown[y]:
+                old = shown[y]
+                changed.update((x, y) for x in range(GRID_WIDTH) if row[x] != old[x])
+                shown[y] = row[:]
+        piece = self._piece_cells(state)
+        if piece != view.piece:
+            changed.update(view.piece)
+            changed.update(piece)
+            view.piece = piece
+        for x, y in changed:
+            self._draw_cell(view, x, y, piece.get((x, y), shown[y][x]))
+        label = self._draw_label(view, state)
+        return bool(changed) or label
+
+    def _draw_board(self, view, state):
+        surface = self.surface
+        surface.fill(BACKGROUND_COLOR, view.rect)
+        surface.blit(self.chrome, view.board_rect)
+        if state is None:
+            view.rows = None
+            view.piece = {}
+            view.score = None
+            view.over = False
+            return
+        view.rows = [row[:] for row in state.board.cells]
+        view.piece = self._piece_cells(state)
+        view.over = state.game_over
+        view.score = None
+        cell = self.cell
+        left, top = view.board_rect.topleft
+        for y, row in enumerate(view.rows):
+            for x, service_type in enumerate(row):
+                service_type = view.piece.get((x, y), service_type)
+                if service_type is not None:
+                    surface.blit(self.sprites[service_type], (left + x * cell, top + y * cell))
+                    self.cells_drawn += 1
+        if view.over:
+            surface.blit(self.shade, view.board_rect)
+        self._draw_label(view, state)
+
+    def _draw_cell(self, view, x, y, service_type):
+        cell = self.cell
+        position = (view.board_rect.left + x * cell, view.board_rect.top + y * cell)
+        area = pygame.Rect(x * cell, y * cell, cell, cell)
+        self.surface.blit(self.chrome, position, area)
+        if service_type is not None:
+            self.surface.blit(self.sprites[service_type], position)
+        self.cells_drawn += 1
+
+    def _draw_label(self, view, state):
+        # The score above the board; each character is cached on its own
+        if self.font is None or state.score == view.score:
+            return False
+        view.score = state.score
+        label_rect = pygame.Rect(view.rect.left, view.rect.top, view.rect.width, self.label_height)
+        self.surface.fill(BACKGROUND_COLOR, label_rect)
+        x = label_rect.left
+        for char in str(state.score):
+            if self.text_cache is not None:
+                char_surface = self.text_cache.render(self.font, char, LABEL_COLOR)
+            else:
+                char_surface = self.font.render(char, True, LABEL_COLOR)
+            self.surface.blit(char_surface, (x, label_rect.top))
+            x += char_surface.get_width()
+        return True
+
+    def _piece_cells(self, state):
+        piece = state.current_piece
+        if piece is None or state.game_over:
+            return {}
+        return {(x, y): service_type for x, y, service_type in piece.cells()
+                if 0 <= y < GRID_HEIGHT and 0 <= x < GRID_WIDTH}
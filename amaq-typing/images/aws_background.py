@@ -1,6 +1,7 @@
 import pygame
 import random
 import math
+from images.text_cache import TextCache
 
 # AWS color scheme
 AWS_ORANGE = (255, 153, 0)
@@ -10,6 +11,9 @@ AWS_LIGHT_BLUE = (0, 160, 210)
 AWS_LIGHT_GRAY = (240, 240, 240)
 WHITE = (255, 255, 255)
 
+# Labels are drawn every frame; render each one once
+text_cache = TextCache()
+
 def create_aws_background(width, height):
     """Create an AWS-themed background surface"""
     # Create the base surface with dark blue color
@@ -51,7 +55,7 @@ def draw_aws_button(surface, text, font, x, y, width, height, active=False):
     pygame.draw.rect(surface, color, button_rect, border_radius=5)
     
     # Draw button text
-    text_surf = font.render(text, True, WHITE)
+    text_surf = text_cache.render(font, text, WHITE)
     text_rect = text_surf.get_rect(center=(x, y))
     surface.blit(text_surf, text_rect)
     
@@ -60,7 +64,7 @@ def draw_aws_button(surface, text, font, x, y, width, height, active=False):
 def draw_aws_title(surface, text, font, x, y, color=AWS_ORANGE):
     """Draw an AWS-style title with orange underline"""
     # Draw the main text
-    text_surf = font.render(text, True, WHITE)
+    text_surf = text_cache.render(font, text, WHITE)
     text_rect = text_surf.get_rect(center=(x, y))
     surface.blit(text_surf, text_rect)
     
@@ -85,9 +89,9 @@ def draw_aws_text_box(surface, text, font, x, y, width, height, bg_color=AWS_LIG
     
     for word in words[1:]:
         test_line = current_line + ' ' + word
-        test_surf = font.render(test_line, True, text_color)
         
-        if test_surf.get_width() < width - 20:  # 20px padding
+        # Measure without rendering
+        if font.size(test_line)[0] < width - 20:  # 20px padding
             current_line = test_line
         else:
             lines.append(current_line)
@@ -103,7 +107,7 @@ def draw_aws_text_box(surface, text, font, x, y, width, height, bg_color=AWS_LIG
         start_y = y - (total_text_height // 2) + (line_height // 2)
         
         for i, line in enumerate(lines):
-            text_surf = font.render(line, True, text_color)
+            text_surf = text_cache.render(font, line, text_color)
             text_rect = text_surf.get_rect(center=(x, start_y + i * line_height))
             surface.blit(text_surf, text_rect)
     